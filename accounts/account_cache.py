@@ -0,0 +1,250 @@
+# accounts/account_cache.py
+"""
+Two-tier cache for per-user account rows (profile, credits, OTP state).
+
+    L1  bounded LRU + TTL dict in each process (cachetools.TTLCache)
+    L2  a Django cache alias shared by all workers (ACCOUNT_CACHE_ALIAS;
+        LocMemCache stands in locally, Redis/Memcached in production)
+
+A read tries L1, then L2, then runs the loader once (see below) and fills
+both tiers. A missing row is cached as None like any other value.
+
+Invalidation: the post_save/post_delete receivers in accounts.signals call
+invalidate() for UserProfile, UserCredits and UserOTP changes, and the
+queryset UPDATEs in accounts.credits / accounts.metering (which send no
+signals) call it directly. The key is deleted from the local L1 and from
+L2 right away and once more after the transaction commits, so a reader
+that loaded the old row while the write was in flight can't leave it
+cached. Other processes' L1 copies age out within ACCOUNT_CACHE_L1_TTL_SECONDS,
+which bounds cross-worker staleness.
+
+Stampede protection: concurrent misses for a key in one process wait for
+the first loader (single flight); across processes the first miss takes a
+short lease in L2 (cache.add) and the others poll L2 for its result before
+falling back to loading themselves.
+
+stats() reports L1/L2 hits, misses, loads, evictions and coalesced waits.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict
+
+from cachetools import TTLCache
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import UserCredits, UserOTP, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Stored for "looked up, not there", so a missing row is a cache hit too
+_MISSING = "__accounts_cache_missing__"
+
+
+class _L1(TTLCache):
+    def __init__(self, maxsize, ttl, stats):
+        super().__init__(maxsize, ttl)
+        self._stats = stats
+
+    def popitem(self):
+        # Only called when the cache is full: a capacity eviction
+        item = super().popitem()
+        self._stats["evictions"] += 1
+        return item
+
+
+class TieredCache:
+    def __init__(self, alias: str = "default", prefix: str = "accounts:tiered", l1_maxsize: int = 10000,
+                 l1_ttl: float = 5.0, l2_ttl: int = 300, lease_seconds: float = 2.0, wait_seconds: float = 0.5):
+        self.alias = alias
+        self.prefix = prefix
+        self.l2_ttl = l2_ttl
+        self.lease_seconds = lease_seconds
+        self.wait_seconds = wait_seconds
+        self._stats = Counter()
+        self._l1 = _L1(l1_maxsize, l1_ttl, self._stats) if l1_maxsize else None
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Event] = {}
+
+    @property
+    def l2(self):
+        return caches[self.alias]
+
+    def _key(self, key) -> str:
+        return f"{self.prefix}:{key}"
+
+    def _get_l1(self, key):
+        if self._l1 is None:
+            return None
+        with self._lock:
+            return self._l1.get(key)
+
+    def _set_l1(self, key, stored):
+        if self._l1 is not None:
+            with self._lock:
+                self._l1[key] = stored
+
+    def _lookup(self, key):
+        """Stored value from L1 or L2 (counting the hit), or None"""
+        stored = self._get_l1(key)
+        if stored is not None:
+            self._stats["l1_hits"] += 1
+            return stored
+        stored = self.l2.get(self._key(key))
+        if stored is not None:
+            self._stats["l2_hits"] += 1
+            self._set_l1(key, stored)
+        return stored
+
+    def get(self, key, default=None):
+        stored = self._lookup(key)
+        if stored is None:
+            self._stats["misses"] += 1
+            return default
+        return None if stored == _MISSING else stored
+
+    def set(self, key, value):
+        stored = _MISSING if value is None else value
+        self.l2.set(self._key(key), stored, self.l2_ttl)
+        self._set_l1(key, stored)
+
+    def get_or_load(self, key, loader: Callable[[], object]):
+        stored = self._lookup(key)
+        if stored is not None:
+            return None if stored == _MISSING else stored
+        self._stats["misses"] += 1
+
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+        if not leader:
+            # Another thread in this process is loading the same key
+            self._stats["waits"] += 1
+            event.wait(self.wait_seconds + self.lease_seconds)
+            stored = self._get_l1(key) or self.l2.get(self._key(key))
+            if stored is not None:
+                return None if stored == _MISSING else stored
+            return loader()
+
+        try:
+            return self._load(key, loader)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def _load(self, key, loader):
+        lease = self._key(key) + ":lease"
+        if not self.l2.add(lease, 1, self.lease_seconds):
+            # Another process is loading it; give it a moment to publish the result
+            self._stats["waits"] += 1
+            deadline = time.monotonic() + self.wait_seconds
+            while time.monotonic() < deadline:
+                time.sleep(0.01)
+                stored = self.l2.get(self._key(key))
+                if stored is not None:
+                    self._set_l1(key, stored)
+                    return None if stored == _MISSING else stored
+        try:
+            self._stats["loads"] += 1
+            value = loader()
+            self.set(key, value)
+            return value
+        finally:
+            self.l2.delete(lease)
+
+    def _delete(self, keys):
+        if self._l1 is not None:
+            with self._lock:
+                for key in keys:
+                    self._l1.pop(key, None)
+        self.l2.delete_many([self._key(key) for key in keys])
+
+    def invalidate_many(self, keys):
+        keys = list(keys)
+        self._stats["invalidations"] += len(keys)
+        self._delete(keys)
+        transaction.on_commit(lambda: self._delete(keys))
+
+    def invalidate(self, key):
+        self.invalidate_many([key])
+
+    def clear_local(self):
+        """Drop this process's L1 (L2 is left alone)"""
+        if self._l1 is not None:
+            with self._lock:
+                self._l1.clear()
+
+    def stats(self) -> Dict[str, float]:
+        stats = dict(self._stats)
+        hits = stats.get("l1_hits", 0) + stats.get("l2_hits", 0)
+        lookups = hits + stats.get("misses", 0)
+        stats["hit_ratio"] = hits / lookups if lookups else 0.0
+        stats["l1_size"] = len(self._l1) if self._l1 is not None else 0
+        return stats
+
+    def reset_stats(self):
+        self._stats.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_account_cache() -> TieredCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TieredCache(
+                alias=getattr(settings, "ACCOUNT_CACHE_ALIAS", "default"),
+                prefix="accounts:rows",
+                l1_maxsize=getattr(settings, "ACCOUNT_CACHE_L1_SIZE", 10000),
+                l1_ttl=getattr(settings, "ACCOUNT_CACHE_L1_TTL_SECONDS", 5),
+                l2_ttl=getattr(settings, "ACCOUNT_CACHE_TTL_SECONDS", 300),
+            )
+        return _cache
+
+
+def account_cache_enabled() -> bool:
+    return getattr(settings, "ACCOUNT_CACHE_ENABLED", True)
+
+
+def invalidate_account_rows(*user_ids):
+    """Drop the cached profile/credits/OTP rows of users (after any change to them)"""
+    get_account_cache().invalidate_many(user_ids)
+
+
+# User relation name -> model, for the rows cached per user
+ROW_MODELS = (("userprofile", UserProfile), ("credits", UserCredits), ("otp", UserOTP))
+
+
+def pack_rows(user) -> tuple:
+    """
+    The user's related rows (loaded with select_related) as tuples of field
+    values, None where a row doesn't exist. Plain values rather than model
+    instances, so a cached entry can't be mutated by whoever reads it.
+    """
+    packed = []
+    for name, model in ROW_MODELS:
+        try:
+            row = getattr(user, name)
+        except model.DoesNotExist:
+            packed.append(None)
+        else:
+            packed.append(tuple(getattr(row, f.attname) for f in model._meta.concrete_fields))
+    return tuple(packed)
+
+
+def attach_rows(user, packed: tuple):
+    """Set the related-object caches of `user` from pack_rows() output, as select_related would"""
+    for (name, model), values in zip(ROW_MODELS, packed):
+        row = None
+        if values is not None:
+            row = model.from_db(DEFAULT_DB_ALIAS, [f.attname for f in model._meta.concrete_fields], values)
+            model._meta.get_field("user").set_cached_value(row, user)
+        getattr(type(user), name).related.set_cached_value(user, row)
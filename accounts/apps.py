@@ -1,7 +1,6 @@
 # accounts/apps.py
 from django.apps import AppConfig
 import threading
-import time
 import atexit
 import sys
 import os
@@ -17,6 +16,7 @@ class AccountsConfig(AppConfig):
 
     _backup_thread = None
     _stop_event = None
+    _wal_shipper = None
 
     def ready(self):
         # Import signal handlers so they register
@@ -24,6 +24,23 @@ class AccountsConfig(AppConfig):
             import accounts.signals  # noqa: F401
         except Exception:
             logger.exception("Failed to import accounts.signals")
+        import accounts.checks  # noqa: F401
+
+        # The app catalog is built once per process; a bad ACCOUNTS_APP_CATALOG fails at startup
+        from accounts.catalog import get_catalog
+        get_catalog()
+
+        # Pending metered usage is flushed at exit in every process, not just servers
+        from accounts.metering import meter
+        atexit.register(self._stop_credit_meter, meter)
+
+        # With WAL shipping on, SQLite connections leave checkpoints to the shipper (autocheckpoint is only a backstop)
+        from django.conf import settings
+        wal_shipping = getattr(settings, "BACKUP_WAL_SHIPPING", False)
+        if wal_shipping:
+            from django.db.backends.signals import connection_created
+            from accounts.walship import configure_wal_connection
+            connection_created.connect(configure_wal_connection, dispatch_uid="accounts_wal_shipping")
 
         # Only start scheduler in server processes, not when running manage.py commands like migrations.
         # Common check: start when RUN_MAIN env is set (development runserver child process),
@@ -37,16 +54,24 @@ class AccountsConfig(AppConfig):
         if os.environ.get("RUN_MAIN") == "true" or "runserver" in cmd or ("gunicorn" in sys.argv[0]) or ("uwsgi" in sys.argv[0]):
             should_start = True
 
-        # If you want it always on, set should_start = True (be careful in multi-worker setups)
+        # If you want it always on, set should_start = True; the backup scheduler itself
+        # only runs in the process that wins the leader election below
         if not should_start:
             return
 
+        meter.start()
+
+        # Deliver mail left pending by a previous process now, not when the next email is queued
+        from accounts.outbox import start_dispatcher
+        start_dispatcher()
+
         # Avoid starting multiple times
         if AccountsConfig._backup_thread is not None and AccountsConfig._backup_thread.is_alive():
             return
 
-        from django.conf import settings
         from accounts.backup import perform_backup
+        from accounts.incremental import perform_incremental_backup
+        from accounts.leader import LeaderElection, run_as_leader
 
         stop_event = threading.Event()
         AccountsConfig._stop_event = stop_event
@@ -54,22 +79,45 @@ class AccountsConfig(AppConfig):
         def backup_loop():
             base_dir = Path(settings.BASE_DIR)
             outdir = base_dir / "db_backups"
-            retention = 168  # keep last 168 backups (7 days hourly)
+            # Tiered hourly/daily/weekly retention (an int keeps the newest N)
+            retention = getattr(settings, "BACKUP_RETENTION", 168)
             interval_seconds = 60 * 60  # 1 hour
-
-            # First run immediately
-            try:
-                logger.info("Starting in-app DB backup loop, first backup running now.")
-                perform_backup(base_dir, outdir=outdir, retention=retention)
-            except Exception:
-                logger.exception("Initial backup failed.")
-
-            while not stop_event.wait(interval_seconds):
-                try:
-                    logger.info("Performing scheduled backup.")
-                    perform_backup(base_dir, outdir=outdir, retention=retention)
-                except Exception:
-                    logger.exception("Scheduled backup failed.")
+            backup_options = {
+                # Throttled, lock-yielding copy so the backup doesn't stall live requests
+                "pages_per_step": getattr(settings, "BACKUP_PAGES_PER_STEP", 0),
+                "step_sleep": getattr(settings, "BACKUP_STEP_SLEEP_SECONDS", 0.0),
+                "max_bytes_per_sec": getattr(settings, "BACKUP_MAX_BYTES_PER_SEC", None),
+            }
+            if getattr(settings, "BACKUP_MODE", "full") == "incremental":
+                # Content-addressed chunks + manifests; only changed chunks are stored
+                run_backup = perform_incremental_backup
+                backup_options["chunk_pages"] = getattr(settings, "BACKUP_CHUNK_PAGES", 16)
+            else:
+                run_backup = perform_backup
+                backup_options.update({
+                    "codec": getattr(settings, "BACKUP_CODEC", "gzip"),
+                    "level": getattr(settings, "BACKUP_COMPRESSION_LEVEL", None),
+                    "threads": getattr(settings, "BACKUP_COMPRESSION_THREADS", 0),
+                    "progress": lambda status, remaining, total: logger.debug(
+                        "Backup progress: %d/%d pages copied", total - remaining, total),
+                })
+
+            # Every worker runs this loop, but only the holder of the host-wide lock backs up.
+            # The schedule (last run time) is shared, so failover doesn't cause an extra backup.
+            outdir.mkdir(parents=True, exist_ok=True)
+            election = LeaderElection(outdir / ".scheduler.lock")
+
+            def scheduled_backup():
+                logger.info("Performing scheduled backup.")
+                run_backup(base_dir, outdir=outdir, retention=retention, **backup_options)
+
+            run_as_leader(
+                stop_event, election, interval_seconds,
+                poll_interval=getattr(settings, "BACKUP_LEADER_POLL_SECONDS", 60),
+                state_path=outdir / ".last_backup",
+                job=scheduled_backup,
+                on_elected=self._start_wal_shipper if wal_shipping else None,
+            )
 
             logger.info("Backup loop stopped.")
 
@@ -87,4 +135,44 @@ class AccountsConfig(AppConfig):
             except Exception:
                 logger.exception("Error shutting down backup thread.")
 
-        atexit.register(_stop)
\ No newline at end of file
+        atexit.register(_stop)
+
+    def _start_wal_shipper(self):
+        """Start continuous WAL shipping of the SQLite database to the replica directory"""
+        if AccountsConfig._wal_shipper is not None:
+            return
+
+        from django.conf import settings
+        from django.db import connections
+        from accounts.walship import WALShipper
+
+        db = connections["default"]
+        if db.vendor != "sqlite":
+            logger.warning("BACKUP_WAL_SHIPPING is only supported for SQLite; not starting.")
+            return
+
+        shipper = WALShipper(
+            Path(db.settings_dict["NAME"]),
+            Path(getattr(settings, "BACKUP_WAL_REPLICA_DIR", Path(settings.BASE_DIR) / "db_replica")),
+            interval=getattr(settings, "BACKUP_WAL_SYNC_SECONDS", 2),
+            snapshot_interval=getattr(settings, "BACKUP_WAL_SNAPSHOT_SECONDS", 3600),
+            checkpoint_bytes=getattr(settings, "BACKUP_WAL_CHECKPOINT_BYTES", 4 * 1024 * 1024),
+            retention_seconds=getattr(settings, "BACKUP_WAL_RETENTION_SECONDS", 7 * 24 * 3600),
+        )
+        AccountsConfig._wal_shipper = shipper
+        shipper.start()
+
+        def _stop():
+            try:
+                shipper.stop(timeout=5)
+            except Exception:
+                logger.exception("Error shutting down WAL shipper.")
+
+        atexit.register(_stop)
+
+    @staticmethod
+    def _stop_credit_meter(meter):
+        try:
+            meter.stop(timeout=5)
+        except Exception:
+            logger.exception("Error flushing credit meter at shutdown.")
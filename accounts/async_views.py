@@ -0,0 +1,283 @@
+# accounts/async_views.py
+"""
+Native async versions of the accounts views, served when
+ACCOUNTS_ASYNC_VIEWS is on (see myproject/urls.py).
+
+Under ASGI these run on the event loop: lookups and writes use the async
+ORM, OTP mail goes through aenqueue_email (one INSERT, delivered by the
+outbox dispatcher), and password hashing runs in the accounts.hashing
+process pool. Only the parts of django.contrib.auth that have no async
+API in Django 4.2 - resolving request.user, login()/logout() and their
+session writes - hop to a thread.
+
+Behaviour, templates and messages match accounts.views.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth import login, logout
+from django.contrib.auth.models import User
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import redirect, render, resolve_url
+from django.urls import reverse
+
+from .forms import LoginForm, OTPVerificationForm, SignupForm
+from .hashing import HashingBusy, acheck_user_password, ahash_password
+from .middleware import aget_request_user, remember_profile_completion
+from .models import UserCredits, UserOTP, UserProfile
+from .otp import ERRORS as OTP_ERRORS, VERIFIED, acheck_otp, aissue_otp
+from .outbox import aenqueue_email
+from .ratelimit import ratelimit
+from .signals import ensure_user_records
+from .domains import is_workspace_email
+from .catalog import visible_apps
+from .views import authenticate_loaded_user, busy_response, otp_email
+
+
+def alogin_required(view):
+    """login_required for async views (Django 4.2's decorator only wraps sync ones)"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await aget_request_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), resolve_url("login"))
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def ashed_when_hashing_busy(view):
+    """views.shed_when_hashing_busy for async views"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except HashingBusy:
+            return busy_response(request)
+    return wrapper
+
+
+async def asend_otp_email(user, otp_code):
+    """Queue OTP email to user without blocking the event loop"""
+    subject, message = otp_email(user, otp_code)
+    await aenqueue_email(subject, message, user.email)
+
+
+def _finish_login(request, user):
+    # login() rotates the session and updates last_login; runs in one thread hop
+    login(request, user)
+    profile = ensure_user_records(user)
+    remember_profile_completion(user.pk, profile.is_complete)
+    return profile.is_complete
+
+
+@ratelimit("login")
+@ashed_when_hashing_busy
+async def login_page(request):
+    """Handle both login and signup on the same page"""
+    # Profile comes with the user (select_related / account cache), not from another query
+    identity = await request.identity.aload()
+    if identity.user.is_authenticated:
+        profile = identity.profile
+        if profile and profile.company_name and profile.company_size:
+            return redirect("profile")
+        return redirect("complete_profile")
+
+    mode = request.GET.get('mode', 'login')
+    login_form = LoginForm()
+    signup_form = SignupForm()
+    error = None
+
+    if request.method == "POST":
+        if 'login_submit' in request.POST:
+            login_form = LoginForm(request.POST)
+            if login_form.is_valid():
+                email = login_form.cleaned_data['email']
+                password = login_form.cleaned_data['password']
+                user = await (User.objects.select_related('otp', 'userprofile', 'credits')
+                              .filter(email=email).afirst())
+
+                if user is None:
+                    # Run the hasher anyway so unknown emails take as long as wrong passwords
+                    await ahash_password(password)
+                    error = "Invalid email or password."
+                else:
+                    otp_obj = getattr(user, 'otp', None)
+                    if otp_obj is not None and not otp_obj.is_verified:
+                        messages.error(request, "Please verify your email first.")
+                        return redirect(reverse('verify_otp') + f'?email={email}')
+
+                    password_ok = await acheck_user_password(user, password)
+                    user = await sync_to_async(authenticate_loaded_user)(request, user, password, password_ok)
+                    if user is None:
+                        error = "Invalid email or password."
+                    elif not is_workspace_email(email):
+                        messages.error(request, "Only workspace emails are allowed.")
+                        error = "Only workspace emails are allowed."
+                    else:
+                        if not await sync_to_async(_finish_login)(request, user):
+                            return redirect("complete_profile")
+                        return redirect("profile")
+            else:
+                error = "Please enter valid credentials."
+
+        elif 'signup_submit' in request.POST:
+            signup_form = SignupForm(request.POST)
+            if signup_form.is_valid():
+                email = signup_form.cleaned_data['email']
+
+                if not is_workspace_email(email):
+                    error = "Only workspace emails are allowed. Personal Gmail accounts are not permitted."
+                    mode = 'signup'
+                elif await User.objects.filter(email=email).aexists():
+                    error = "This email is already registered."
+                    mode = 'signup'
+                else:
+                    user = await User.objects.acreate(
+                        username=User.normalize_username(email),
+                        email=User.objects.normalize_email(email),
+                        password=await ahash_password(signup_form.cleaned_data['password']),
+                    )
+                    await UserProfile.objects.acreate(
+                        user=user,
+                        company_name=signup_form.cleaned_data['company_name'],
+                        company_size=signup_form.cleaned_data['company_size'],
+                    )
+                    await UserCredits.objects.acreate(user=user, total_credits=10)
+
+                    await UserOTP.objects.acreate(user=user, is_verified=False)
+                    await asend_otp_email(user, await aissue_otp(user.pk))
+
+                    messages.success(request, "OTP sent to your email. Please verify to continue.")
+                    return redirect(f"/verify-otp/?email={email}")
+            else:
+                error = "Please fix the errors below."
+                mode = 'signup'
+
+    return render(request, "login.html", {
+        'mode': mode,
+        'login_form': login_form,
+        'signup_form': signup_form,
+        'error': error
+    })
+
+
+@ratelimit("verify_otp")
+async def verify_otp(request):
+    """Verify OTP and activate account"""
+    email = request.GET.get('email')
+    if not email:
+        return redirect("login")
+
+    otp_obj = await UserOTP.objects.filter(user__email=email).afirst()
+    if otp_obj is None:
+        messages.error(request, "Invalid verification link.")
+        return redirect("login")
+
+    if otp_obj.is_verified:
+        messages.info(request, "Email already verified. Please login.")
+        return redirect("login")
+
+    error = None
+    if request.method == "POST":
+        form = OTPVerificationForm(request.POST)
+        if form.is_valid():
+            result = await acheck_otp(otp_obj.user_id, form.cleaned_data['otp'])
+            if result == VERIFIED:
+                otp_obj.is_verified = True
+                await otp_obj.asave(update_fields=['is_verified'])
+                messages.success(request, "Email verified successfully! You can now login.")
+                return redirect("login")
+            error = OTP_ERRORS[result]
+        else:
+            error = "Please enter a valid OTP."
+    else:
+        form = OTPVerificationForm()
+
+    return render(request, "verify_otp.html", {
+        'email': email,
+        'form': form,
+        'error': error
+    })
+
+
+@ratelimit("resend_otp")
+async def resend_otp(request):
+    """Resend OTP to user email"""
+    email = request.GET.get('email')
+    if not email:
+        return redirect("login")
+
+    otp_obj = await UserOTP.objects.select_related('user').filter(user__email=email).afirst()
+    if otp_obj is None:
+        messages.error(request, "Invalid email.")
+        return redirect("login")
+
+    if otp_obj.is_verified:
+        messages.info(request, "Email already verified. Please login.")
+        return redirect("login")
+
+    await asend_otp_email(otp_obj.user, await aissue_otp(otp_obj.user_id))
+
+    messages.success(request, "OTP resent to your email.")
+    return redirect(f"/verify-otp/?email={email}")
+
+
+@alogin_required
+async def complete_profile(request):
+    """Complete user profile - used for both regular and OAuth users"""
+    user = request.user
+    if not is_workspace_email(user.email):
+        await sync_to_async(logout)(request)
+        messages.error(request, "Only workspace emails are allowed.")
+        return redirect("login")
+
+    identity = await request.identity.aload()
+    profile = identity.profile
+    if profile is None or identity.credits is None:
+        profile = await sync_to_async(ensure_user_records)(user)
+
+    if request.method == "POST":
+        company_name = request.POST.get("company_name", "").strip()
+        company_size = request.POST.get("company_size", "").strip()
+
+        if not company_name or not company_size:
+            return render(request, "complete_profile.html", {
+                "error": "All fields are required.",
+                "user": user
+            })
+
+        profile.company_name = company_name
+        profile.company_size = company_size
+        await profile.asave()
+
+        messages.success(request, "Profile completed successfully!")
+        return redirect("profile")
+
+    return render(request, "complete_profile.html", {"user": user})
+
+
+@alogin_required
+async def profile(request):
+    """Display user profile with available apps and credits"""
+    user = request.user
+    if not is_workspace_email(user.email):
+        await sync_to_async(logout)(request)
+        messages.error(request, "Only workspace emails are allowed.")
+        return redirect("login")
+
+    identity = await request.identity.aload()
+    profile = identity.profile
+    if profile is None:
+        return redirect("complete_profile")
+
+    credits = identity.credits
+    if credits is None:
+        credits, created = await UserCredits.objects.aget_or_create(user=user, defaults={'total_credits': 10})
+
+    return render(request, "profile.html", {
+        "user": user,
+        "profile": profile,
+        "credits": credits,
+        "apps": await sync_to_async(visible_apps)(user, profile)
+    })
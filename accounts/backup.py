@@ -1,23 +1,234 @@
 # accounts/backup.py
 import sqlite3
 import gzip
-import shutil
+import hashlib
+import lzma
 import logging
+import os
+import time
+from contextlib import closing
 from pathlib import Path
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Iterator, Optional
+
+from .retention import Retention, backup_lock, record_backup, rotate_backups
+from .walship import iter_snapshot
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
 
 logger = logging.getLogger(__name__)
 
+CHUNK_SIZE = 1024 * 1024
+
+# codec name -> archive suffix
+CODECS = {
+    "gzip": ".gz",
+    "lzma": ".xz",
+    "zstd": ".zst",
+}
+BACKUP_GLOB = "db_backup_*.sqlite3.*"
+
+
+def available_codecs() -> list:
+    return [name for name in CODECS if name != "zstd" or zstandard is not None]
+
+
+def open_compressed(path: Path, codec: str = "gzip", level: Optional[int] = None, threads: int = 0):
+    """
+    Open `path` for writing through the chosen compressor.
+
+    - gzip: level 1-9 (default 6)
+    - lzma: preset 0-9 (default 6)
+    - zstd: level 1-22 (default 3); `threads` > 0 (or -1 for all cores)
+      enables multi-threaded compression. Requires the `zstandard` package.
+    """
+    if codec == "gzip":
+        return gzip.open(path, "wb", compresslevel=6 if level is None else level)
+    if codec == "lzma":
+        return lzma.open(path, "wb", preset=6 if level is None else level)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd backups require the 'zstandard' package")
+        cctx = zstandard.ZstdCompressor(level=3 if level is None else level, threads=threads)
+        return cctx.stream_writer(open(path, "wb"), closefd=True)
+    raise ValueError(f"Unknown backup codec: {codec}")
+
+
+def open_decompressed(path: Path):
+    """Open an archive produced by perform_backup for reading, picking the codec from its suffix."""
+    suffix = Path(path).suffix
+    if suffix == ".gz":
+        return gzip.open(path, "rb")
+    if suffix == ".xz":
+        return lzma.open(path, "rb")
+    if suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError("zstd backups require the 'zstandard' package")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    raise ValueError(f"Unknown backup archive type: {path}")
+
+
+def iter_file(path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            yield data
+
+
+def iter_database(src_conn: sqlite3.Connection, db_path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Yield a consistent image of the database in chunks, to be compressed as
+    it is read, so no uncompressed copy is written.
+
+    In WAL mode the image is read from a pinned read snapshot (see
+    accounts.walship.iter_snapshot): the write lock is held only while the
+    WAL is indexed, and writers carry on while the image is compressed. In
+    rollback-journal mode the file is read page-aligned while a read
+    transaction holds the SHARED lock, which keeps writers waiting until
+    the whole image has been compressed; use WAL mode, or a throttled copy
+    (pages_per_step), where that matters.
+    """
+    journal_mode = src_conn.execute("PRAGMA journal_mode").fetchone()[0].lower()
+    if journal_mode == "wal":
+        yield from iter_snapshot(src_conn, db_path, chunk_size)
+        return
+
+    src_conn.execute("BEGIN")
+    try:
+        # Any read acquires the SHARED lock, which keeps writers out until COMMIT
+        src_conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        page_size = src_conn.execute("PRAGMA page_size").fetchone()[0]
+        remaining = page_size * src_conn.execute("PRAGMA page_count").fetchone()[0]
+        chunk_size = max(page_size, chunk_size - chunk_size % page_size)
+        with open(db_path, "rb") as f:
+            while remaining > 0:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+    finally:
+        src_conn.execute("COMMIT")
+
+
+def remove_image(image_path: Path):
+    """Delete a temporary image (and a journal SQLite may have left next to it)"""
+    for path in (image_path, image_path.with_name(image_path.name + "-journal")):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class BackupRestartLimit(Exception):
+    """The throttled backup kept restarting because the source was being written to."""
 
-def perform_backup(base_dir: Path, outdir: Optional[Path] = None, retention: int = 168) -> Optional[Path]:
+
+def snapshot_throttled(src_conn: sqlite3.Connection, image_path: Path, pages_per_step: int, step_sleep: float = 0.0,
+                       max_bytes_per_sec: Optional[int] = None, progress: Optional[Callable] = None,
+                       max_restarts: int = 3):
+    """
+    Copy the database to `image_path` with the online backup API
+    `pages_per_step` pages at a time, releasing the source lock and sleeping
+    `step_sleep` seconds between steps. The copy is additionally slowed down
+    so it does not exceed `max_bytes_per_sec`. The copy goes to disk, so
+    memory use doesn't grow with the database.
+
+    `progress(status, remaining, total)` is called after every step, as with
+    sqlite3.Connection.backup.
+
+    In WAL mode a read snapshot is pinned on `src_conn` for the whole copy:
+    writers are never blocked by it and the backup never restarts. In
+    rollback-journal mode the lock must be released between steps for writers
+    to get in, and SQLite restarts the copy whenever another connection
+    writes; after `max_restarts` restarts BackupRestartLimit is raised so the
+    caller can fall back to a one-shot copy.
     """
-    Create a consistent sqlite3 backup and store gzipped copy in backups folder.
+    page_size = src_conn.execute("PRAGMA page_size").fetchone()[0]
+    wal = src_conn.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+    state = {"steps": 0, "restarts": 0, "remaining": None}
+    start = time.monotonic()
+
+    def _progress(status, remaining, total):
+        state["steps"] += 1
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] > max_restarts:
+                raise BackupRestartLimit(f"backup restarted {state['restarts']} times")
+        state["remaining"] = remaining
+
+        if max_bytes_per_sec:
+            copied = state["steps"] * pages_per_step * page_size
+            ahead = copied / max_bytes_per_sec - (time.monotonic() - start)
+            if ahead > 0:
+                time.sleep(ahead)
+        if progress is not None:
+            progress(status, remaining, total)
+
+    dest_conn = sqlite3.connect(str(image_path))
+    try:
+        if wal:
+            src_conn.execute("BEGIN")
+            src_conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        try:
+            src_conn.backup(dest_conn, pages=pages_per_step, progress=_progress, sleep=step_sleep)
+        finally:
+            if wal:
+                src_conn.execute("COMMIT")
+    finally:
+        dest_conn.close()
+
+
+def iter_backup_image(src_conn: sqlite3.Connection, db_path: Path, image_path: Path, pages_per_step: int = 0,
+                      step_sleep: float = 0.0, max_bytes_per_sec: Optional[int] = None,
+                      progress: Optional[Callable] = None) -> Iterator[bytes]:
+    """
+    Yield a consistent image of the database in chunks: streamed by
+    iter_database, or, if `pages_per_step` > 0, staged to `image_path` by
+    snapshot_throttled and read back (the image is removed afterwards). A
+    throttled copy that keeps restarting falls back to iter_database.
+    """
+    if pages_per_step > 0:
+        try:
+            snapshot_throttled(src_conn, image_path, pages_per_step, step_sleep=step_sleep,
+                               max_bytes_per_sec=max_bytes_per_sec, progress=progress)
+        except BackupRestartLimit as exc:
+            logger.warning("Throttled backup gave up (%s); falling back to a one-shot copy.", exc)
+            remove_image(image_path)
+        else:
+            try:
+                yield from iter_file(image_path)
+            finally:
+                remove_image(image_path)
+            return
+    yield from iter_database(src_conn, db_path)
+
+
+def perform_backup(base_dir: Path, outdir: Optional[Path] = None, retention: Retention = 168,
+                   codec: str = "gzip", level: Optional[int] = None, threads: int = 0,
+                   pages_per_step: int = 0, step_sleep: float = 0.0, max_bytes_per_sec: Optional[int] = None,
+                   progress: Optional[Callable] = None) -> Optional[Path]:
+    """
+    Create a consistent sqlite3 backup and store a compressed copy in backups folder.
+
+    The database image is compressed as it is read (see iter_database), so
+    no uncompressed copy is written, except by the throttled mode, which
+    stages its copy next to the archive and removes it afterwards.
 
     - base_dir: Path to project BASE_DIR (settings.BASE_DIR)
     - outdir: optional output directory; default: base_dir / "db_backups"
-    - retention: number of backups to keep (default: 168)
-    Returns path to created gzipped backup or None on failure.
+    - retention: number of backups to keep (default: 168), or a tiered policy
+      such as {"hourly": 24, "daily": 14, "weekly": 8} (see accounts.retention)
+    - codec: "gzip", "lzma" or "zstd" (optional dependency); level/threads as in open_compressed
+    - pages_per_step: if > 0, copy in throttled steps (see snapshot_throttled) so
+      the source lock is released between steps; step_sleep, max_bytes_per_sec
+      and progress apply to this mode.
+    Returns path to created backup archive or None on failure.
     """
     if outdir is None:
         outdir = base_dir / "db_backups"
@@ -33,44 +244,39 @@ def perform_backup(base_dir: Path, outdir: Optional[Path] = None, retention: int
         logger.error("Source DB not found: %s", db_path)
         return None
 
+    if codec not in CODECS:
+        logger.error("Unknown backup codec: %s", codec)
+        return None
+
     ts = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-    tmp_dest = outdir / f"db_backup_{ts}.sqlite3"
-    gz_dest = outdir / f"db_backup_{ts}.sqlite3.gz"
+    dest = outdir / f"db_backup_{ts}.sqlite3{CODECS[codec]}"
+    # Written under a temporary name and renamed, so a partial archive is never rotated in
+    tmp_dest = dest.with_name(dest.name + ".part")
+    tmp_image = dest.with_name(dest.name + ".image")
 
     try:
-        # Use sqlite backup API for an atomic, consistent copy
-        src_conn = sqlite3.connect(str(db_path), check_same_thread=False)
-        dest_conn = sqlite3.connect(str(tmp_dest))
-        with dest_conn:
-            src_conn.backup(dest_conn, pages=0, progress=None)
-        dest_conn.close()
-        src_conn.close()
-
-        # Gzip the resulting sqlite file
-        with open(tmp_dest, "rb") as f_in, gzip.open(gz_dest, "wb") as f_out:
-            shutil.copyfileobj(f_in, f_out)
-
-        # Remove the uncompressed temporary file
+        src_conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
         try:
-            tmp_dest.unlink()
-        except Exception:
-            # missing_ok not available on older Pythons; ignore errors
-            pass
+            image_hash, image_size = hashlib.sha256(), 0
+            image = iter_backup_image(src_conn, db_path, tmp_image, pages_per_step=pages_per_step,
+                                      step_sleep=step_sleep, max_bytes_per_sec=max_bytes_per_sec, progress=progress)
+            with closing(image), open_compressed(tmp_dest, codec, level=level, threads=threads) as f_out:
+                for chunk in image:
+                    image_hash.update(chunk)
+                    image_size += len(chunk)
+                    f_out.write(chunk)
+        finally:
+            src_conn.close()
+        os.replace(tmp_dest, dest)
 
-        logger.info("Backup created: %s", gz_dest)
+        logger.info("Backup created: %s", dest)
 
-        # Rotation: keep only the newest `retention` backups
-        backups = sorted(outdir.glob("db_backup_*.sqlite3.gz"), reverse=True)
-        if len(backups) > retention:
-            old = backups[retention:]
-            for p in old:
-                try:
-                    p.unlink()
-                    logger.info("Removed old backup: %s", p)
-                except Exception:
-                    logger.exception("Failed to remove old backup %s", p)
+        # Index + rotation: the index is read instead of scanning the directory
+        with backup_lock(outdir):
+            record_backup(outdir, dest, codec, image_size, image_hash.hexdigest())
+            rotate_backups(outdir, retention)
 
-        return gz_dest
+        return dest
 
     except Exception as exc:
         logger.exception("Error creating backup: %s", exc)
@@ -80,4 +286,4 @@ def perform_backup(base_dir: Path, outdir: Optional[Path] = None, retention: int
                 tmp_dest.unlink()
         except Exception:
             pass
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,41 @@
+# accounts/bench.py
+"""Small helpers shared by the bench_* management commands."""
+import math
+import time
+from contextlib import contextmanager
+from typing import Dict, Sequence
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of `values` (pct in 0..100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def latency_summary(seconds: Sequence[float]) -> Dict[str, float]:
+    """p50/p90/p99/max in milliseconds for a list of durations in seconds."""
+    return {
+        "count": len(seconds),
+        "p50_ms": percentile(seconds, 50) * 1000,
+        "p90_ms": percentile(seconds, 90) * 1000,
+        "p99_ms": percentile(seconds, 99) * 1000,
+        "max_ms": (max(seconds) if seconds else 0.0) * 1000,
+    }
+
+
+def format_summary(label: str, summary: Dict[str, float]) -> str:
+    return (f"{label:<28} n={summary['count']:<6} p50={summary['p50_ms']:8.2f}ms "
+            f"p90={summary['p90_ms']:8.2f}ms p99={summary['p99_ms']:8.2f}ms max={summary['max_ms']:8.2f}ms")
+
+
+@contextmanager
+def timed(out: list):
+    """Append the wall-clock duration of the block to `out`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        out.append(time.perf_counter() - start)
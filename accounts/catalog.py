@@ -0,0 +1,171 @@
+# accounts/catalog.py
+"""
+App catalog shown on the profile page, and who may use which app.
+
+The registry is built once per process (AccountsConfig.ready) from
+ACCOUNTS_APP_CATALOG, or DEFAULT_APPS, into immutable slotted AppEntry
+records. Public apps are visible to everyone. Restricted ones
+(public=False) need an AppEntitlement row for the user or for their
+company (UserProfile.company_name).
+
+A user's granted slugs are resolved with one query covering both kinds of
+grant, kept as a frozenset in a TieredCache (accounts.account_cache), and
+invalidated when an entitlement or the user's profile changes; a catalog
+with no restricted apps never looks them up. Checks are
+a dict lookup plus set membership, whatever the size of the catalog, and
+the visible tuple for a given set of grants is built once and shared, so
+rendering the catalog allocates nothing per request.
+"""
+import logging
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Q
+
+from .account_cache import TieredCache
+from .models import AppEntitlement, UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class AppEntry:
+    slug: str
+    name: str
+    description: str
+    icon: str
+    url: str
+    color: str
+    public: bool = True
+
+
+DEFAULT_APPS = (
+    {'slug': 'qlx', 'name': 'Qlx',
+     'description': 'Quick learning experience platform for seamless knowledge acquisition',
+     'icon': '⚡', 'url': '/qlx/', 'color': '#FF6B6B'},
+    {'slug': 'vta', 'name': 'Vta',
+     'description': 'Virtual teaching assistant to help with learning and training',
+     'icon': '🎓', 'url': '/vta/', 'color': '#4ECDC4'},
+    {'slug': 'pulseiq', 'name': 'Pulseiq',
+     'description': 'Real-time intelligence and analytics for data-driven decisions',
+     'icon': '📊', 'url': '/pulseiq/', 'color': '#45B7D1'},
+    {'slug': 'docmind', 'name': 'Docmind',
+     'description': 'Intelligent document analysis and processing tool',
+     'icon': '📄', 'url': '/docmind/', 'color': '#96CEB4'},
+    {'slug': 'askx', 'name': 'Askx',
+     'description': 'Advanced AI-powered question answering system',
+     'icon': '💡', 'url': '/askx/', 'color': '#FFEAA7'},
+    {'slug': 'arl', 'name': 'ARL',
+     'description': 'Adaptive Resource Learning system for personalized education',
+     'icon': '🎯', 'url': '/arl/', 'color': '#DDA15E'},
+)
+
+
+class Catalog:
+    # Users share a handful of distinct grant sets; each one's tuple is built once, up to this many
+    MAX_GRANT_SETS = 1024
+
+    def __init__(self, entries: Iterable[AppEntry]):
+        self.entries: Tuple[AppEntry, ...] = tuple(entries)
+        self._visible: Dict[FrozenSet[str], Tuple[AppEntry, ...]] = {}
+        by_slug = {}
+        for entry in self.entries:
+            if entry.slug in by_slug:
+                raise ValueError(f"Duplicate app slug in catalog: {entry.slug}")
+            by_slug[entry.slug] = entry
+        self.by_slug = MappingProxyType(by_slug)
+        self.public = self.visible(frozenset())
+        self.restricted = len(self.public) < len(self.entries)
+
+    @classmethod
+    def from_config(cls, config: Iterable[dict]) -> "Catalog":
+        return cls(AppEntry(**item) for item in config)
+
+    def get(self, slug: str) -> Optional[AppEntry]:
+        return self.by_slug.get(slug)
+
+    def visible(self, granted: FrozenSet[str]) -> Tuple[AppEntry, ...]:
+        """Apps a user with these restricted grants may see, in catalog order"""
+        try:
+            return self._visible[granted]
+        except KeyError:
+            pass
+        apps = tuple(entry for entry in self.entries if entry.public or entry.slug in granted)
+        if len(self._visible) < self.MAX_GRANT_SETS:
+            self._visible[granted] = apps
+        return apps
+
+
+_catalog = None
+_entitlements = None
+_lock = threading.Lock()
+
+
+def get_catalog() -> Catalog:
+    global _catalog
+    with _lock:
+        if _catalog is None:
+            _catalog = Catalog.from_config(getattr(settings, "ACCOUNTS_APP_CATALOG", None) or DEFAULT_APPS)
+            logger.debug("App catalog loaded: %d apps", len(_catalog.entries))
+        return _catalog
+
+
+def get_entitlement_cache() -> TieredCache:
+    global _entitlements
+    with _lock:
+        if _entitlements is None:
+            _entitlements = TieredCache(
+                alias=getattr(settings, "ACCOUNT_CACHE_ALIAS", "default"),
+                prefix="accounts:entitlements",
+                l1_maxsize=getattr(settings, "ACCOUNT_CACHE_L1_SIZE", 10000),
+                l1_ttl=getattr(settings, "ACCOUNT_CACHE_L1_TTL_SECONDS", 5),
+                l2_ttl=getattr(settings, "ACCOUNT_CACHE_TTL_SECONDS", 300),
+            )
+        return _entitlements
+
+
+def entitlements(user_id, company_name: str = "") -> FrozenSet[str]:
+    """Slugs granted to the user directly or through their company (one query on a cache miss)"""
+    def load():
+        grants = Q(user_id=user_id)
+        if company_name:
+            grants |= Q(company_name=company_name)
+        return frozenset(AppEntitlement.objects.filter(grants).values_list("app", flat=True))
+
+    return get_entitlement_cache().get_or_load(user_id, load)
+
+
+def _company(profile) -> str:
+    return profile.company_name if profile is not None else ""
+
+
+def visible_apps(user, profile=None) -> Tuple[AppEntry, ...]:
+    """The catalog as `user` sees it; pass the profile when it's already loaded (request.identity)"""
+    catalog = get_catalog()
+    if not catalog.restricted:
+        # Everything is public: no grants to look up
+        return catalog.public
+    return catalog.visible(entitlements(user.pk, _company(profile)))
+
+
+def has_app(user, slug: str, profile=None) -> bool:
+    catalog = get_catalog()
+    entry = catalog.get(slug)
+    if entry is None:
+        return False
+    # Public apps need no lookup at all
+    return entry.public or slug in entitlements(user.pk, _company(profile))
+
+
+def invalidate_entitlements(user_ids):
+    get_entitlement_cache().invalidate_many(user_ids)
+
+
+def invalidate_company_entitlements(company_name: str):
+    """Grants to a company change what every member sees"""
+    user_ids = list(UserProfile.objects.filter(company_name=company_name).values_list("user_id", flat=True))
+    if user_ids:
+        invalidate_entitlements(user_ids)
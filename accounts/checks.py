@@ -0,0 +1,45 @@
+# accounts/checks.py
+"""
+System checks for settings that only work in a single-process deployment.
+
+OTP codes, attempt counters and their consumption live in CACHES[OTP_CACHE]
+(accounts.otp). A process-local backend gives every web worker its own
+copy, so a code issued by one worker is "expired" in another and the
+attempt limit applies per worker. The worker count is read from
+WEB_CONCURRENCY, which gunicorn and uvicorn use as their default.
+"""
+import os
+
+from django.conf import settings
+from django.core import checks
+
+# Cache backends whose contents no other process can see
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def web_workers() -> int:
+    try:
+        return max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))
+    except ValueError:
+        return 1
+
+
+@checks.register(checks.Tags.caches)
+def check_otp_cache(app_configs=None, **kwargs):
+    alias = getattr(settings, "OTP_CACHE", "default")
+    backend = settings.CACHES.get(alias, {}).get("BACKEND")
+    if backend is None:
+        return [checks.Error(f"OTP_CACHE names the cache alias {alias!r}, which is not in CACHES.",
+                             id="accounts.E001")]
+    workers = web_workers()
+    if backend in PROCESS_LOCAL_CACHES and workers > 1:
+        return [checks.Error(
+            f"OTP_CACHE ({alias!r}) uses the process-local {backend.rsplit('.', 1)[-1]} but WEB_CONCURRENCY "
+            f"runs {workers} workers: codes issued by one worker would be rejected by the others.",
+            hint="Point OTP_CACHE at a shared cache (Redis, Memcached or DatabaseCache).",
+            id="accounts.E002",
+        )]
+    return []
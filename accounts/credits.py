@@ -0,0 +1,163 @@
+# accounts/credits.py
+"""
+Race-free credit consumption for UserCredits.
+
+Every balance change is a single conditional UPDATE evaluated by the
+database (`total >= used + reserved + amount`), so concurrent debits can
+never over-spend and no row is read-modified-written in Python. Each change
+is paired with an append-only CreditLedgerEntry in the same transaction.
+
+- consume(user, n): debit immediately
+- reserve(user, n, ttl): hold n credits; then commit(hold[, actual]) or release(hold)
+- expire_holds(): return expired holds to the balance
+"""
+import logging
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .account_cache import invalidate_account_rows
+from .models import CreditHold, CreditLedgerEntry, UserCredits
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientCredits(Exception):
+    """Raised when a debit or reservation exceeds the available balance."""
+
+
+class HoldNotActive(Exception):
+    """Raised when committing/releasing a hold that is no longer held."""
+
+
+def _user_id(user):
+    return getattr(user, "pk", user)
+
+
+def _debit(user_id, used: int = 0, reserved: int = 0) -> bool:
+    """Conditionally move credits into used/reserved. Returns False if the balance is too low."""
+    amount = used + reserved
+    debited = UserCredits.objects.filter(
+        user_id=user_id,
+        total_credits__gte=F("used_credits") + F("reserved_credits") + amount,
+    ).update(
+        used_credits=F("used_credits") + used,
+        reserved_credits=F("reserved_credits") + reserved,
+        updated_at=timezone.now(),
+    ) == 1
+    if debited:
+        # Queryset UPDATEs send no post_save; drop the cached row here
+        invalidate_account_rows(user_id)
+    return debited
+
+
+def _debit_or_expire(user_id, used: int = 0, reserved: int = 0):
+    if _debit(user_id, used=used, reserved=reserved):
+        return
+    # Only on the slow path: stale holds may be pinning the balance
+    if expire_holds(user=user_id) and _debit(user_id, used=used, reserved=reserved):
+        return
+    raise InsufficientCredits(f"User {user_id} has fewer than {used + reserved} credits available.")
+
+
+def consume(user, amount: int = 1, reference: str = "") -> None:
+    """Debit `amount` credits immediately or raise InsufficientCredits."""
+    if amount <= 0:
+        raise ValueError("amount must be positive")
+    user_id = _user_id(user)
+    with transaction.atomic():
+        _debit_or_expire(user_id, used=amount)
+        CreditLedgerEntry.objects.create(
+            user_id=user_id, kind=CreditLedgerEntry.KIND_CONSUME, amount=amount, reference=reference,
+        )
+
+
+def reserve(user, amount: int, ttl: Optional[int] = None, reference: str = "") -> CreditHold:
+    """Hold `amount` credits for up to `ttl` seconds; returns the CreditHold."""
+    if amount <= 0:
+        raise ValueError("amount must be positive")
+    user_id = _user_id(user)
+    ttl = ttl if ttl is not None else getattr(settings, "CREDIT_HOLD_TTL_SECONDS", 15 * 60)
+    with transaction.atomic():
+        _debit_or_expire(user_id, reserved=amount)
+        hold = CreditHold.objects.create(
+            user_id=user_id, amount=amount, reference=reference,
+            expires_at=timezone.now() + timedelta(seconds=ttl),
+        )
+        CreditLedgerEntry.objects.create(
+            user_id=user_id, kind=CreditLedgerEntry.KIND_RESERVE, amount=amount, hold=hold, reference=reference,
+        )
+    return hold
+
+
+def _close_hold(hold: CreditHold, status: str, require_unexpired: bool) -> None:
+    """Atomically transition a hold out of HELD, or raise HoldNotActive."""
+    qs = CreditHold.objects.filter(pk=hold.pk, status=CreditHold.STATUS_HELD)
+    if require_unexpired:
+        qs = qs.filter(expires_at__gt=timezone.now())
+    if qs.update(status=status) != 1:
+        raise HoldNotActive(f"Credit hold {hold.pk} is not active.")
+    hold.status = status
+
+
+def commit(hold: CreditHold, amount: Optional[int] = None) -> None:
+    """
+    Convert a hold into a debit of `amount` (default: the full hold).
+    Any unused part of the hold goes back to the balance.
+    """
+    amount = hold.amount if amount is None else amount
+    if not 0 <= amount <= hold.amount:
+        raise ValueError("commit amount must be between 0 and the held amount")
+    with transaction.atomic():
+        _close_hold(hold, CreditHold.STATUS_COMMITTED, require_unexpired=True)
+        UserCredits.objects.filter(user_id=hold.user_id).update(
+            reserved_credits=F("reserved_credits") - hold.amount,
+            used_credits=F("used_credits") + amount,
+            updated_at=timezone.now(),
+        )
+        invalidate_account_rows(hold.user_id)
+        CreditLedgerEntry.objects.create(
+            user_id=hold.user_id, kind=CreditLedgerEntry.KIND_COMMIT, amount=amount, hold=hold,
+            reference=hold.reference,
+        )
+
+
+def release(hold: CreditHold) -> None:
+    """Cancel a hold and return its credits to the balance."""
+    _return_hold(hold, CreditHold.STATUS_RELEASED, CreditLedgerEntry.KIND_RELEASE)
+
+
+def _return_hold(hold: CreditHold, status: str, kind: str) -> None:
+    with transaction.atomic():
+        _close_hold(hold, status, require_unexpired=False)
+        UserCredits.objects.filter(user_id=hold.user_id).update(
+            reserved_credits=F("reserved_credits") - hold.amount,
+            updated_at=timezone.now(),
+        )
+        invalidate_account_rows(hold.user_id)
+        CreditLedgerEntry.objects.create(
+            user_id=hold.user_id, kind=kind, amount=hold.amount, hold=hold, reference=hold.reference,
+        )
+
+
+def expire_holds(user=None, now=None) -> int:
+    """Return credits of expired holds (optionally for one user). Returns the number expired."""
+    now = now or timezone.now()
+    qs = CreditHold.objects.filter(status=CreditHold.STATUS_HELD, expires_at__lte=now)
+    if user is not None:
+        qs = qs.filter(user_id=_user_id(user))
+    expired = 0
+    for hold in qs:
+        try:
+            _return_hold(hold, CreditHold.STATUS_EXPIRED, CreditLedgerEntry.KIND_EXPIRE)
+            expired += 1
+        except HoldNotActive:
+            # Committed or released concurrently
+            pass
+    if expired:
+        logger.info("Expired %d credit holds.", expired)
+    return expired
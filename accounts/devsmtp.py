@@ -0,0 +1,95 @@
+# accounts/devsmtp.py
+"""
+Minimal local SMTP sink for benchmarks and load tests.
+
+Speaks just enough SMTP (EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT) for
+Django's SMTP email backend. Messages are counted and discarded. An optional
+`connect_delay` emulates the cost of the TCP + STARTTLS handshake of a real
+provider, and `message_delay` the per-message server latency.
+"""
+import socketserver
+import threading
+import time
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+        self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        if server.connect_delay:
+            time.sleep(server.connect_delay)
+        with server.lock:
+            server.connections += 1
+        self._reply("220 localhost devsmtp ready")
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode("ascii", "replace").strip().upper()
+
+            if cmd.startswith("EHLO"):
+                self.wfile.write(b"250-localhost\r\n250-PIPELINING\r\n250 8BITMIME\r\n")
+                self.wfile.flush()
+            elif cmd.startswith("HELO"):
+                self._reply("250 localhost")
+            elif cmd.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self._reply("250 OK")
+            elif cmd == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b".\r\n", b".\n"):
+                        break
+                if server.message_delay:
+                    time.sleep(server.message_delay)
+                with server.lock:
+                    server.messages += 1
+                self._reply("250 OK queued")
+            elif cmd == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class DebugSMTPServer(socketserver.ThreadingTCPServer):
+    """Threaded SMTP sink bound to localhost; use as a context manager."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 connect_delay: float = 0.0, message_delay: float = 0.0):
+        super().__init__((host, port), _SMTPHandler)
+        self.connect_delay = connect_delay
+        self.message_delay = message_delay
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+        self._thread = None
+
+    @property
+    def host(self) -> str:
+        return self.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="devsmtp", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
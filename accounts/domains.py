@@ -0,0 +1,140 @@
+# accounts/domains.py
+"""
+Which email domains count as workspace (company) domains.
+
+Blocked domains are read from a text file (BLOCKED_EMAIL_DOMAINS_FILE), one
+per line, '#' starts a comment:
+
+    gmail.com          blocks exactly gmail.com
+    *.mailinator.com   blocks mailinator.com and every subdomain of it
+
+Exact entries live in a set (one hash lookup). Wildcard entries live in a
+trie keyed by reversed labels (com -> mailinator), so a lookup walks at
+most as many nodes as the address has labels, however many domains are
+listed. Results are memoized per loaded policy.
+
+The file is re-stat()ed at most every EMAIL_DOMAIN_POLICY_CHECK_SECONDS
+and reloaded when its mtime or size changes, so the list can be updated
+without a restart. If the file is missing or unreadable the built-in
+DEFAULT_BLOCKED_DOMAINS (or the last good policy) stays in force.
+"""
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCKED_DOMAINS = ('gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com')
+
+# Marks the end of a wildcard entry in the trie; can't collide with a DNS label
+_END = "*"
+
+
+def normalize_domain(domain: str) -> str:
+    return domain.strip().lower().rstrip(".")
+
+
+class DomainPolicy:
+    def __init__(self, entries: Iterable[str] = DEFAULT_BLOCKED_DOMAINS, memo_size: int = 65536):
+        exact, trie, wildcards = set(), {}, 0
+        for entry in entries:
+            entry = normalize_domain(entry)
+            if entry.startswith("*."):
+                node = trie
+                for label in reversed(entry[2:].split(".")):
+                    node = node.setdefault(label, {})
+                node[_END] = True
+                wildcards += 1
+            elif entry:
+                exact.add(entry)
+        self._exact = frozenset(exact)
+        self._trie = trie
+        self.size = len(self._exact) + wildcards
+        self.is_blocked = lru_cache(maxsize=memo_size)(self._is_blocked)
+
+    @classmethod
+    def from_file(cls, path: Path) -> "DomainPolicy":
+        with open(path, encoding="utf-8") as f:
+            return cls(line.split("#", 1)[0] for line in f)
+
+    def _is_blocked(self, domain: str) -> bool:
+        if domain in self._exact:
+            return True
+        node = self._trie
+        for label in reversed(domain.split(".")):
+            node = node.get(label)
+            if node is None:
+                return False
+            if _END in node:
+                return True
+        return False
+
+    def is_workspace_email(self, email: str) -> bool:
+        return not self.is_blocked(normalize_domain(email.rpartition("@")[2]))
+
+
+class ReloadingPolicy:
+    """A DomainPolicy that follows changes to its file."""
+
+    def __init__(self, path: Optional[Path], check_interval: float = 5.0):
+        self.path = Path(path) if path else None
+        self.check_interval = check_interval
+        self.policy = DomainPolicy()
+        self._signature: Optional[Tuple[float, int]] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+
+    def refresh(self, force: bool = False) -> DomainPolicy:
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return self.policy
+        # One thread stats the file; the rest keep using the current policy meanwhile
+        if not self._lock.acquire(blocking=force):
+            return self.policy
+        try:
+            self._next_check = now + self.check_interval
+            if self.path is None:
+                return self.policy
+            try:
+                stat = os.stat(self.path)
+                signature = (stat.st_mtime, stat.st_size)
+                if signature != self._signature:
+                    self.policy = DomainPolicy.from_file(self.path)
+                    self._signature = signature
+                    logger.info("Loaded %d blocked email domains from %s", self.policy.size, self.path)
+            except OSError as exc:
+                if self._signature is not None or force:
+                    logger.warning("Can't read blocked email domains from %s (%s); keeping %d domains",
+                                   self.path, exc, self.policy.size)
+                self._signature = None
+            return self.policy
+        finally:
+            self._lock.release()
+
+    def is_workspace_email(self, email: str) -> bool:
+        return self.refresh().is_workspace_email(email)
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def get_policy() -> ReloadingPolicy:
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = ReloadingPolicy(getattr(settings, "BLOCKED_EMAIL_DOMAINS_FILE", None),
+                                      getattr(settings, "EMAIL_DOMAIN_POLICY_CHECK_SECONDS", 5))
+        return _policy
+
+
+def is_workspace_email(email):
+    """Check if email is a workspace email (not personal)"""
+    return get_policy().is_workspace_email(email)
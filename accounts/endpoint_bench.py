@@ -0,0 +1,167 @@
+# accounts/endpoint_bench.py
+"""
+Per-endpoint query-count and latency benchmarks.
+
+Each Scenario drives one hot path (login_page, verify_otp, resend_otp,
+complete_profile, profile - all behind ProfileCompletionMiddleware) through
+the Django test client against a seeded dataset. `max_queries` is the query
+ceiling enforced by the tests and by the bench_endpoints command, which also
+records latency percentiles to a JSON baseline and flags regressions.
+"""
+import json
+import random
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from .bench import latency_summary
+from .models import UserCredits, UserOTP, UserProfile
+from .views import LOGIN_QUERY_BUDGET
+
+BENCH_PASSWORD = "bench-pass-123"
+TRANSACTION_CONTROL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE SAVEPOINT")
+
+
+def count_statements(queries) -> int:
+    """Captured queries, ignoring transaction control and savepoints."""
+    return sum(1 for q in queries if not q["sql"].startswith(TRANSACTION_CONTROL))
+
+
+def seed_dataset(users: int = 1000, seed: int = 0) -> Dict[str, List[User]]:
+    """
+    Users shaped like production: most verified with complete profiles,
+    some awaiting OTP verification, some with incomplete profiles.
+    Returns the users grouped by state.
+    """
+    rng = random.Random(seed)
+    password = make_password(BENCH_PASSWORD)  # hashed once, shared by every seeded user
+    User.objects.bulk_create([
+        User(username=f"user{i}@company{i % 200}.com", email=f"user{i}@company{i % 200}.com", password=password)
+        for i in range(users)
+    ], batch_size=500)
+    seeded = list(User.objects.filter(username__startswith="user").order_by("id"))
+
+    groups = {"complete": [], "incomplete": [], "unverified": []}
+    profiles, credits, otps = [], [], []
+    for user in seeded:
+        state = rng.choices(["complete", "incomplete", "unverified"], weights=[85, 10, 5])[0]
+        groups[state].append(user)
+        complete = state != "incomplete"
+        profiles.append(UserProfile(user=user, company_name=f"Company {user.pk % 200}" if complete else "",
+                                    company_size="<50" if complete else ""))
+        credits.append(UserCredits(user=user, total_credits=10, used_credits=rng.randint(0, 10)))
+        otps.append(UserOTP(user=user, is_verified=state != "unverified"))
+    UserProfile.objects.bulk_create(profiles, batch_size=500)
+    UserCredits.objects.bulk_create(credits, batch_size=500)
+    UserOTP.objects.bulk_create(otps, batch_size=500)
+    return groups
+
+
+@dataclass
+class Scenario:
+    name: str
+    max_queries: int
+    # (client, user, iteration) -> response, on a fresh client set up by `prepare`
+    request: Callable
+    prepare: Optional[Callable] = None
+    group: str = "complete"
+
+
+def _logged_in(client, user):
+    client.force_login(user)
+
+
+def _login_post(client, user, i):
+    return client.post("/login/", {"email": user.email, "password": BENCH_PASSWORD, "login_submit": "1"})
+
+
+SCENARIOS = [
+    Scenario("login_page GET", 0, lambda c, u, i: c.get("/login/")),
+    Scenario("login_page POST", LOGIN_QUERY_BUDGET, _login_post),
+    Scenario("verify_otp GET", 2, lambda c, u, i: c.get(f"/verify-otp/?email={u.email}"), group="unverified"),
+    Scenario("verify_otp POST wrong", 2,
+             lambda c, u, i: c.post(f"/verify-otp/?email={u.email}", {"otp": "000000"}), group="unverified"),
+    Scenario("resend_otp", 3, lambda c, u, i: c.get(f"/resend-otp/?email={u.email}"), group="unverified"),
+    Scenario("complete_profile GET", 2, lambda c, u, i: c.get("/complete-profile/"),
+             prepare=_logged_in, group="incomplete"),
+    Scenario("profile GET", 2, lambda c, u, i: c.get("/profile/"), prepare=_logged_in),
+]
+
+
+def run_scenario(scenario: Scenario, users: Dict[str, List[User]], iterations: int = 50) -> Dict[str, float]:
+    """Run one scenario; returns latency percentiles plus the max query count seen."""
+    pool = users[scenario.group]
+    latencies, max_queries = [], 0
+    # The first round is a warm-up (templates, URL resolver, caches) and isn't recorded
+    for i in range(iterations + 1):
+        user = pool[i % len(pool)]
+        client = Client()
+        if scenario.prepare is not None:
+            scenario.prepare(client, user)
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            response = scenario.request(client, user, i)
+            elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise AssertionError(f"{scenario.name}: HTTP {response.status_code}")
+        if i == 0:
+            continue
+        latencies.append(elapsed)
+        max_queries = max(max_queries, count_statements(ctx.captured_queries))
+    summary = latency_summary(latencies)
+    summary["queries"] = max_queries
+    return summary
+
+
+def run_all(users: Dict[str, List[User]], iterations: int = 50) -> Dict[str, Dict[str, float]]:
+    cache.clear()
+    # Every scenario comes from one client IP; measure the endpoints, not the rate limiter
+    with override_settings(RATELIMIT_ENABLED=False):
+        return {scenario.name: run_scenario(scenario, users, iterations) for scenario in SCENARIOS}
+
+
+def compare_to_baseline(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                        tolerance: float = 0.25) -> List[str]:
+    """
+    Regressions of `results` against `baseline`: any query count above the
+    scenario ceiling or the baseline, or p50/p90 slower than baseline by more
+    than `tolerance` (fraction). Returns human-readable messages.
+    """
+    ceilings = {s.name: s.max_queries for s in SCENARIOS}
+    problems = []
+    for name, result in results.items():
+        if result["queries"] > ceilings.get(name, result["queries"]):
+            problems.append(f"{name}: {result['queries']} queries > ceiling {ceilings[name]}")
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["queries"] > base["queries"]:
+            problems.append(f"{name}: {result['queries']} queries > baseline {base['queries']}")
+        for key in ("p50_ms", "p90_ms"):
+            limit = base[key] * (1 + tolerance)
+            if result[key] > limit:
+                problems.append(f"{name}: {key} {result[key]:.2f}ms > {limit:.2f}ms "
+                                f"(baseline {base[key]:.2f}ms + {tolerance:.0%})")
+    return problems
+
+
+def load_baseline(path: Path) -> Dict[str, Dict[str, float]]:
+    try:
+        with open(path) as f:
+            return json.load(f)["scenarios"]
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path: Path, results: Dict[str, Dict[str, float]]):
+    with open(path, "w") as f:
+        json.dump({"scenarios": results}, f, indent=2, sort_keys=True)
+        f.write("\n")
@@ -1,7 +1,6 @@
 from django import forms
 from django.contrib.auth.models import User
 from .models import UserProfile, UserOTP
-import random
 
 
 class LoginForm(forms.Form):
@@ -102,8 +101,3 @@ class OTPVerificationForm(forms.Form):
         if not otp.isdigit():
             raise forms.ValidationError("OTP must contain only numbers.")
         return otp
-
-
-def generate_otp():
-    """Generate a random 6-digit OTP"""
-    return str(random.randint(100000, 999999))
\ No newline at end of file
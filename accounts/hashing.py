@@ -0,0 +1,223 @@
+# accounts/hashing.py
+"""
+Password hashing off the request thread.
+
+PBKDF2 at Django's default iteration count is hundreds of milliseconds of
+pure CPU per call, and with the GIL a hash in one request thread stalls the
+whole worker (or the event loop under ASGI). HashingPool runs hash/verify in
+a bounded process pool instead:
+
+    hash_password(raw) / ahash_password(raw)           -> encoded
+    check_user_password(user, raw) / acheck_user_password(user, raw)
+
+Backpressure: at most PASSWORD_HASHING_MAX_PENDING jobs are queued or running
+per process. A caller waits up to PASSWORD_HASHING_QUEUE_TIMEOUT seconds for
+a slot and then gets HashingBusy, so a login storm is shed with an error
+instead of piling up requests behind the pool. PASSWORD_HASHING_WORKERS = 0
+hashes inline (the old behaviour).
+
+Each web worker process has its own pool, so the host runs (web workers x
+PASSWORD_HASHING_WORKERS) hashing processes; the default is capped at
+DEFAULT_MAX_WORKERS for that reason. Workers are spawned rather than
+forked from a process that already runs background threads, exit when
+their parent does (even if it is killed by a signal, as uvicorn re-raises
+SIGTERM), and a pool broken by a dying worker is replaced.
+"""
+import asyncio
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.connection import wait
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+logger = logging.getLogger(__name__)
+
+# Default pool size per process; the host total is this times the number of web workers
+DEFAULT_MAX_WORKERS = 2
+
+
+class HashingBusy(Exception):
+    """Raised when no hashing slot frees up within the queue timeout."""
+
+
+def init_worker():
+    # Spawned (non-fork) workers import Django from scratch
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    # A pool worker blocks on its call queue forever if the parent dies without shutting the pool down
+    parent = multiprocessing.parent_process()
+    if parent is not None:
+        threading.Thread(target=_exit_with_parent, args=(parent.sentinel,), name="parent-watch", daemon=True).start()
+
+
+def _exit_with_parent(sentinel):
+    wait([sentinel])
+    os._exit(0)
+
+
+def _hash(raw: str) -> str:
+    return make_password(raw)
+
+
+def hash_batch(raws: List[Optional[str]]) -> List[str]:
+    """make_password() for a batch (None gives an unusable password); for bulk jobs in a worker process"""
+    return [make_password(raw) for raw in raws]
+
+
+def _verify(raw: str, encoded: str) -> Tuple[bool, Optional[str]]:
+    """(valid, re-encoded password when the stored hash is outdated)"""
+    upgraded = []
+    valid = check_password(raw, encoded, setter=lambda password: upgraded.append(make_password(password)))
+    return valid, upgraded[0] if upgraded else None
+
+
+class HashingPool:
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 queue_timeout: float = 5.0):
+        self.workers = min(os.cpu_count() or 1, DEFAULT_MAX_WORKERS) if workers is None else workers
+        self.max_pending = max_pending or max(self.workers, 1) * 4
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            # A pool inherited across fork() (e.g. gunicorn --preload) belongs to the parent
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+                self._pid = os.getpid()
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        """Drop a pool broken by a dead worker (OOM kill, segfault); the next call starts a new one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _busy(self) -> HashingBusy:
+        logger.warning("Password hashing pool saturated (%d pending); shedding request", self.max_pending)
+        return HashingBusy(f"{self.max_pending} password hashes already pending")
+
+    def run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise self._busy()
+        try:
+            for retry in (True, False):
+                executor = self._get_executor()
+                try:
+                    return executor.submit(fn, *args).result()
+                except BrokenProcessPool:
+                    self._discard(executor)
+                    if not retry:
+                        raise
+                    logger.warning("Password hashing pool broke (a worker died); retrying in a new pool")
+        finally:
+            self._slots.release()
+
+    async def arun(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        if not self.workers:
+            return await loop.run_in_executor(None, fn, *args)
+        if not self._slots.acquire(blocking=False):
+            # Wait for a slot in a thread so the event loop keeps serving other requests
+            acquiring = loop.run_in_executor(None, self._slots.acquire, True, self.queue_timeout)
+            try:
+                acquired = await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # The thread may still get the slot after the request is gone; give it back when it does
+                acquiring.add_done_callback(self._release_acquired)
+                raise
+            if not acquired:
+                raise self._busy()
+        try:
+            for retry in (True, False):
+                executor = self._get_executor()
+                try:
+                    return await asyncio.wrap_future(executor.submit(fn, *args))
+                except BrokenProcessPool:
+                    self._discard(executor)
+                    if not retry:
+                        raise
+                    logger.warning("Password hashing pool broke (a worker died); retrying in a new pool")
+        finally:
+            self._slots.release()
+
+    def _release_acquired(self, acquiring: asyncio.Future):
+        if not acquiring.cancelled() and acquiring.exception() is None and acquiring.result():
+            self._slots.release()
+
+    def hash(self, raw: str) -> str:
+        return self.run(_hash, raw)
+
+    async def ahash(self, raw: str) -> str:
+        return await self.arun(_hash, raw)
+
+    def verify(self, raw: str, encoded: str) -> Tuple[bool, Optional[str]]:
+        return self.run(_verify, raw, encoded)
+
+    async def averify(self, raw: str, encoded: str) -> Tuple[bool, Optional[str]]:
+        return await self.arun(_verify, raw, encoded)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> HashingPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HashingPool(
+                workers=getattr(settings, "PASSWORD_HASHING_WORKERS", None),
+                max_pending=getattr(settings, "PASSWORD_HASHING_MAX_PENDING", None),
+                queue_timeout=getattr(settings, "PASSWORD_HASHING_QUEUE_TIMEOUT", 5.0),
+            )
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def hash_password(raw: str) -> str:
+    return get_pool().hash(raw)
+
+
+async def ahash_password(raw: str) -> str:
+    return await get_pool().ahash(raw)
+
+
+def check_user_password(user, raw: str) -> bool:
+    """user.check_password() via the pool, including the hash upgrade on success."""
+    valid, upgraded = get_pool().verify(raw, user.password)
+    if upgraded:
+        user.password = upgraded
+        user.save(update_fields=["password"])
+    return valid
+
+
+async def acheck_user_password(user, raw: str) -> bool:
+    valid, upgraded = await get_pool().averify(raw, user.password)
+    if upgraded:
+        user.password = upgraded
+        await user.asave(update_fields=["password"])
+    return valid
@@ -0,0 +1,155 @@
+# accounts/identity.py
+"""
+Request-scoped identity: the user, profile and credits, loaded together.
+
+IdentityMiddleware replaces django.contrib.auth's AuthenticationMiddleware.
+request.user stays lazy, but when it resolves, the user row is fetched with
+its profile, credits and OTP state joined in (select_related), so one query
+serves the ProfileCompletionMiddleware check and the views:
+
+    request.identity.user / .profile / .credits / .otp
+
+A related row that doesn't exist reads as None. Once the rows are in the
+account cache (accounts.account_cache) only the user row itself is read.
+Sessions from backends other than ModelBackend (and its subclasses, e.g.
+allauth's) go through auth.get_user() unchanged, and their related rows
+load lazily on first use.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, load_backend
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from .account_cache import account_cache_enabled, attach_rows, get_account_cache, pack_rows
+
+logger = logging.getLogger(__name__)
+
+RELATED = ("userprofile", "credits", "otp")
+
+
+def _session_verified(request, user) -> bool:
+    # Same session-hash check as auth.get_user(), including SECRET_KEY_FALLBACKS
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    auth_hash = user.get_session_auth_hash()
+    if session_hash and constant_time_compare(session_hash, auth_hash):
+        return True
+    if session_hash and any(constant_time_compare(session_hash, fallback)
+                            for fallback in user.get_session_auth_fallback_hash()):
+        request.session.cycle_key()
+        request.session[HASH_SESSION_KEY] = auth_hash
+        return True
+    request.session.flush()
+    return False
+
+
+def load_user(request):
+    """auth.get_user() with the profile, credits and OTP rows attached in the same query"""
+    try:
+        user_id = User._meta.pk.to_python(request.session[SESSION_KEY])
+        backend_path = request.session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return auth.get_user(request)
+    backend = load_backend(backend_path)
+    if not isinstance(backend, ModelBackend) or type(backend).get_user is not ModelBackend.get_user:
+        return auth.get_user(request)
+
+    user = _fetch_user(user_id)
+    if user is None or not backend.user_can_authenticate(user) or not _session_verified(request, user):
+        return AnonymousUser()
+    return user
+
+
+def _fetch_user(user_id):
+    """The user with its related rows attached: from the account cache when it has them, else joined"""
+    if not account_cache_enabled():
+        return User.objects.select_related(*RELATED).filter(pk=user_id).first()
+
+    loaded = None
+
+    def load():
+        nonlocal loaded
+        loaded = User.objects.select_related(*RELATED).filter(pk=user_id).first()
+        return pack_rows(loaded) if loaded is not None else None
+
+    packed = get_account_cache().get_or_load(user_id, load)
+    if loaded is not None:
+        return loaded
+    # Cache hit (or another thread loaded it): only the user row itself, no joins
+    user = User.objects.filter(pk=user_id).first()
+    if user is not None and packed is not None:
+        attach_rows(user, packed)
+    return user
+
+
+def get_user(request):
+    if not hasattr(request, "_cached_user"):
+        request._cached_user = load_user(request)
+    return request._cached_user
+
+
+class Identity:
+    """The current user and their account rows; nothing is loaded until first use."""
+
+    def __init__(self, request):
+        self._request = request
+
+    @property
+    def user(self):
+        # Follows request.user, so it stays right after login()/logout() replace it
+        return self._request.user
+
+    def _related(self, name):
+        user = self.user
+        if not user.is_authenticated:
+            return None
+        try:
+            return getattr(user, name)
+        except ObjectDoesNotExist:
+            return None
+
+    @property
+    def profile(self):
+        return self._related("userprofile")
+
+    @property
+    def credits(self):
+        return self._related("credits")
+
+    @property
+    def otp(self):
+        return self._related("otp")
+
+    def _load(self):
+        for name in RELATED:
+            self._related(name)
+
+    def _loaded(self) -> bool:
+        user = getattr(self._request, "_cached_user", None)
+        if user is None:
+            return False
+        return not user.is_authenticated or all(getattr(User, name).is_cached(user) for name in RELATED)
+
+    async def aload(self) -> "Identity":
+        """Resolve everything in one thread hop, so async code can read the properties"""
+        if not self._loaded():
+            await sync_to_async(self._load)()
+        return self
+
+
+class IdentityMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware that also attaches request.identity."""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
+        request.identity = Identity(request)
@@ -0,0 +1,298 @@
+# accounts/incremental.py
+"""
+Content-addressed incremental backups.
+
+The database image is split into page-aligned chunks and each chunk is
+stored once under its SHA-256 in a chunk store:
+
+    <outdir>/chunks/ab/ab12...ef        (zlib-compressed chunk)
+    <outdir>/manifests/db_backup_<ts>.json
+
+A manifest lists the chunk hashes of one backup, so an hourly backup of a
+mostly unchanged database only writes the few chunks that changed. Any
+manifest can be restored on its own.
+
+manifests/index.json lists the manifests and, for every stored chunk, how
+many manifests use it. Backups, listing and rotation work from the index
+and never scan the directories; rotation drops old manifests and deletes
+the chunks whose count falls to zero. A whole run holds the backup lock
+(accounts.retention.backup_lock), so a manual backup can't reuse a chunk
+that a concurrent rotation is deleting. If the index is missing it is
+rebuilt from one scan of the manifests.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import zlib
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from .backup import iter_backup_image
+from .retention import INDEX_NAME, Retention, backup_lock, select_retained
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+DEFAULT_CHUNK_PAGES = 16
+
+
+def _chunk_path(store: Path, digest: str) -> Path:
+    return store / digest[:2] / digest
+
+
+def _rechunk(chunks: Iterator[bytes], size: int) -> Iterator[bytes]:
+    """Re-split a byte stream into pieces of exactly `size` bytes (last may be short)."""
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        while len(buf) >= size:
+            yield bytes(buf[:size])
+            del buf[:size]
+    if buf:
+        yield bytes(buf)
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp = path.with_name(path.name + ".part")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _index_path(outdir: Path) -> Path:
+    return Path(outdir) / "manifests" / INDEX_NAME
+
+
+def _manifest_entry(name: str, manifest: dict) -> dict:
+    return {"name": name, "created": manifest["created"], "size": manifest["size"],
+            "sha256": manifest["sha256"], "chunks": len(manifest["chunks"])}
+
+
+def rebuild_incremental_index(outdir: Path) -> dict:
+    """Index the manifests currently in `outdir` and count their chunk references."""
+    backups, chunks = [], {}
+    for p in (Path(outdir) / "manifests").glob("db_backup_*.json"):
+        manifest = load_manifest(p)
+        backups.append(_manifest_entry(p.name, manifest))
+        for digest in set(manifest["chunks"]):
+            chunks[digest] = chunks.get(digest, 0) + 1
+    index = {"backups": backups, "chunks": chunks}
+    if (Path(outdir) / "manifests").is_dir():
+        save_incremental_index(outdir, index)
+    logger.info("Rebuilt incremental backup index for %s (%d manifests)", outdir, len(backups))
+    return index
+
+
+def load_incremental_index(outdir: Path) -> dict:
+    """{"backups": [manifest entries], "chunks": {digest: manifests using it}}"""
+    try:
+        with open(_index_path(outdir)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return rebuild_incremental_index(outdir)
+
+
+def save_incremental_index(outdir: Path, index: dict):
+    _write_atomic(_index_path(outdir), json.dumps(index).encode())
+
+
+def list_manifests(outdir: Path) -> List[Path]:
+    """Manifests in `outdir` according to the index, newest first."""
+    manifests = Path(outdir) / "manifests"
+    if not manifests.is_dir():
+        return []
+    names = sorted((e["name"] for e in load_incremental_index(outdir)["backups"]), reverse=True)
+    return [manifests / name for name in names]
+
+
+def _release_chunks(store: Path, chunks: Dict[str, int], digests) -> int:
+    """Drop one reference to each of `digests`; delete the chunks nothing uses any more."""
+    removed = 0
+    for digest in set(digests):
+        count = chunks.get(digest, 0) - 1
+        if count > 0:
+            chunks[digest] = count
+            continue
+        chunks.pop(digest, None)
+        try:
+            _chunk_path(store, digest).unlink(missing_ok=True)
+            removed += 1
+        except Exception:
+            logger.exception("Failed to remove unreferenced chunk %s", digest)
+    return removed
+
+
+def perform_incremental_backup(base_dir: Path, outdir: Optional[Path] = None, retention: Retention = 168,
+                               chunk_pages: int = DEFAULT_CHUNK_PAGES, level: int = 6,
+                               pages_per_step: int = 0, step_sleep: float = 0.0,
+                               max_bytes_per_sec: Optional[int] = None) -> Optional[Path]:
+    """
+    Store a backup as a manifest of content-addressed chunks.
+
+    - base_dir / outdir / retention: as in accounts.backup.perform_backup
+    - chunk_pages: database pages per chunk
+    - level: zlib level for newly stored chunks
+    - pages_per_step / step_sleep / max_bytes_per_sec: throttled copy, as in perform_backup
+    Returns the path of the new manifest or None on failure.
+    """
+    if outdir is None:
+        outdir = base_dir / "db_backups"
+    store, manifests = outdir / "chunks", outdir / "manifests"
+
+    db_path = base_dir / "db.sqlite3"
+    if not db_path.exists():
+        logger.error("Source DB not found: %s", db_path)
+        return None
+
+    try:
+        manifests.mkdir(parents=True, exist_ok=True)
+        store.mkdir(parents=True, exist_ok=True)
+        with backup_lock(outdir):
+            return _backup_locked(db_path, outdir, retention, chunk_pages, level, pages_per_step=pages_per_step,
+                                  step_sleep=step_sleep, max_bytes_per_sec=max_bytes_per_sec)
+
+    except Exception as exc:
+        logger.exception("Error creating incremental backup: %s", exc)
+        return None
+
+
+def _backup_locked(db_path: Path, outdir: Path, retention: Retention, chunk_pages: int, level: int,
+                   **copy_options) -> Path:
+    store, manifests = outdir / "chunks", outdir / "manifests"
+    index = load_incremental_index(outdir)
+    known = index["chunks"]
+
+    # The image is chunked as it is read (see accounts.backup.iter_database)
+    src_conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+    try:
+        page_size = src_conn.execute("PRAGMA page_size").fetchone()[0]
+        digests, written, new_bytes, size = [], set(), 0, 0
+        image_hash = hashlib.sha256()
+        image = iter_backup_image(src_conn, db_path, manifests / ".snapshot.image", **copy_options)
+        with closing(image):
+            for chunk in _rechunk(image, page_size * chunk_pages):
+                digest = hashlib.sha256(chunk).hexdigest()
+                image_hash.update(chunk)
+                size += len(chunk)
+                digests.append(digest)
+                if digest in known or digest in written:
+                    continue
+                path = _chunk_path(store, digest)
+                # Not in the index; the file may still be left over from a run that died before its manifest
+                if not path.exists():
+                    path.parent.mkdir(exist_ok=True)
+                    data = zlib.compress(chunk, level)
+                    _write_atomic(path, data)
+                    new_bytes += len(data)
+                written.add(digest)
+    finally:
+        src_conn.close()
+
+    # Backups within the same second get a numbered name instead of replacing each other
+    ts = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    taken = {e["name"] for e in index["backups"]}
+    name, n = f"db_backup_{ts}.json", 0
+    while name in taken:
+        n += 1
+        name = f"db_backup_{ts}-{n}.json"
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "created": ts,
+        "page_size": page_size,
+        "chunk_size": page_size * chunk_pages,
+        "size": size,
+        "sha256": image_hash.hexdigest(),
+        "chunks": digests,
+    }
+    _write_atomic(manifests / name, json.dumps(manifest).encode())
+    index["backups"].append(_manifest_entry(name, manifest))
+    for digest in set(digests):
+        known[digest] = known.get(digest, 0) + 1
+    save_incremental_index(outdir, index)
+    logger.info("Incremental backup created: %s (%d/%d chunks new, %d bytes)",
+                manifests / name, len(written), len(digests), new_bytes)
+
+    rotate_incremental(outdir, retention)
+    return manifests / name
+
+
+def load_manifest(path: Path) -> dict:
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version in {path}")
+    return manifest
+
+
+def iter_restore(manifest_path: Path) -> Iterator[bytes]:
+    """Yield the database image described by a manifest, verifying every chunk."""
+    manifest_path = Path(manifest_path)
+    manifest = load_manifest(manifest_path)
+    store = manifest_path.parent.parent / "chunks"
+    image_hash = hashlib.sha256()
+    for digest in manifest["chunks"]:
+        chunk = zlib.decompress(_chunk_path(store, digest).read_bytes())
+        if hashlib.sha256(chunk).hexdigest() != digest:
+            raise ValueError(f"Corrupt chunk {digest}")
+        image_hash.update(chunk)
+        yield chunk
+    if image_hash.hexdigest() != manifest["sha256"]:
+        raise ValueError(f"Restored image does not match {manifest_path}")
+
+
+def restore_incremental(manifest_path: Path, dest: Path) -> Path:
+    """Reassemble the backup described by `manifest_path` into the SQLite file `dest`."""
+    dest = Path(dest)
+    tmp = dest.with_name(dest.name + ".part")
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in iter_restore(manifest_path):
+                f.write(chunk)
+        os.replace(tmp, dest)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return dest
+
+
+def rotate_incremental(outdir: Path, retention: Retention) -> int:
+    """
+    Drop the manifests not selected by `retention` (newest N or a tiered
+    policy, see accounts.retention) and the chunks only they referenced,
+    working from the index. The caller holds backup_lock(outdir). Returns
+    the number of chunks removed.
+    """
+    index = load_incremental_index(outdir)
+    keep = select_retained((e["name"] for e in index["backups"]), retention)
+    store, kept, removed = Path(outdir) / "chunks", [], 0
+    for entry in index["backups"]:
+        if entry["name"] in keep:
+            kept.append(entry)
+            continue
+        path = Path(outdir) / "manifests" / entry["name"]
+        try:
+            digests = load_manifest(path)["chunks"]
+        except FileNotFoundError:
+            logger.warning("Indexed incremental backup %s is missing; dropping it (its chunks are left in place)",
+                           path)
+            continue
+        except Exception:
+            logger.exception("Failed to read old backup %s", path)
+            kept.append(entry)
+            continue
+        try:
+            path.unlink()
+            logger.info("Removed old incremental backup: %s", path)
+        except Exception:
+            logger.exception("Failed to remove old backup %s", path)
+            kept.append(entry)
+            continue
+        removed += _release_chunks(store, index["chunks"], digests)
+    if len(kept) < len(index["backups"]):
+        index["backups"] = kept
+        save_incremental_index(outdir, index)
+    return removed
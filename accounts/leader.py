@@ -0,0 +1,99 @@
+# accounts/leader.py
+"""
+Host-wide leader election for background schedulers.
+
+Every server process (e.g. each gunicorn worker) runs the scheduler thread,
+but only the one holding an exclusive file lock does the work. The lock is
+an OS-level lock (filelock / fcntl), so it is released the moment the leader
+process exits or dies, and another worker picks it up on its next poll.
+
+The time of the last completed run is kept in a small state file next to
+the lock, so a new leader continues the existing schedule instead of
+starting one of its own: exactly one run per interval across the host.
+"""
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from filelock import FileLock, Timeout
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElection:
+    """Non-blocking, process-wide exclusive lock on `lock_path`."""
+
+    def __init__(self, lock_path: Path):
+        self.lock_path = Path(lock_path)
+        self._lock = FileLock(str(self.lock_path), thread_local=False)
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lock.is_locked
+
+    def try_acquire(self) -> bool:
+        if self._lock.is_locked:
+            return True
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            self._lock.acquire(timeout=0)
+        except Timeout:
+            return False
+        logger.info("Process %d is now the scheduler leader (%s)", os.getpid(), self.lock_path)
+        return True
+
+    def release(self):
+        if self._lock.is_locked:
+            self._lock.release(force=True)
+
+
+def read_last_run(state_path: Path) -> float:
+    try:
+        return float(Path(state_path).read_text().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0.0
+
+
+def write_last_run(state_path: Path, ts: float):
+    tmp = Path(state_path).with_name(Path(state_path).name + ".part")
+    tmp.write_text(repr(ts))
+    os.replace(tmp, state_path)
+
+
+def run_as_leader(stop_event: threading.Event, election: LeaderElection, interval: float, poll_interval: float,
+                  state_path: Path, job: Callable[[], None], on_elected: Optional[Callable[[], None]] = None):
+    """
+    Run `job` every `interval` seconds, but only while holding leadership.
+
+    Followers retry the lock every `poll_interval` seconds (keep it at or
+    below `interval` so failover happens within one interval). Returns when
+    `stop_event` is set, releasing leadership.
+    """
+    try:
+        while not stop_event.is_set():
+            if not election.is_leader:
+                if not election.try_acquire():
+                    stop_event.wait(poll_interval)
+                    continue
+                if on_elected is not None:
+                    try:
+                        on_elected()
+                    except Exception:
+                        logger.exception("Leader start-up hook failed.")
+
+            due = read_last_run(state_path) + interval
+            now = time.time()
+            if now >= due:
+                try:
+                    job()
+                except Exception:
+                    logger.exception("Scheduled job failed.")
+                # Recorded even on failure so a broken job doesn't spin
+                write_last_run(state_path, now)
+                continue
+            stop_event.wait(due - now)
+    finally:
+        election.release()
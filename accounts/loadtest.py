@@ -0,0 +1,260 @@
+# accounts/loadtest.py
+"""
+HTTP load generator for the accounts flow, used by the loadtest command.
+
+Each virtual user is a thread with its own keep-alive connection and
+cookie jar, replaying a weighted mix of journeys against a running server:
+
+    profile  - GET /profile/ with a logged-in session
+    login    - GET /login/ (CSRF cookie), POST credentials of a seeded user
+    signup   - signup POST, then the OTP form with the code from the delivered email, then login
+    verify   - verify page + wrong OTP for a seeded unverified user
+
+Results are aggregated per (url name, method) as resolved from
+myproject/urls.py, with latency percentiles, a histogram and error counts.
+"""
+import http.client
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlencode, urlsplit
+
+from django.urls import Resolver404, resolve
+
+from .bench import latency_summary
+from .endpoint_bench import BENCH_PASSWORD
+
+# upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+OTP_IN_EMAIL = re.compile(r"OTP for email verification is: (\d{6})")
+
+# Separator Django's file-based email backend writes after each message
+MESSAGE_SEPARATOR = "-" * 79
+
+DEFAULT_MIX = {"profile": 60, "login": 25, "signup": 10, "verify": 5}
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    """'profile=60,login=25' -> {'profile': 60, 'login': 25}"""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise ValueError(f"Unknown journey '{name.strip()}' (choose from {', '.join(DEFAULT_MIX)})")
+        mix[name.strip()] = int(weight)
+    return mix
+
+
+def url_name(path: str) -> str:
+    try:
+        match = resolve(urlsplit(path).path)
+    except Resolver404:
+        return "unresolved"
+    return match.url_name or match.view_name
+
+
+class LoadStats:
+    """Thread-safe latency and error aggregation per (url name, method)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, key: str, seconds: float, status: Optional[int], ok: bool):
+        with self._lock:
+            self.latencies[key].append(seconds)
+            self.statuses[key][status or "conn-error"] += 1
+            if not ok:
+                self.errors[key] += 1
+
+    def histogram(self, key: str) -> List[int]:
+        counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        for seconds in self.latencies[key]:
+            ms = seconds * 1000
+            index = next((i for i, bound in enumerate(HISTOGRAM_BUCKETS_MS) if ms < bound), len(HISTOGRAM_BUCKETS_MS))
+            counts[index] += 1
+        return counts
+
+    def report(self, elapsed: float) -> Dict[str, dict]:
+        rows = {}
+        for key in sorted(self.latencies):
+            summary = latency_summary(self.latencies[key])
+            summary.update(rps=len(self.latencies[key]) / elapsed, errors=self.errors[key],
+                           error_rate=self.errors[key] / len(self.latencies[key]),
+                           histogram=self.histogram(key), statuses=dict(self.statuses[key]))
+            rows[key] = summary
+        return rows
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, index: int, host: str, port: int, mail_dir: str, users: Dict[str, List[str]],
+                 mix: Dict[str, int], stats: LoadStats, deadline: float, seed: int = 0):
+        super().__init__(name=f"loadtest-vu-{index}", daemon=True)
+        self.index, self.host, self.port, self.mail_dir = index, host, port, Path(mail_dir)
+        self.users, self.stats, self.deadline = users, stats, deadline
+        self.journeys, self.weights = list(mix), list(mix.values())
+        self.rng = random.Random(seed + index)
+        self.conn = None
+        self.cookies = {}
+        self.signups = 0
+
+    # -- HTTP --------------------------------------------------------------
+
+    def request(self, method: str, path: str, form: Optional[dict] = None, expect=(200, 302)) -> Optional[str]:
+        """Send one request, record it, and return the body (None on error)."""
+        headers = {"Host": f"{self.host}:{self.port}"}
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            headers["X-CSRFToken"] = self.cookies.get("csrftoken", "")
+        key = f"{url_name(path)} {method}"
+        start = time.perf_counter()
+        status = None
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            status = response.status
+            for header in response.headers.get_all("Set-Cookie") or []:
+                for name, morsel in SimpleCookie(header).items():
+                    if morsel.value:
+                        self.cookies[name] = morsel.value
+                    else:
+                        self.cookies.pop(name, None)
+        except (OSError, http.client.HTTPException):
+            if self.conn is not None:
+                self.conn.close()
+            self.conn = None
+            data = None
+        self.stats.record(key, time.perf_counter() - start, status, status in expect)
+        return data.decode("utf-8", "replace") if data is not None and status in expect else None
+
+    def fresh_session(self):
+        self.cookies = {}
+        self.request("GET", "/login/")  # sets the CSRF cookie
+
+    def login(self, email: str, password: str = BENCH_PASSWORD):
+        self.fresh_session()
+        self.request("POST", "/login/", {"email": email, "password": password, "login_submit": "1"})
+
+    # -- journeys ----------------------------------------------------------
+
+    def journey_profile(self):
+        if "sessionid" not in self.cookies:
+            self.login(self.rng.choice(self.users["complete"]))
+        self.request("GET", "/profile/")
+
+    def journey_login(self):
+        self.login(self.rng.choice(self.users["complete"]))
+
+    def journey_signup(self):
+        self.signups += 1
+        email = f"lt{self.index}-{self.signups}-{self.rng.randrange(10 ** 9)}@loadtest.io"
+        self.fresh_session()
+        self.request("POST", "/login/?mode=signup", {
+            "email": email, "password": BENCH_PASSWORD, "password_confirm": BENCH_PASSWORD,
+            "company_name": "Load Test Inc", "company_size": "<50", "signup_submit": "1",
+        })
+        otp = self.read_otp(email)
+        if otp is not None:
+            self.request("GET", f"/verify-otp/?email={email}")
+            self.request("POST", f"/verify-otp/?email={email}", {"otp": otp})
+            self.login(email)
+
+    def journey_verify(self):
+        email = self.rng.choice(self.users["unverified"])
+        self.fresh_session()
+        self.request("GET", f"/verify-otp/?email={email}")
+        self.request("POST", f"/verify-otp/?email={email}", {"otp": "000000"}, expect=(200,))
+
+    def read_otp(self, email: str, timeout: float = 10.0) -> Optional[str]:
+        """The OTP mailed to `email`, from the server's file-based mailbox once the outbox has delivered it."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            otp = find_otp(self.mail_dir, email)
+            if otp is not None:
+                return otp
+            time.sleep(0.05)
+        return None
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            journey = self.rng.choices(self.journeys, weights=self.weights)[0]
+            getattr(self, f"journey_{journey}")()
+        if self.conn is not None:
+            self.conn.close()
+
+
+def find_otp(mail_dir: Path, email: str) -> Optional[str]:
+    """The newest OTP sent to `email` in a file-based email backend directory, if any."""
+    for path in sorted(mail_dir.glob("*.log"), key=lambda p: p.stat().st_mtime, reverse=True):
+        for message in reversed(path.read_text(errors="replace").split(MESSAGE_SEPARATOR)):
+            if f"To: {email}\n" in message:
+                match = OTP_IN_EMAIL.search(message)
+                if match:
+                    return match.group(1)
+    return None
+
+
+def load_users(db_path: str) -> Dict[str, List[str]]:
+    """Seeded emails grouped the way the journeys need them."""
+    conn = sqlite3.connect(db_path)
+    try:
+        complete = [r[0] for r in conn.execute(
+            "SELECT u.email FROM auth_user u JOIN accounts_userprofile p ON p.user_id = u.id "
+            "JOIN accounts_userotp o ON o.user_id = u.id "
+            "WHERE p.company_name != '' AND p.company_size != '' AND o.is_verified")]
+        unverified = [r[0] for r in conn.execute(
+            "SELECT u.email FROM auth_user u JOIN accounts_userotp o ON o.user_id = u.id WHERE NOT o.is_verified")]
+    finally:
+        conn.close()
+    return {"complete": complete, "unverified": unverified}
+
+
+def run_load(host: str, port: int, db_path: str, mail_dir: str, concurrency: int, duration: float,
+             mix: Dict[str, int], seed: int = 0) -> Dict[str, dict]:
+    """Drive `concurrency` virtual users for `duration` seconds; returns the per-endpoint report."""
+    users = load_users(db_path)
+    stats = LoadStats()
+    start = time.monotonic()
+    workers = [VirtualUser(i, host, port, mail_dir, users, mix, stats, start + duration, seed)
+               for i in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return stats.report(time.monotonic() - start)
+
+
+def format_histogram(counts: List[int]) -> str:
+    labels = [f"<{b}" for b in HISTOGRAM_BUCKETS_MS] + [f">={HISTOGRAM_BUCKETS_MS[-1]}"]
+    return " ".join(f"{label}ms:{count}" for label, count in zip(labels, counts) if count)
+
+
+def wait_for_server(host: str, port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/login/")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except (OSError, http.client.HTTPException):
+            time.sleep(0.2)
+    raise TimeoutError(f"Server on {host}:{port} did not come up within {timeout:.0f}s")
+
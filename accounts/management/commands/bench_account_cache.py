@@ -0,0 +1,100 @@
+# accounts/management/commands/bench_account_cache.py
+import random
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from accounts import account_cache
+from accounts.account_cache import TieredCache
+from accounts.bench import format_summary, latency_summary, timed
+from accounts.endpoint_bench import seed_dataset
+from accounts.identity import _fetch_user
+from accounts.models import UserProfile
+
+
+def synthetic_trace(users: int, length: int, skew: float, write_ratio: float, seed: int = 0):
+    """Zipf-like trace of ("r" | "w", user index): a few users account for most requests"""
+    rng = random.Random(seed)
+    weights = [1 / (rank ** skew) for rank in range(1, users + 1)]
+    indexes = rng.choices(range(users), weights=weights, k=length)
+    return [("w" if rng.random() < write_ratio else "r", index) for index in indexes]
+
+
+def read_trace(path: Path):
+    """One "r <user index>" or "w <user index>" per line"""
+    trace = []
+    for line in path.read_text().splitlines():
+        if line.strip():
+            op, index = line.split()
+            trace.append((op, int(index)))
+    return trace
+
+
+class Command(BaseCommand):
+    help = ("Replay an access trace of per-user account reads (profile, credits, OTP rows, as loaded by "
+            "IdentityMiddleware) and profile writes against the database only, L2 only and L1 + L2; "
+            "reports latency, hit ratio and evictions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=5000, help="Seeded users.")
+        parser.add_argument("--requests", type=int, default=50000, help="Length of the synthetic trace.")
+        parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of the synthetic trace.")
+        parser.add_argument("--write-ratio", type=float, default=0.01, help="Share of profile writes.")
+        parser.add_argument("--l1-size", type=int, default=1000, help="L1 entries per process.")
+        parser.add_argument("--trace", help="Replay this trace file instead (lines: 'r 17' / 'w 17').")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            groups = seed_dataset(options["users"])
+            user_ids = sorted(user.pk for users in groups.values() for user in users)
+            if options["trace"]:
+                trace = read_trace(Path(options["trace"]))
+                if any(index >= len(user_ids) for _, index in trace):
+                    raise CommandError(f"Trace refers to users beyond the {len(user_ids)} seeded")
+            else:
+                trace = synthetic_trace(len(user_ids), options["requests"], options["skew"], options["write_ratio"])
+            self.stdout.write(f"{len(trace)} requests over {len({i for _, i in trace})} distinct users, "
+                              f"{sum(op == 'w' for op, _ in trace)} writes")
+
+            modes = [
+                ("database (joined query)", None),
+                ("L2 only", TieredCache(alias="accounts", prefix="bench:l2", l1_maxsize=0)),
+                (f"L1 ({options['l1_size']}) + L2",
+                 TieredCache(alias="accounts", prefix="bench:l1l2", l1_maxsize=options["l1_size"])),
+            ]
+            previous = account_cache._cache
+            try:
+                for name, tiered in modes:
+                    self._replay(name, tiered, trace, user_ids)
+            finally:
+                account_cache._cache = previous
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+    def _replay(self, name, tiered, trace, user_ids):
+        account_cache._cache = tiered
+        profiles = {p.user_id: p for p in UserProfile.objects.all()}
+        reads = []
+        with override_settings(ACCOUNT_CACHE_ENABLED=tiered is not None):
+            for op, index in trace:
+                user_id = user_ids[index]
+                if op == "w":
+                    profile = profiles[user_id]
+                    profile.company_size = "<50" if profile.company_size != "<50" else "50-100"
+                    profile.save()
+                    continue
+                with timed(reads):
+                    user = _fetch_user(user_id)
+                    user.userprofile, user.credits
+        line = format_summary(name, latency_summary(reads))
+        if tiered is not None:
+            stats = tiered.stats()
+            line += (f"  hit={stats['hit_ratio']:.1%} l1={stats.get('l1_hits', 0)} l2={stats.get('l2_hits', 0)} "
+                     f"miss={stats.get('misses', 0)} evicted={stats.get('evictions', 0)}")
+        self.stdout.write(line)
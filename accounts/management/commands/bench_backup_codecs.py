@@ -0,0 +1,83 @@
+# accounts/management/commands/bench_backup_codecs.py
+import multiprocessing
+import random
+import resource
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from accounts.backup import available_codecs, perform_backup
+
+
+def _run_backup(base_dir, outdir, codec, level, threads, results):
+    """Child process: one backup, report timing and peak RSS (KiB on Linux)."""
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    archive = perform_backup(Path(base_dir), outdir=Path(outdir), codec=codec, level=level, threads=threads)
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((elapsed, archive.stat().st_size if archive else 0, rss_before, rss_after))
+
+
+def build_synthetic_db(path: Path, size_mb: int):
+    """Users-like table with semi-compressible rows until the file reaches ~size_mb."""
+    rng = random.Random(0)
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, email TEXT, company TEXT, blob BLOB)")
+    target = size_mb * 1024 * 1024
+    i = 0
+    while path.stat().st_size < target:
+        conn.executemany("INSERT INTO t (email, company, blob) VALUES (?, ?, ?)", [
+            (f"user{i + j}@company{(i + j) % 500}.com", f"Company {(i + j) % 500}", rng.randbytes(64) * 4)
+            for j in range(5000)
+        ])
+        conn.commit()
+        i += 5000
+    conn.close()
+
+
+class Command(BaseCommand):
+    help = "Report bytes/sec, compression ratio and peak RSS of the streaming backup for each codec."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--db", help="Existing SQLite file to back up (default: synthetic DB).")
+        parser.add_argument("--size-mb", type=int, default=64, help="Size of the synthetic DB.")
+        parser.add_argument("--zstd-threads", type=int, default=-1)
+
+    def handle(self, *args, **options):
+        work = Path(tempfile.mkdtemp(prefix="bench-backup-"))
+        try:
+            db_path = work / "db.sqlite3"
+            if options["db"]:
+                shutil.copyfile(options["db"], db_path)
+            else:
+                build_synthetic_db(db_path, options["size_mb"])
+            db_size = db_path.stat().st_size
+            self.stdout.write(f"database: {db_size / 1e6:.1f} MB")
+
+            variants = [("gzip", 1, 0), ("gzip", 6, 0), ("gzip", 9, 0), ("lzma", 1, 0), ("lzma", 6, 0)]
+            if "zstd" in available_codecs():
+                variants += [("zstd", 3, 0), ("zstd", 3, options["zstd_threads"]), ("zstd", 19, options["zstd_threads"])]
+            else:
+                self.stdout.write("zstd: skipped (zstandard not installed)")
+
+            ctx = multiprocessing.get_context("fork")
+            for codec, level, threads in variants:
+                outdir = work / f"out-{codec}-{level}-{threads}"
+                results = ctx.Queue()
+                proc = ctx.Process(target=_run_backup, args=(work, outdir, codec, level, threads, results))
+                proc.start()
+                elapsed, size, rss_before, rss_after = results.get()
+                proc.join()
+                shutil.rmtree(outdir, ignore_errors=True)
+                label = f"{codec}-{level}" + (f" x{threads}" if threads else "")
+                self.stdout.write(
+                    f"{label:<14} {db_size / elapsed / 1e6:8.1f} MB/s  ratio {db_size / max(size, 1):5.2f}  "
+                    f"peak RSS {rss_after / 1024:7.1f} MiB (+{(rss_after - rss_before) / 1024:.1f})"
+                )
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
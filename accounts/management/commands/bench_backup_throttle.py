@@ -0,0 +1,80 @@
+# accounts/management/commands/bench_backup_throttle.py
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from accounts.backup import perform_backup
+from accounts.bench import format_summary, latency_summary
+from accounts.management.commands.bench_backup_codecs import build_synthetic_db
+
+
+class Command(BaseCommand):
+    help = ("Measure p99 latency of a concurrent write workload while perform_backup runs, "
+            "with and without step-wise throttling.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size-mb", type=int, default=64)
+        parser.add_argument("--pages-per-step", type=int, default=256)
+        parser.add_argument("--step-sleep", type=float, default=0.01)
+        parser.add_argument("--max-mb-per-sec", type=float, default=0)
+        parser.add_argument("--write-interval-ms", type=float, default=2.0)
+        parser.add_argument("--journal-mode", choices=["wal", "delete"], default="wal")
+
+    def _workload(self, db_path: Path, stop: threading.Event, latencies: list, interval: float):
+        """Small signup-like write transactions, as a request handler would issue them."""
+        conn = sqlite3.connect(str(db_path), timeout=60)
+        conn.execute("CREATE TABLE IF NOT EXISTS w (id INTEGER PRIMARY KEY, email TEXT)")
+        conn.commit()
+        i = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            conn.execute("INSERT INTO w (email) VALUES (?)", (f"w{i}@acme.io",))
+            conn.commit()
+            latencies.append(time.perf_counter() - start)
+            i += 1
+            time.sleep(interval)
+        conn.close()
+
+    def _run(self, base_dir: Path, backup_kwargs):
+        stop, latencies = threading.Event(), []
+        writer = threading.Thread(target=self._workload,
+                                  args=(base_dir / "db.sqlite3", stop, latencies, self.write_interval))
+        writer.start()
+        time.sleep(0.2)
+        start = time.perf_counter()
+        if backup_kwargs is None:
+            time.sleep(2.0)
+        else:
+            perform_backup(base_dir, outdir=base_dir / "out", retention=1, codec="gzip", level=1, **backup_kwargs)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        writer.join()
+        return latencies, elapsed
+
+    def handle(self, *args, **options):
+        self.write_interval = options["write_interval_ms"] / 1000.0
+        base_dir = Path(tempfile.mkdtemp(prefix="bench-throttle-"))
+        try:
+            build_synthetic_db(base_dir / "db.sqlite3", options["size_mb"])
+            conn = sqlite3.connect(str(base_dir / "db.sqlite3"))
+            conn.execute(f"PRAGMA journal_mode={options['journal_mode']}")
+            conn.close()
+            self.stdout.write(f"journal_mode={options['journal_mode']}")
+            max_bps = int(options["max_mb_per_sec"] * 1024 * 1024) or None
+            scenarios = [
+                ("no backup", None),
+                ("one-shot backup", {}),
+                ("throttled backup", {"pages_per_step": options["pages_per_step"],
+                                      "step_sleep": options["step_sleep"],
+                                      "max_bytes_per_sec": max_bps}),
+            ]
+            for label, kwargs in scenarios:
+                latencies, elapsed = self._run(base_dir, kwargs)
+                self.stdout.write(format_summary(label, latency_summary(latencies)) + f"  backup {elapsed:.2f}s")
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
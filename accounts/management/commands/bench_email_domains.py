@@ -0,0 +1,73 @@
+# accounts/management/commands/bench_email_domains.py
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from accounts.domains import DomainPolicy, ReloadingPolicy
+
+
+class Command(BaseCommand):
+    help = ("Measure email-domain policy lookups with a large block list (half exact, half *.wildcard "
+            "entries) against the old linear list scan: load time, uncached and memoized lookups.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--domains", type=int, default=100000)
+        parser.add_argument("--lookups", type=int, default=200000)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        count, lookups = options["domains"], options["lookups"]
+        tlds = ["com", "net", "org", "io", "de", "co.uk", "ru", "xyz"]
+        domains = [f"provider{i}-{rng.randrange(10 ** 6)}.{rng.choice(tlds)}" for i in range(count)]
+        entries = [d if i % 2 else f"*.{d}" for i, d in enumerate(domains)]
+
+        workdir = Path(tempfile.mkdtemp())
+        try:
+            path = workdir / "blocked.txt"
+            path.write_text("\n".join(entries) + "\n")
+            start = time.perf_counter()
+            policy = ReloadingPolicy(path).policy
+            self.stdout.write(f"load {count} domains from file  {(time.perf_counter() - start) * 1000:8.1f} ms")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        # A third each: blocked exact/wildcard domains, subdomains of wildcards, workspace domains
+        emails = []
+        for i in range(lookups):
+            kind = i % 3
+            if kind == 0:
+                emails.append(f"u{i}@{rng.choice(domains)}")
+            elif kind == 1:
+                emails.append(f"u{i}@mx{i % 50}.{domains[rng.randrange(0, count, 2)]}")
+            else:
+                emails.append(f"u{i}@company{rng.randrange(lookups)}.com")
+
+        def run(check, sample):
+            start = time.perf_counter()
+            for email in sample:
+                check(email)
+            return (time.perf_counter() - start) / len(sample) * 1e6
+
+        uncached = DomainPolicy(entries, memo_size=0)
+        self.stdout.write(f"set + trie, uncached           {run(uncached.is_workspace_email, emails):8.2f} us/lookup")
+        policy.is_blocked.cache_clear()
+        hot = emails[:2000]  # a working set of active users
+        run(policy.is_workspace_email, hot)
+        self.stdout.write(f"set + trie, memoized           {run(policy.is_workspace_email, hot * 50):8.2f} us/lookup")
+
+        blocked_list = list(domains)
+
+        def list_scan(email):
+            return email.lower().split("@")[-1] not in blocked_list
+
+        sample = emails[:max(30, lookups // 1000)]
+        self.stdout.write(f"list scan (old)                {run(list_scan, sample):8.2f} us/lookup "
+                          f"(exact matches only, {len(sample)} lookups)")
+
+        wrong = sum(uncached.is_workspace_email(e) != (i % 3 == 2) for i, e in enumerate(emails))
+        self.stdout.write(f"misclassified: {wrong}")
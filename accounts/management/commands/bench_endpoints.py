@@ -0,0 +1,55 @@
+# accounts/management/commands/bench_endpoints.py
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from accounts.bench import format_summary
+from accounts.endpoint_bench import compare_to_baseline, load_baseline, run_all, save_baseline, seed_dataset
+
+DEFAULT_BASELINE = Path(__file__).resolve().parents[2] / "bench_baseline.json"
+
+
+class Command(BaseCommand):
+    help = ("Drive the hot account endpoints through the test client against a seeded test database, "
+            "check query ceilings and compare latency percentiles with a JSON baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000, help="Seeded users.")
+        parser.add_argument("--iterations", type=int, default=100, help="Requests per endpoint.")
+        parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+        parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="Allowed p50/p90 slowdown against the baseline (fraction).")
+        parser.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline.")
+
+    def handle(self, *args, **options):
+        # Run against a throwaway test database, never the real one
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            users = seed_dataset(options["users"])
+            results = run_all(users, options["iterations"])
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        for name, result in results.items():
+            self.stdout.write(format_summary(name, result) + f"  queries={result['queries']}")
+
+        baseline_path = Path(options["baseline"])
+        if options["update_baseline"]:
+            save_baseline(baseline_path, results)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {baseline_path}"))
+            return
+
+        baseline = load_baseline(baseline_path)
+        if not baseline:
+            self.stdout.write(self.style.WARNING(f"No baseline at {baseline_path}; only query ceilings checked."))
+        problems = compare_to_baseline(results, baseline, options["tolerance"])
+        for problem in problems:
+            self.stdout.write(self.style.ERROR(problem))
+        if problems:
+            raise CommandError(f"{len(problems)} endpoint regression(s)")
+        self.stdout.write(self.style.SUCCESS("No regressions."))
@@ -0,0 +1,71 @@
+# accounts/management/commands/bench_incremental_backup.py
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from accounts.backup import perform_backup
+from accounts.incremental import perform_incremental_backup
+from accounts.management.commands.bench_backup_codecs import build_synthetic_db
+
+
+def dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+class Command(BaseCommand):
+    help = ("Compare storage used and backup time of full gzip archives against content-addressed "
+            "incremental backups over a series of hourly-like rounds on a synthetic DB.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size-mb", type=int, default=256)
+        parser.add_argument("--rounds", type=int, default=24)
+        parser.add_argument("--changes", type=int, default=500,
+                            help="Rows inserted and updated between backups (signups / OTP verifications).")
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        work = Path(tempfile.mkdtemp(prefix="bench-incremental-"))
+        try:
+            db_path = work / "db.sqlite3"
+            build_synthetic_db(db_path, options["size_mb"])
+            conn = sqlite3.connect(str(db_path))
+            max_id = conn.execute("SELECT max(id) FROM t").fetchone()[0]
+            self.stdout.write(f"database: {db_path.stat().st_size / 1e6:.1f} MB, {options['rounds']} rounds, "
+                              f"{options['changes']} inserts + updates per round")
+
+            full_dir, inc_dir = work / "full", work / "incremental"
+            full_times, inc_times = [], []
+            for r in range(options["rounds"]):
+                start = time.perf_counter()
+                perform_backup(work, outdir=full_dir, retention=10 ** 6)
+                full_times.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                perform_incremental_backup(work, outdir=inc_dir, retention=10 ** 6)
+                inc_times.append(time.perf_counter() - start)
+
+                # Full archives within the same second share a name; keep them all (manifests get numbered names)
+                for p in full_dir.glob("db_backup_*.gz"):
+                    if "-r" not in p.name:
+                        p.rename(p.with_name(p.name.replace(".sqlite3", f"-r{r:04d}.sqlite3")))
+
+                conn.executemany("INSERT INTO t (email, company, blob) VALUES (?, ?, ?)", [
+                    (f"new{r}-{i}@acme.io", "Acme", rng.randbytes(64) * 4) for i in range(options["changes"])
+                ])
+                conn.executemany("UPDATE t SET company = ? WHERE id = ?", [
+                    (f"Updated {r}", rng.randint(1, max_id)) for _ in range(options["changes"])
+                ])
+                conn.commit()
+            conn.close()
+
+            for label, path, times in (("full gzip", full_dir, full_times),
+                                       ("incremental", inc_dir, inc_times)):
+                self.stdout.write(f"{label:<12} storage {dir_size(path) / 1e6:10.1f} MB   "
+                                  f"avg backup {sum(times) / len(times):6.2f}s   first {times[0]:6.2f}s")
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
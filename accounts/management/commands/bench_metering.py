@@ -0,0 +1,52 @@
+# accounts/management/commands/bench_metering.py
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from accounts.metering import CreditMeter
+from accounts.models import UserCredits
+
+
+class Command(BaseCommand):
+    help = ("Compare usage events/sec of direct per-event UPDATEs on UserCredits against the "
+            "write-behind CreditMeter. Runs inside a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=20000)
+        parser.add_argument("--users", type=int, default=200)
+
+    def handle(self, *args, **options):
+        events, n_users = options["events"], options["users"]
+        rng = random.Random(42)
+
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(username=f"bench-meter-{i}@example.com", email=f"bench-meter-{i}@example.com")
+                for i in range(n_users)
+            ])
+            UserCredits.objects.bulk_create([UserCredits(user=u, total_credits=10 ** 9) for u in users])
+            trace = [rng.choice(users).pk for _ in range(events)]
+
+            start = time.perf_counter()
+            for user_id in trace:
+                UserCredits.objects.filter(user_id=user_id).update(used_credits=F("used_credits") + 1)
+            direct = time.perf_counter() - start
+
+            meter = CreditMeter()
+            start = time.perf_counter()
+            for user_id in trace:
+                meter.record(user_id)
+            flushed = meter.flush()
+            metered = time.perf_counter() - start
+
+            total_used = sum(UserCredits.objects.filter(user__in=users).values_list("used_credits", flat=True))
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"direct per-event UPDATE : {events / direct:12.0f} events/s")
+        self.stdout.write(f"write-behind meter      : {events / metered:12.0f} events/s "
+                          f"(incl. flush of {flushed} users)")
+        self.stdout.write(f"consistency check       : used_credits total {total_used} == {2 * events}")
@@ -0,0 +1,45 @@
+# accounts/management/commands/bench_otp_email.py
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.bench import format_summary, latency_summary, timed
+from accounts.devsmtp import DebugSMTPServer
+from accounts.outbox import enqueue_email
+
+
+class Command(BaseCommand):
+    help = ("Compare request-path latency of sending an OTP email synchronously over SMTP "
+            "against enqueueing it in the outbox, using a local stand-in SMTP server.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument("--handshake-ms", type=float, default=150.0,
+                            help="Simulated TCP+STARTTLS handshake cost per SMTP connection.")
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        subject, body = "Email Verification - Your OTP", "Your OTP for email verification is: 123456"
+
+        with DebugSMTPServer(connect_delay=options["handshake_ms"] / 1000.0) as smtp:
+            sync_latencies = []
+            for i in range(iterations):
+                with timed(sync_latencies):
+                    connection = get_connection(
+                        "django.core.mail.backends.smtp.EmailBackend",
+                        host=smtp.host, port=smtp.port, use_tls=False,
+                        username="", password="",
+                    )
+                    EmailMessage(subject, body, "noreply@dashboard.com",
+                                 [f"bench{i}@example.com"], connection=connection).send()
+
+        # Enqueue path: one INSERT, rolled back so the bench leaves no rows behind
+        outbox_latencies = []
+        with transaction.atomic():
+            for i in range(iterations):
+                with timed(outbox_latencies):
+                    enqueue_email(subject, body, f"bench{i}@example.com")
+            transaction.set_rollback(True)
+
+        self.stdout.write(format_summary("sync send_mail", latency_summary(sync_latencies)))
+        self.stdout.write(format_summary("outbox enqueue", latency_summary(outbox_latencies)))
@@ -0,0 +1,69 @@
+# accounts/management/commands/bench_password_hashing.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.management.base import BaseCommand
+
+from accounts.bench import format_summary, latency_summary
+from accounts.hashing import HashingPool
+
+
+def probe(stop: threading.Event, delays: list, interval: float = 0.005):
+    """Stand-in for the other requests in the worker: small Python work every `interval`, recording its delay."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        time.sleep(interval)
+        sum(range(2000))
+        delays.append(time.perf_counter() - start - interval)
+
+
+class Command(BaseCommand):
+    help = ("Measure password logins/sec (hash verification with the configured hasher) issued from "
+            "concurrent request threads: inline in the thread vs. the accounts.hashing process pool "
+            "with 1, 4 and N worker processes. Also reports how long other (non-login) work in the same "
+            "process is delayed while the logins run.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=200, help="Verifications per configuration.")
+        parser.add_argument("--concurrency", type=int, default=16, help="Concurrent request threads.")
+        parser.add_argument("--workers", default=None,
+                            help="Comma-separated pool sizes to try (default: 1,4,<cpu count>).")
+
+    def handle(self, *args, **options):
+        total, concurrency = options["logins"], options["concurrency"]
+        cpus = os.cpu_count() or 1
+        sizes = ([int(w) for w in options["workers"].split(",")] if options["workers"]
+                 else sorted({1, 4, cpus}))
+        encoded = make_password("bench-pass-123")
+        self.stdout.write(f"hasher {identify_hasher(encoded).algorithm}, {cpus} CPUs, "
+                          f"{concurrency} request threads, {total} logins per run")
+
+        for workers in [0] + sizes:
+            pool = HashingPool(workers=workers, max_pending=concurrency, queue_timeout=600)
+            pool.verify("warm-up", encoded)  # start the worker processes outside the measurement
+            latencies = []
+
+            def login(i):
+                start = time.perf_counter()
+                valid, _upgraded = pool.verify("bench-pass-123", encoded)
+                latencies.append(time.perf_counter() - start)
+                return valid
+
+            stop, delays = threading.Event(), []
+            prober = threading.Thread(target=probe, args=(stop, delays), daemon=True)
+            prober.start()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                ok = sum(executor.map(login, range(total)))
+            elapsed = time.perf_counter() - start
+            stop.set()
+            prober.join()
+            pool.shutdown()
+
+            label = "inline (request thread)" if not workers else f"pool, {workers} worker(s)"
+            self.stdout.write(f"{label:<24} {total / elapsed:8.1f} logins/s  ({ok}/{total} valid)")
+            self.stdout.write("    " + format_summary("login latency", latency_summary(latencies)))
+            self.stdout.write("    " + format_summary("other work delayed by", latency_summary(delays)))
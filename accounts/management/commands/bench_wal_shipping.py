@@ -0,0 +1,73 @@
+# accounts/management/commands/bench_wal_shipping.py
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from accounts.bench import format_summary, latency_summary
+from accounts.walship import WALShipper, restore
+
+
+class Command(BaseCommand):
+    help = "Measure write latency in WAL mode with and without the WAL shipper running, and replica lag."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=float, default=5.0)
+        parser.add_argument("--interval", type=float, default=0.5, help="Shipper sync interval.")
+        parser.add_argument("--checkpoint-kb", type=int, default=1024)
+
+    def _workload(self, db_path: Path, seconds: float):
+        """Signup-like single-row write transactions."""
+        conn = sqlite3.connect(str(db_path), timeout=60)
+        conn.execute("PRAGMA wal_autocheckpoint=0")
+        latencies, deadline, i = [], time.perf_counter() + seconds, 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            conn.execute("INSERT INTO w (email, blob) VALUES (?, ?)", (f"w{i}@acme.io", b"x" * 200))
+            conn.commit()
+            latencies.append(time.perf_counter() - start)
+            i += 1
+        rows = conn.execute("SELECT count(*) FROM w").fetchone()[0]
+        conn.close()
+        return latencies, rows
+
+    def handle(self, *args, **options):
+        work = Path(tempfile.mkdtemp(prefix="bench-walship-"))
+        try:
+            for label, ship in (("wal, no shipping", False), ("wal + shipper", True)):
+                db_path = work / f"{int(ship)}.sqlite3"
+                conn = sqlite3.connect(str(db_path))
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("CREATE TABLE w (id INTEGER PRIMARY KEY, email TEXT, blob BLOB)")
+                conn.close()
+
+                shipper = None
+                if ship:
+                    shipper = WALShipper(db_path, work / "replica", interval=options["interval"],
+                                         checkpoint_bytes=options["checkpoint_kb"] * 1024)
+                    shipper.sync()
+                    thread = threading.Thread(target=shipper.run, daemon=True)
+                    thread.start()
+                else:
+                    # Without a shipper SQLite checkpoints on its own
+                    sqlite3.connect(str(db_path)).execute("PRAGMA wal_autocheckpoint=1000").close()
+
+                latencies, rows = self._workload(db_path, options["seconds"])
+                self.stdout.write(format_summary(label, latency_summary(latencies)) + f"  rows {rows}")
+
+                if shipper is not None:
+                    start = time.perf_counter()
+                    shipper.stop()
+                    self.stdout.write(f"final sync {time.perf_counter() - start:.3f}s")
+                    start = time.perf_counter()
+                    restored = restore(work / "replica", work / "restored.sqlite3")
+                    check = sqlite3.connect(str(restored))
+                    restored_rows = check.execute("SELECT count(*) FROM w").fetchone()[0]
+                    check.close()
+                    self.stdout.write(f"restore {time.perf_counter() - start:.3f}s, rows {restored_rows}/{rows}")
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
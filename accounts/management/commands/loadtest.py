@@ -0,0 +1,125 @@
+# accounts/management/commands/loadtest.py
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import textwrap
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.loadtest import DEFAULT_MIX, format_histogram, parse_mix, run_load, wait_for_server
+
+OVERLAY_SETTINGS = """\
+from {base} import *  # noqa
+from pathlib import Path
+
+# Throwaway SQLite DB; mail is delivered to files, where the load generator reads the OTPs
+BASE_DIR = Path({work!r})
+DATABASES = {{"default": {{"ENGINE": "django.db.backends.sqlite3", "NAME": {db!r}, "OPTIONS": {{"timeout": 30}}}}}}
+EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
+EMAIL_FILE_PATH = {mail_dir!r}
+EMAIL_OUTBOX_DISPATCH = "thread"
+DEBUG = False
+BACKUP_WAL_SHIPPING = False
+RATELIMIT_ENABLED = False  # all virtual users share one IP
+ACCOUNTS_ASYNC_VIEWS = {async_views}
+"""
+
+SEED = "import django; django.setup(); from accounts.endpoint_bench import seed_dataset; seed_dataset({users})"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = ("Boot the project under uvicorn (ASGI) or gunicorn (WSGI) against a seeded SQLite DB with a file-based "
+            "email backend, replay signup/verify/login/profile traffic and report per-URL throughput, "
+            "latency histograms and error rates.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--server", choices=["uvicorn", "gunicorn"], default="uvicorn")
+        parser.add_argument("--workers", type=int, default=1, help="Server worker processes.")
+        parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker (gthread).")
+        parser.add_argument("--concurrency", type=int, default=16, help="Concurrent virtual users.")
+        parser.add_argument("--duration", type=float, default=20.0, help="Seconds of traffic.")
+        parser.add_argument("--users", type=int, default=2000, help="Seeded users.")
+        parser.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+                            help="Journey weights, e.g. profile=60,login=25,signup=10,verify=5.")
+        parser.add_argument("--views", choices=["sync", "async"], default="sync",
+                            help="Serve the accounts flow from accounts.views or accounts.async_views.")
+        parser.add_argument("--json", help="Also write the report to this file.")
+        parser.add_argument("--keep", action="store_true", help="Keep the temporary DB and settings.")
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options["mix"])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        work = Path(tempfile.mkdtemp(prefix="loadtest-"))
+        db_path, mail_dir = work / "db.sqlite3", work / "mail"
+        mail_dir.mkdir()
+        (work / "loadtest_settings.py").write_text(OVERLAY_SETTINGS.format(
+            base=settings.SETTINGS_MODULE, work=str(work), db=str(db_path), mail_dir=str(mail_dir),
+            async_views=options["views"] == "async"))
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE="loadtest_settings",
+                   PYTHONPATH=os.pathsep.join([str(work), str(settings.BASE_DIR), os.environ.get("PYTHONPATH", "")]))
+        server = None
+        try:
+            self.stdout.write(f"Seeding {options['users']} users into {db_path} ...")
+            manage = str(Path(settings.BASE_DIR) / "manage.py")
+            subprocess.run([sys.executable, manage, "migrate", "--noinput", "-v0"], env=env, check=True)
+            subprocess.run([sys.executable, "-c", SEED.format(users=options["users"])], env=env, check=True)
+            # WAL so the server's readers and the outbox dispatcher don't block its writes
+            subprocess.run([sys.executable, "-c", f"import sqlite3; sqlite3.connect({str(db_path)!r})"
+                            ".execute('PRAGMA journal_mode=WAL')"], check=True)
+
+            port = free_port()
+            if options["server"] == "uvicorn":
+                cmd = [sys.executable, "-m", "uvicorn", "myproject.asgi:application", "--host", "127.0.0.1",
+                       "--port", str(port), "--workers", str(options["workers"]), "--log-level", "warning",
+                       "--no-access-log"]
+            else:
+                cmd = [sys.executable, "-m", "gunicorn", "myproject.wsgi:application", "-b", f"127.0.0.1:{port}",
+                       "-w", str(options["workers"]), "-k", "gthread", "--threads", str(options["threads"]),
+                       "--log-level", "warning"]
+            server = subprocess.Popen(cmd, env=env, cwd=str(settings.BASE_DIR))
+            wait_for_server("127.0.0.1", port)
+
+            self.stdout.write(f"{options['server']} x{options['workers']} ({options['views']} views) on :{port}, "
+                              f"{options['concurrency']} virtual users for {options['duration']:.0f}s, mix {mix}")
+            report = run_load("127.0.0.1", port, str(db_path), str(mail_dir), options["concurrency"],
+                              options["duration"], mix)
+        except subprocess.CalledProcessError as exc:
+            raise CommandError(f"Setup failed: {exc}")
+        finally:
+            if server is not None:
+                server.terminate()
+                try:
+                    server.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+            if not options["keep"]:
+                shutil.rmtree(work, ignore_errors=True)
+
+        total = sum(row["count"] for row in report.values())
+        errors = sum(row["errors"] for row in report.values())
+        self.stdout.write(f"\n{'endpoint':<24} {'req/s':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'errors':>8}")
+        for key, row in report.items():
+            self.stdout.write(f"{key:<24} {row['rps']:8.1f} {row['p50_ms']:7.1f}ms {row['p90_ms']:7.1f}ms "
+                              f"{row['p99_ms']:7.1f}ms {row['error_rate']:7.1%}")
+            self.stdout.write("    " + textwrap.shorten(format_histogram(row["histogram"]), 100))
+            if row["errors"]:
+                self.stdout.write(self.style.WARNING(f"    statuses: {row['statuses']}"))
+        self.stdout.write(f"\ntotal {total} requests, {sum(r['rps'] for r in report.values()):.1f} req/s, "
+                          f"error rate {errors / max(total, 1):.2%}")
+        if options["json"]:
+            Path(options["json"]).write_text(json.dumps(report, indent=2, default=str))
@@ -0,0 +1,49 @@
+# accounts/management/commands/provision_users.py
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.provisioning import COMPANY_SIZES, iter_rows, provision
+
+
+class Command(BaseCommand):
+    help = ("Bulk-create users (with profile, credits and verification state) from a CSV or XLSX file. "
+            "Columns: email, password, first_name, last_name, company_name, company_size, credits; "
+            "only email is required.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or XLSX file with a header row.")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Users per transaction.")
+        parser.add_argument("--workers", type=int, default=None, help="Hashing processes (default: CPU count).")
+        parser.add_argument("--company-name", default="", help="Default for rows without company_name.")
+        parser.add_argument("--company-size", default="", choices=("",) + COMPANY_SIZES,
+                            help="Default for rows without company_size.")
+        parser.add_argument("--credits", type=int, default=10, help="Default for rows without credits.")
+        parser.add_argument("--unverified", action="store_true",
+                            help="Require users to verify their email with an OTP (emailed to them) before logging in.")
+        parser.add_argument("--dry-run", action="store_true", help="Validate and hash, but write nothing.")
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.is_file():
+            raise CommandError(f"No such file: {path}")
+        defaults = {"company_name": options["company_name"], "company_size": options["company_size"],
+                    "credits": options["credits"]}
+
+        def progress(report):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"  {report.created} users from {report.rows} rows")
+
+        report = provision(iter_rows(path), chunk_size=options["chunk_size"], workers=options["workers"],
+                           verified=not options["unverified"], defaults=defaults, dry_run=options["dry_run"],
+                           progress=progress)
+
+        verb = "Would create" if options["dry_run"] else "Created"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {report.created} users from {report.rows} rows in {report.seconds:.1f}s "
+            f"({report.users_per_second:.0f} users/s)"))
+        if report.skipped:
+            self.stdout.write(self.style.WARNING(
+                "Skipped " + ", ".join(f"{n} {reason}" for reason, n in report.skipped.most_common())))
+            for example in report.examples:
+                self.stdout.write(f"  {example}")
@@ -0,0 +1,53 @@
+# accounts/management/commands/restore_db.py
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from accounts.restore import find_backups, restore_backup
+
+
+class Command(BaseCommand):
+    help = ("Restore the SQLite database from a backup archive or incremental manifest. "
+            "The backup is decompressed and checked before it is swapped in atomically. Stop the app first.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("backup", nargs="?", help="Archive or manifest to restore.")
+        parser.add_argument("--latest", action="store_true", help="Restore the newest backup in --dir.")
+        parser.add_argument("--dir", help="Backup directory (default: BASE_DIR/db_backups).")
+        parser.add_argument("--target", help="Database file to replace (default: the default DATABASES entry).")
+        parser.add_argument("--no-verify", action="store_true", help="Skip quick_check before swapping in.")
+        parser.add_argument("--discard-old", action="store_true",
+                            help="Don't keep the replaced database as <db>.pre-restore-<ts>.")
+
+    def handle(self, *args, **options):
+        if options["backup"]:
+            backup = Path(options["backup"])
+        elif options["latest"]:
+            backup_dir = Path(options["dir"]) if options["dir"] else Path(settings.BASE_DIR) / "db_backups"
+            backups = find_backups(backup_dir)
+            if not backups:
+                raise CommandError(f"No backups found in {backup_dir}")
+            backup = backups[0]
+        else:
+            raise CommandError("Give a backup path or --latest.")
+        if not backup.exists():
+            raise CommandError(f"{backup} does not exist.")
+
+        if options["target"]:
+            target = Path(options["target"])
+        else:
+            db = connections["default"]
+            if db.vendor != "sqlite":
+                raise CommandError("The default database is not SQLite; pass --target.")
+            target = Path(db.settings_dict["NAME"])
+            db.close()
+
+        try:
+            old = restore_backup(backup, target, verify=not options["no_verify"], keep_old=not options["discard_old"])
+        except Exception as exc:
+            raise CommandError(f"Restore failed: {exc}")
+        if old:
+            self.stdout.write(f"Previous database kept as {old}")
+        self.stdout.write(self.style.SUCCESS(f"Restored {target} from {backup}"))
@@ -0,0 +1,47 @@
+# accounts/management/commands/restore_wal.py
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.walship import list_points, restore
+
+
+class Command(BaseCommand):
+    help = "Rebuild the SQLite database from the WAL-shipping replica, optionally as of a point in time."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--replica", help="Replica directory (default: BACKUP_WAL_REPLICA_DIR).")
+        parser.add_argument("--output", required=True, help="Where to write the restored database.")
+        parser.add_argument("--to", dest="timestamp",
+                            help="Restore as of this UTC time (ISO 8601, e.g. 2024-05-01T12:30:00). Default: latest.")
+        parser.add_argument("--list", action="store_true", help="List restorable points and exit.")
+
+    def handle(self, *args, **options):
+        replica = Path(options["replica"] or getattr(settings, "BACKUP_WAL_REPLICA_DIR",
+                                                      Path(settings.BASE_DIR) / "db_replica"))
+        if options["list"]:
+            for generation, index, offset, ts_ms, path in list_points(replica):
+                when = datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).isoformat(timespec="milliseconds")
+                self.stdout.write(f"{when}  {generation}  {path.name}")
+            return
+
+        timestamp = None
+        if options["timestamp"]:
+            try:
+                when = datetime.fromisoformat(options["timestamp"])
+            except ValueError:
+                raise CommandError(f"Invalid --to timestamp: {options['timestamp']}")
+            if when.tzinfo is None:
+                when = when.replace(tzinfo=timezone.utc)
+            timestamp = when.timestamp()
+
+        output = Path(options["output"])
+        if output.exists():
+            raise CommandError(f"{output} already exists; refusing to overwrite it.")
+        try:
+            restore(replica, output, timestamp=timestamp)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"Restored database written to {output}"))
@@ -0,0 +1,39 @@
+# accounts/management/commands/run_outbox.py
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from accounts.outbox import OutboxDispatcher, dispatch_pending, purge_finished
+
+
+class Command(BaseCommand):
+    help = ("Deliver queued outbox email (OTP codes etc.) until stopped with SIGTERM/Ctrl-C. Run one of these "
+            "alongside the web servers when EMAIL_OUTBOX_DISPATCH = 'command'.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true",
+                            help="Deliver what is due now and purge old sent/failed rows, then exit.")
+        parser.add_argument("--workers", type=int, help="Concurrent SMTP sends (default EMAIL_OUTBOX_WORKERS).")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            sent = 0
+            while True:
+                claimed = dispatch_pending()
+                if not claimed:
+                    break
+                sent += claimed
+            self.stdout.write(f"Processed {sent} outbox emails, purged {purge_finished()} old ones.")
+            return
+
+        dispatcher = OutboxDispatcher(threading.Event(), workers=options["workers"])
+        signal.signal(signal.SIGTERM, lambda signum, frame: dispatcher.stop_event.set())
+        dispatcher.start()
+        try:
+            while dispatcher.is_alive() and not dispatcher.stop_event.is_set():
+                dispatcher.join(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            dispatcher.stop(timeout=30)
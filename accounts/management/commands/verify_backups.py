@@ -0,0 +1,50 @@
+# accounts/management/commands/verify_backups.py
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.restore import find_backups, verify_backups
+
+
+class Command(BaseCommand):
+    help = ("Decompress every retained backup in parallel and run PRAGMA integrity_check "
+            "(or quick_check) on it, reporting per-archive timing.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", help="Specific archives/manifests (default: all in --dir).")
+        parser.add_argument("--dir", help="Backup directory (default: BASE_DIR/db_backups).")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes.")
+        parser.add_argument("--quick", action="store_true", help="Use quick_check instead of integrity_check.")
+        parser.add_argument("--limit", type=int, help="Only check the newest N backups.")
+        parser.add_argument("--workdir", help="Scratch directory for decompressed copies (default: system temp).")
+
+    def handle(self, *args, **options):
+        if options["paths"]:
+            paths = [Path(p) for p in options["paths"]]
+        else:
+            backup_dir = Path(options["dir"]) if options["dir"] else Path(settings.BASE_DIR) / "db_backups"
+            paths = find_backups(backup_dir)[:options["limit"]]
+        if not paths:
+            raise CommandError("No backups found.")
+
+        self.stdout.write(f"Verifying {len(paths)} backup(s) with {options['workers']} worker(s)...")
+        start = time.perf_counter()
+        failed, total_bytes = [], 0
+        for result in verify_backups(paths, workers=options["workers"], quick=options["quick"],
+                                     workdir=options["workdir"]):
+            total_bytes += result["size"]
+            line = (f"{Path(result['path']).name:<40} {result['size'] / 1e6:9.1f} MB "
+                    f"{result['seconds']:7.2f}s  {result['result']}")
+            if result["ok"]:
+                self.stdout.write(line)
+            else:
+                failed.append(result["path"])
+                self.stdout.write(self.style.ERROR(line))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{len(paths) - len(failed)}/{len(paths)} ok in {elapsed:.1f}s "
+                          f"({total_bytes / 1e6 / max(elapsed, 1e-9):.1f} MB/s decompressed)")
+        if failed:
+            raise CommandError(f"{len(failed)} backup(s) failed verification.")
@@ -0,0 +1,147 @@
+# accounts/metering.py
+"""
+Write-behind credit metering.
+
+High-frequency usage events are counted per user in memory and applied to
+UserCredits.used_credits in periodic batched UPDATEs (one statement per
+chunk of users, using CASE/WHEN) instead of one UPDATE per event.
+
+Metered usage is not balance-checked at record time; use accounts.credits
+when a debit must be refused if the user lacks credits. Usage of users with
+no UserCredits row by flush time (e.g. deleted since) is logged and dropped.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .account_cache import invalidate_account_rows
+from .models import CreditLedgerEntry, UserCredits
+
+logger = logging.getLogger(__name__)
+
+
+class CreditMeter:
+    """Thread-safe in-memory aggregator of per-user credit usage."""
+
+    def __init__(self, flush_interval: Optional[float] = None, max_staleness: Optional[float] = None,
+                 max_pending: Optional[int] = None, chunk_size: Optional[int] = None):
+        self.flush_interval = flush_interval or getattr(settings, "CREDIT_METER_FLUSH_INTERVAL_SECONDS", 5)
+        self.max_staleness = max_staleness or getattr(settings, "CREDIT_METER_MAX_STALENESS_SECONDS", 30)
+        self.max_pending = max_pending or getattr(settings, "CREDIT_METER_MAX_PENDING_USERS", 1000)
+        self.chunk_size = chunk_size or getattr(settings, "CREDIT_METER_FLUSH_CHUNK_SIZE", 500)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[int, int] = {}
+        self._oldest: Optional[float] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, user, amount: int = 1) -> None:
+        """Count `amount` credits of usage for `user` (a User or user id)."""
+        user_id = getattr(user, "pk", user)
+        with self._lock:
+            self._pending[user_id] = self._pending.get(user_id, 0) + amount
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            due = (len(self._pending) >= self.max_pending
+                   or time.monotonic() - self._oldest >= self.max_staleness)
+        if due:
+            self._wake.set()
+
+    def pending(self) -> Dict[int, int]:
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self) -> int:
+        """Apply all pending deltas to the database. Returns the number of users flushed."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending, self._oldest = self._pending, {}, None
+            batch = {user_id: delta for user_id, delta in batch.items() if delta}
+            if not batch:
+                return 0
+
+            dropped = []
+            try:
+                items = list(batch.items())
+                with transaction.atomic():
+                    for i in range(0, len(items), self.chunk_size):
+                        dropped += self._apply(items[i:i + self.chunk_size])
+            except Exception:
+                # Put the deltas back so nothing is lost; the next flush retries them
+                with self._lock:
+                    for user_id, delta in batch.items():
+                        self._pending[user_id] = self._pending.get(user_id, 0) + delta
+                    self._oldest = self._oldest or time.monotonic()
+                raise
+            if dropped:
+                logger.warning("Dropped metered usage of %d user(s) with no credits row: %s",
+                               len(dropped), sorted(dropped))
+            return len(batch) - len(dropped)
+
+    @staticmethod
+    def _apply(items):
+        """
+        One UPDATE for a chunk of users, plus one bulk ledger INSERT for the
+        users it actually charged. Returns the user ids it couldn't charge.
+        """
+        user_ids = [user_id for user_id, _ in items]
+        UserCredits.objects.filter(user_id__in=user_ids).update(
+            used_credits=F("used_credits") + Case(
+                *[When(user_id=user_id, then=Value(delta)) for user_id, delta in items],
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            updated_at=timezone.now(),
+        )
+        # The UPDATE holds the rows' write locks, so these are exactly the users it charged
+        charged = set(UserCredits.objects.filter(user_id__in=user_ids).values_list("user_id", flat=True))
+        invalidate_account_rows(*user_ids)
+        CreditLedgerEntry.objects.bulk_create([
+            CreditLedgerEntry(user_id=user_id, kind=CreditLedgerEntry.KIND_CONSUME, amount=delta, reference="metered")
+            for user_id, delta in items if user_id in charged
+        ])
+        return [user_id for user_id in user_ids if user_id not in charged]
+
+    def _run(self):
+        logger.info("Credit meter flusher started (interval %ss).", self.flush_interval)
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Credit meter flush failed.")
+            finally:
+                close_old_connections()
+        logger.info("Credit meter flusher stopped.")
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="accounts-credit-meter", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        """Stop the flusher thread and flush whatever is still pending."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        self.flush()
+
+
+# Process-wide meter; AccountsConfig.ready starts its flusher and flushes it at exit
+meter = CreditMeter()
+
+
+def record_usage(user, amount: int = 1) -> None:
+    meter.record(user, amount)
@@ -1,26 +1,126 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.shortcuts import redirect
 from .models import UserProfile
 
 
+PROFILE_COMPLETE_CACHE_KEY = "accounts:profile_complete:{user_id}"
+PROFILE_COMPLETE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Set once a user is known to have a profile and credits (see signals.ensure_user_records)
+PROVISIONED_CACHE_KEY = "accounts:provisioned:{user_id}"
+PROVISIONED_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def profile_completion_cache_key(user_id):
+    return PROFILE_COMPLETE_CACHE_KEY.format(user_id=user_id)
+
+
+def _loaded_profile_complete(user):
+    """Completeness from a profile loaded along with the user (accounts.identity), else None"""
+    if not User.userprofile.is_cached(user):
+        return None
+    try:
+        return user.userprofile.is_complete
+    except UserProfile.DoesNotExist:
+        return False
+
+
+def is_profile_complete(user):
+    """Return whether the user's profile is complete, cached per user id"""
+    complete = _loaded_profile_complete(user)
+    if complete is not None:
+        return complete
+    key = profile_completion_cache_key(user.pk)
+    complete = cache.get(key)
+    if complete is None:
+        profile = UserProfile.objects.filter(user=user).first()
+        complete = bool(profile and profile.is_complete)
+        remember_profile_completion(user.pk, complete)
+    return complete
+
+
+async def ais_profile_complete(user):
+    """is_profile_complete() for async code: async cache and ORM calls"""
+    complete = _loaded_profile_complete(user)
+    if complete is not None:
+        return complete
+    key = profile_completion_cache_key(user.pk)
+    complete = await cache.aget(key)
+    if complete is None:
+        profile = await UserProfile.objects.filter(user=user).afirst()
+        complete = bool(profile and profile.is_complete)
+        await cache.aset(key, complete, PROFILE_COMPLETE_CACHE_TIMEOUT)
+    return complete
+
+
+def _load_user(request):
+    # Resolves the lazy request.user (session read + user lookup)
+    request.user.is_authenticated
+    return request.user
+
+
+# request.user for async code; Django 4.2 has no request.auser()
+aget_request_user = sync_to_async(_load_user)
+
+
+def remember_profile_completion(user_id, complete):
+    """Prime the cached flag when the caller already has the profile loaded"""
+    cache.set(profile_completion_cache_key(user_id), bool(complete), PROFILE_COMPLETE_CACHE_TIMEOUT)
+
+
+def invalidate_profile_completion(user_id):
+    """Drop the cached completeness flag (called when UserProfile changes)"""
+    cache.delete(profile_completion_cache_key(user_id))
+
+
+def is_provisioned(user_id):
+    """Whether the user's profile and credits rows are known to exist (no query)"""
+    return bool(cache.get(PROVISIONED_CACHE_KEY.format(user_id=user_id)))
+
+
+def remember_provisioned(user_id):
+    cache.set(PROVISIONED_CACHE_KEY.format(user_id=user_id), True, PROVISIONED_CACHE_TIMEOUT)
+
+
+def forget_provisioned(user_id):
+    """Drop the provisioned marker (called when a profile or credits row is deleted)"""
+    cache.delete(PROVISIONED_CACHE_KEY.format(user_id=user_id))
+
+
+EXEMPT_PATHS = ['/complete-profile/', '/logout/', '/admin/', '/accounts/logout/']
+
+
 class ProfileCompletionMiddleware:
+    # Runs natively in both stacks, so an ASGI request isn't bounced through a thread here
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
         # Check if user is authenticated and needs profile completion
         if request.user.is_authenticated:
             # Skip for certain URLs
-            if request.path not in ['/complete-profile/', '/logout/', '/admin/', '/accounts/logout/']:
-                try:
-                    profile = UserProfile.objects.get(user=request.user)
-                    # If profile is incomplete, redirect to complete profile
-                    if not profile.company_name or not profile.company_size:
-                        if request.path != '/complete-profile/':
-                            return redirect('complete_profile')
-                except UserProfile.DoesNotExist:
-                    # Profile doesn't exist, redirect to create it
-                    if request.path != '/complete-profile/':
-                        return redirect('complete_profile')
-        
+            if request.path not in EXEMPT_PATHS:
+                # Completed profiles are served from cache without a DB query;
+                # missing or incomplete profiles redirect to complete them
+                if not is_profile_complete(request.user):
+                    return redirect('complete_profile')
+
         response = self.get_response(request)
-        return response
\ No newline at end of file
+        return response
+
+    async def __acall__(self, request):
+        user = await aget_request_user(request)
+        if user.is_authenticated and request.path not in EXEMPT_PATHS:
+            if not await ais_profile_complete(user):
+                return redirect('complete_profile')
+        return await self.get_response(request)
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:53
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_credit_ledger'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='userotp',
+            name='otp_code',
+        ),
+    ]
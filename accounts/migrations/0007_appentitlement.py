@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0006_userotp_drop_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppEntitlement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('app', models.CharField(max_length=64)),
+                ('company_name', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='app_entitlements', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'app'], name='accounts_ap_user_id_7c1044_idx'), models.Index(fields=['company_name', 'app'], name='accounts_ap_company_bfc8c7_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='appentitlement',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('company_name', ''), ('user__isnull', False)), models.Q(('user__isnull', True), models.Q(('company_name', ''), _negated=True)), _connector='OR'), name='appentitlement_user_xor_company'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class UserProfile(models.Model):
@@ -10,27 +11,155 @@ class UserProfile(models.Model):
     def __str__(self):
         return self.user.email
 
+    @property
+    def is_complete(self):
+        return bool(self.company_name and self.company_size)
+
 
 class UserCredits(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='credits')
     total_credits = models.IntegerField(default=10)
     used_credits = models.IntegerField(default=0)
+    # Credits held by open reservations (see accounts.credits)
+    reserved_credits = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.user.email} - {self.available_credits()} credits"
+        return f"{self.user.email} - {self.available_credits} credits"
 
     @property
     def available_credits(self):
-        return self.total_credits - self.used_credits
+        return self.total_credits - self.used_credits - self.reserved_credits
+
+
+class CreditHold(models.Model):
+    """A reservation of credits that is later committed, released or expired"""
+    STATUS_HELD = 'held'
+    STATUS_COMMITTED = 'committed'
+    STATUS_RELEASED = 'released'
+    STATUS_EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (STATUS_HELD, 'Held'),
+        (STATUS_COMMITTED, 'Committed'),
+        (STATUS_RELEASED, 'Released'),
+        (STATUS_EXPIRED, 'Expired'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='credit_holds')
+    amount = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_HELD)
+    reference = models.CharField(max_length=255, blank=True)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.amount} ({self.status})"
+
+
+class CreditLedgerEntry(models.Model):
+    """Append-only record of every credit movement"""
+    KIND_CONSUME = 'consume'
+    KIND_RESERVE = 'reserve'
+    KIND_COMMIT = 'commit'
+    KIND_RELEASE = 'release'
+    KIND_EXPIRE = 'expire'
+    KIND_CHOICES = [
+        (KIND_CONSUME, 'Consume'),
+        (KIND_RESERVE, 'Reserve'),
+        (KIND_COMMIT, 'Commit'),
+        (KIND_RELEASE, 'Release'),
+        (KIND_EXPIRE, 'Expire'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='credit_ledger')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    amount = models.IntegerField()
+    hold = models.ForeignKey(CreditHold, null=True, blank=True, on_delete=models.SET_NULL, related_name='entries')
+    reference = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.kind} {self.amount}"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Ledger entries are append-only.")
+        super().save(*args, **kwargs)
 
 
 class UserOTP(models.Model):
+    """Email verification state; the codes themselves live in the cache (accounts.otp)"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='otp')
-    otp_code = models.CharField(max_length=6)
     is_verified = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.user.email} - OTP"
\ No newline at end of file
+        return f"{self.user.email} - OTP"
+
+class EmailOutbox(models.Model):
+    """Durable queue of outgoing emails, drained by accounts.outbox.OutboxDispatcher"""
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    to_email = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.to_email} - {self.subject} ({self.status})"
+
+
+class AppEntitlement(models.Model):
+    """Grants a restricted catalog app (accounts.catalog) to one user or to everyone at a company"""
+    app = models.CharField(max_length=64)
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE, related_name='app_entitlements')
+    # Matched against UserProfile.company_name
+    company_name = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'app']),
+            models.Index(fields=['company_name', 'app']),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=(models.Q(user__isnull=False, company_name='') |
+                       (models.Q(user__isnull=True) & ~models.Q(company_name=''))),
+                name='appentitlement_user_xor_company',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.app} for {self.user.email if self.user_id else self.company_name}"
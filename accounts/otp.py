@@ -0,0 +1,148 @@
+# accounts/otp.py
+"""
+One-time passwords kept in Django's cache instead of the UserOTP row.
+
+Only the durable UserOTP.is_verified bit stays in the database. A code
+lives under two cache keys for OTP_TTL_SECONDS:
+
+    accounts:otp:<user id>            -> HMAC of the current code
+    accounts:otp:<user id>:<hmac>     -> consumable token for that code
+
+Codes are never stored in clear: the HMAC is keyed with SECRET_KEY.
+Verification compares the HMAC and then consumes the token with a single
+cache.delete(), which reports True to exactly one caller, so a code can't
+be used twice even by concurrent requests. Wrong guesses are counted with
+cache.incr(); after OTP_MAX_ATTEMPTS the code is dropped and a new one must
+be requested. Issuing a new code (resend) invalidates the previous one.
+
+Deployments running more than one process need a shared cache (OTP_CACHE
+names the alias) - a per-process LocMemCache only works for one worker, and
+the accounts.E002 system check fails when WEB_CONCURRENCY says otherwise.
+"""
+import logging
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+logger = logging.getLogger(__name__)
+
+VERIFIED = "verified"
+INVALID = "invalid"
+EXPIRED = "expired"
+TOO_MANY_ATTEMPTS = "too_many_attempts"
+
+
+def _cache():
+    return caches[getattr(settings, "OTP_CACHE", "default")]
+
+
+def _ttl() -> int:
+    return getattr(settings, "OTP_TTL_SECONDS", 10 * 60)
+
+
+def _max_attempts() -> int:
+    return getattr(settings, "OTP_MAX_ATTEMPTS", 5)
+
+
+def generate_code() -> str:
+    """Random 6-digit code from the OS CSPRNG"""
+    return str(100000 + secrets.randbelow(900000))
+
+
+def code_digest(user_id, code: str) -> str:
+    return salted_hmac("accounts.otp", f"{user_id}:{code}").hexdigest()
+
+
+def _current_key(user_id) -> str:
+    return f"accounts:otp:{user_id}"
+
+
+def _token_key(user_id, digest: str) -> str:
+    return f"accounts:otp:{user_id}:{digest}"
+
+
+def _attempts_key(user_id) -> str:
+    return f"accounts:otp:{user_id}:attempts"
+
+
+def issue_otp(user_id) -> str:
+    """Store a new code for the user (replacing any previous one) and return it"""
+    cache, ttl = _cache(), _ttl()
+    code = generate_code()
+    digest = code_digest(user_id, code)
+    previous = cache.get(_current_key(user_id))
+    if previous:
+        cache.delete(_token_key(user_id, previous))
+    cache.set_many({_current_key(user_id): digest, _token_key(user_id, digest): 1, _attempts_key(user_id): 0}, ttl)
+    return code
+
+
+def _discard(cache, user_id, digest):
+    cache.delete_many([_current_key(user_id), _token_key(user_id, digest), _attempts_key(user_id)])
+
+
+def check_otp(user_id, code: str) -> str:
+    """Compare-and-consume `code`; returns VERIFIED, INVALID, EXPIRED or TOO_MANY_ATTEMPTS"""
+    cache = _cache()
+    current = cache.get(_current_key(user_id))
+    if current is None:
+        return EXPIRED
+    try:
+        attempts = cache.incr(_attempts_key(user_id))
+    except ValueError:  # counter expired with the code in between
+        return EXPIRED
+    if attempts > _max_attempts():
+        _discard(cache, user_id, current)
+        logger.info("OTP for user %s dropped after %d attempts", user_id, attempts - 1)
+        return TOO_MANY_ATTEMPTS
+    digest = code_digest(user_id, code)
+    if not constant_time_compare(digest, current):
+        return INVALID
+    if not cache.delete(_token_key(user_id, digest)):
+        return EXPIRED  # consumed by a concurrent request, or replaced by a resend
+    cache.delete_many([_current_key(user_id), _attempts_key(user_id)])
+    return VERIFIED
+
+
+async def aissue_otp(user_id) -> str:
+    cache, ttl = _cache(), _ttl()
+    code = generate_code()
+    digest = code_digest(user_id, code)
+    previous = await cache.aget(_current_key(user_id))
+    if previous:
+        await cache.adelete(_token_key(user_id, previous))
+    await cache.aset_many({_current_key(user_id): digest, _token_key(user_id, digest): 1,
+                           _attempts_key(user_id): 0}, ttl)
+    return code
+
+
+async def acheck_otp(user_id, code: str) -> str:
+    cache = _cache()
+    current = await cache.aget(_current_key(user_id))
+    if current is None:
+        return EXPIRED
+    try:
+        attempts = await cache.aincr(_attempts_key(user_id))
+    except ValueError:
+        return EXPIRED
+    if attempts > _max_attempts():
+        await cache.adelete_many([_current_key(user_id), _token_key(user_id, current), _attempts_key(user_id)])
+        logger.info("OTP for user %s dropped after %d attempts", user_id, attempts - 1)
+        return TOO_MANY_ATTEMPTS
+    digest = code_digest(user_id, code)
+    if not constant_time_compare(digest, current):
+        return INVALID
+    if not await cache.adelete(_token_key(user_id, digest)):
+        return EXPIRED
+    await cache.adelete_many([_current_key(user_id), _attempts_key(user_id)])
+    return VERIFIED
+
+
+# Message shown on the verify page for each failed outcome
+ERRORS = {
+    INVALID: "Invalid OTP. Please try again.",
+    EXPIRED: "This OTP has expired. Please request a new one.",
+    TOO_MANY_ATTEMPTS: "Too many incorrect attempts. Please request a new OTP.",
+}
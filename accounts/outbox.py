@@ -0,0 +1,277 @@
+# accounts/outbox.py
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import EmailOutbox
+from .smtp_pool import SMTPConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Waited on by the dispatcher thread; enqueue_email() sets it so new mail goes out immediately
+_wake_event = threading.Event()
+
+# This process's dispatcher thread (EMAIL_OUTBOX_DISPATCH = 'thread'), started with the server (or by the
+# first enqueued email in processes that aren't one)
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue_email(subject: str, body: str, to_email: str, from_email: Optional[str] = None) -> EmailOutbox:
+    """
+    Store an email in the outbox for background delivery.
+
+    Only a single INSERT happens in the request; SMTP is handled by the
+    dispatcher once the surrounding transaction commits.
+    """
+    item = EmailOutbox.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or _setting("EMAIL_OUTBOX_FROM_EMAIL", "noreply@dashboard.com"),
+        to_email=to_email,
+    )
+    transaction.on_commit(wake_dispatcher)
+    return item
+
+
+def enqueue_emails(messages: List[Tuple[str, str, str]], from_email: Optional[str] = None) -> List[EmailOutbox]:
+    """enqueue_email() for many (subject, body, to_email) messages in one bulk INSERT, for bulk jobs"""
+    from_email = from_email or _setting("EMAIL_OUTBOX_FROM_EMAIL", "noreply@dashboard.com")
+    items = EmailOutbox.objects.bulk_create([
+        EmailOutbox(subject=subject, body=body, from_email=from_email, to_email=to_email)
+        for subject, body, to_email in messages
+    ])
+    transaction.on_commit(wake_dispatcher)
+    return items
+
+
+async def aenqueue_email(subject: str, body: str, to_email: str, from_email: Optional[str] = None) -> EmailOutbox:
+    """enqueue_email() for async views; the INSERT autocommits, so the dispatcher is woken right away."""
+    return await sync_to_async(enqueue_email)(subject, body, to_email, from_email)
+
+
+def start_dispatcher():
+    """
+    Start this process's dispatcher thread if it isn't running. Called at
+    server startup, so mail left pending (or leased) by a previous process
+    goes out without waiting for new mail to be queued. With
+    EMAIL_OUTBOX_DISPATCH = 'command' delivery is left to
+    `manage.py run_outbox`, which polls the table.
+    """
+    global _dispatcher
+    if _setting("EMAIL_OUTBOX_DISPATCH", "thread") != "thread":
+        return
+    with _dispatcher_lock:
+        if _dispatcher is None or not _dispatcher.is_alive():
+            _dispatcher = OutboxDispatcher(threading.Event())
+            _dispatcher.start()
+            atexit.register(_stop_dispatcher, _dispatcher)
+
+
+def wake_dispatcher():
+    """Have queued mail delivered now: start the dispatcher if needed (whatever server the process is), then poke it."""
+    start_dispatcher()
+    _wake_event.set()
+
+
+def _stop_dispatcher(dispatcher):
+    try:
+        dispatcher.stop(timeout=5)
+    except Exception:
+        logger.exception("Error shutting down email outbox dispatcher.")
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Exponential backoff for the given number of failed attempts, capped."""
+    base = _setting("EMAIL_OUTBOX_RETRY_BASE_SECONDS", 5)
+    cap = _setting("EMAIL_OUTBOX_RETRY_MAX_SECONDS", 15 * 60)
+    return timedelta(seconds=min(cap, base * (2 ** max(attempts - 1, 0))))
+
+
+def claim_due(limit: int) -> list:
+    """
+    Claim up to `limit` due messages for sending.
+
+    Each row is claimed with a conditional UPDATE so concurrent dispatchers
+    never send the same message twice. A claim is a lease: if the process
+    dies mid-send the row becomes due again once `next_attempt_at` passes.
+    An expired lease counts as a failed attempt, so a message that crashes
+    its sender every time is given up on after EMAIL_OUTBOX_MAX_ATTEMPTS
+    rather than retried forever.
+    """
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=_setting("EMAIL_OUTBOX_LEASE_SECONDS", 120))
+    max_attempts = _setting("EMAIL_OUTBOX_MAX_ATTEMPTS", 8)
+    due = EmailOutbox.objects.filter(
+        status__in=[EmailOutbox.STATUS_PENDING, EmailOutbox.STATUS_SENDING],
+        next_attempt_at__lte=now,
+    ).order_by("next_attempt_at").values_list("pk", "status", "next_attempt_at", "attempts", "to_email")[:limit]
+
+    claimed = []
+    for pk, status, next_attempt_at, attempts, to_email in due:
+        row = EmailOutbox.objects.filter(pk=pk, status=status, next_attempt_at=next_attempt_at)
+        if status == EmailOutbox.STATUS_SENDING:
+            attempts += 1
+            if attempts >= max_attempts:
+                if row.update(status=EmailOutbox.STATUS_FAILED, attempts=attempts, body="",
+                              last_error="Lease expired before the send was recorded."):
+                    logger.error("Giving up on outbox email %s to %s after %d attempts: lease expired",
+                                 pk, to_email, attempts)
+                continue
+        if row.update(status=EmailOutbox.STATUS_SENDING, next_attempt_at=lease_until, attempts=attempts):
+            claimed.append(pk)
+    return list(EmailOutbox.objects.filter(pk__in=claimed))
+
+
+def build_message(item: EmailOutbox) -> EmailMessage:
+    return EmailMessage(item.subject, item.body, item.from_email, [item.to_email])
+
+
+def record_result(item: EmailOutbox, exc: Optional[Exception]) -> bool:
+    """
+    Mark an outbox row sent, or schedule a retry / give up. Returns True on success.
+
+    The body (which carries OTP codes) is cleared as soon as the row is
+    sent or given up on; only the envelope is kept, until purge_finished().
+    """
+    attempts = item.attempts + 1
+    if exc is None:
+        EmailOutbox.objects.filter(pk=item.pk).update(
+            status=EmailOutbox.STATUS_SENT,
+            body="",
+            attempts=attempts,
+            sent_at=timezone.now(),
+            last_error="",
+        )
+        return True
+
+    max_attempts = _setting("EMAIL_OUTBOX_MAX_ATTEMPTS", 8)
+    if attempts >= max_attempts:
+        status = EmailOutbox.STATUS_FAILED
+        logger.error("Giving up on outbox email %s to %s after %d attempts: %s",
+                     item.pk, item.to_email, attempts, exc)
+    else:
+        status = EmailOutbox.STATUS_PENDING
+        logger.warning("Outbox email %s to %s failed (attempt %d): %s",
+                       item.pk, item.to_email, attempts, exc)
+    fields = {"body": ""} if status == EmailOutbox.STATUS_FAILED else {}
+    EmailOutbox.objects.filter(pk=item.pk).update(
+        status=status,
+        attempts=attempts,
+        next_attempt_at=timezone.now() + retry_delay(attempts),
+        last_error=str(exc)[:1000],
+        **fields,
+    )
+    return False
+
+
+def purge_finished(older_than: Optional[timedelta] = None) -> int:
+    """Delete sent and failed rows older than EMAIL_OUTBOX_RETENTION_SECONDS. Returns the number deleted."""
+    if older_than is None:
+        older_than = timedelta(seconds=_setting("EMAIL_OUTBOX_RETENTION_SECONDS", 7 * 24 * 3600))
+    deleted, _ = EmailOutbox.objects.filter(
+        status__in=[EmailOutbox.STATUS_SENT, EmailOutbox.STATUS_FAILED],
+        created_at__lt=timezone.now() - older_than,
+    ).delete()
+    if deleted:
+        logger.info("Purged %d delivered/failed outbox emails.", deleted)
+    return deleted
+
+
+def deliver_batch(items: List[EmailOutbox], pool: SMTPConnectionPool) -> int:
+    """Send `items` over one pooled SMTP connection. Returns the number sent."""
+    try:
+        try:
+            results = pool.send_batch([build_message(item) for item in items])
+        except Exception as exc:
+            # Could not even get a connection; every message in the batch failed
+            results = [exc] * len(items)
+        return sum(record_result(item, exc) for item, exc in zip(items, results))
+    finally:
+        close_old_connections()
+
+
+def dispatch_pending(executor: Optional[ThreadPoolExecutor] = None, batch_size: Optional[int] = None,
+                     pool: Optional[SMTPConnectionPool] = None) -> int:
+    """
+    Claim one batch of due messages and deliver them.
+
+    - executor: optional pool bounding SMTP concurrency; sends inline if None
+    - pool: SMTP connection pool; the claimed batch is split into one chunk
+      per pooled connection. A temporary single-connection pool is used if None.
+    Returns the number of messages claimed.
+    """
+    batch_size = batch_size or _setting("EMAIL_OUTBOX_BATCH_SIZE", 50)
+    items = claim_due(batch_size)
+    if not items:
+        return 0
+
+    own_pool = pool is None
+    if own_pool:
+        pool = SMTPConnectionPool(size=1)
+    try:
+        chunks = [items[i::pool.size] for i in range(min(pool.size, len(items)))]
+        if executor is None:
+            for chunk in chunks:
+                deliver_batch(chunk, pool)
+        else:
+            list(executor.map(lambda chunk: deliver_batch(chunk, pool), chunks))
+    finally:
+        if own_pool:
+            pool.close()
+    return len(items)
+
+
+class OutboxDispatcher(threading.Thread):
+    """Background thread draining the outbox with a bounded worker pool."""
+
+    def __init__(self, stop_event: threading.Event, workers: Optional[int] = None,
+                 poll_interval: Optional[float] = None):
+        super().__init__(name="accounts-email-outbox", daemon=True)
+        self.stop_event = stop_event
+        self.workers = workers or _setting("EMAIL_OUTBOX_WORKERS", 4)
+        self.poll_interval = poll_interval or _setting("EMAIL_OUTBOX_POLL_SECONDS", 5)
+
+    def run(self):
+        logger.info("Email outbox dispatcher started with %d workers.", self.workers)
+        # One persistent SMTP connection per worker
+        pool = SMTPConnectionPool(size=self.workers)
+        purge_interval = _setting("EMAIL_OUTBOX_PURGE_INTERVAL_SECONDS", 3600)
+        next_purge = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="outbox-smtp") as executor:
+            while not self.stop_event.is_set():
+                try:
+                    claimed = dispatch_pending(executor, pool=pool)
+                    if time.monotonic() >= next_purge:
+                        next_purge = time.monotonic() + purge_interval
+                        purge_finished()
+                except Exception:
+                    logger.exception("Email outbox dispatch failed.")
+                    claimed = 0
+                finally:
+                    close_old_connections()
+                # Keep draining while there is work, otherwise sleep until poked
+                if not claimed:
+                    _wake_event.wait(self.poll_interval)
+                    _wake_event.clear()
+        pool.close()
+        logger.info("Email outbox dispatcher stopped.")
+
+    def stop(self, timeout: float = 5):
+        self.stop_event.set()
+        _wake_event.set()
+        self.join(timeout=timeout)
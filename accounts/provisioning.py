@@ -0,0 +1,245 @@
+# accounts/provisioning.py
+"""
+Bulk user provisioning from CSV or XLSX, used by the provision_users command.
+
+Rows are streamed (csv.DictReader / openpyxl read-only mode) and processed
+in chunks. For each chunk the passwords are hashed across a process pool
+while the previous chunk is written, and each chunk is one transaction of
+bulk_create()s for users, profiles, credits and OTP state - five INSERTs
+per chunk instead of four per user.
+
+Columns (header names, case-insensitive): email (required), password,
+first_name, last_name, company_name, company_size, credits. Rows without a
+password get an unusable one (the user signs in with Google or resets it).
+Invalid rows, duplicates within the file and emails that already exist
+are skipped and reported, never fatal.
+
+bulk_create() sends no post_save, so the cache invalidation the signal
+handlers would do is done explicitly for each written chunk. Unverified
+accounts are sent their OTP code through the outbox, in the chunk's
+transaction.
+"""
+import csv
+import logging
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .account_cache import invalidate_account_rows
+from .catalog import invalidate_entitlements
+from .domains import is_workspace_email
+from .hashing import hash_batch, init_worker
+from .middleware import forget_provisioned, invalidate_profile_completion
+from .models import UserCredits, UserOTP, UserProfile
+from .otp import issue_otp
+from .outbox import enqueue_emails
+from .views import otp_email
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ("email", "password", "first_name", "last_name", "company_name", "company_size", "credits")
+# Same choices as SignupForm.company_size
+COMPANY_SIZES = ("<50", "50-100", "100-500", ">500")
+# Tries at writing a chunk whose emails keep being taken by concurrent signups
+WRITE_ATTEMPTS = 3
+
+
+@dataclass
+class ProvisionReport:
+    rows: int = 0
+    created: int = 0
+    skipped: Counter = field(default_factory=Counter)
+    examples: List[str] = field(default_factory=list)  # first few skipped rows, for the operator
+    seconds: float = 0.0
+
+    def skip(self, line: int, email: str, reason: str):
+        self.skipped[reason] += 1
+        if len(self.examples) < 20:
+            self.examples.append(f"line {line}: {email or '<no email>'}: {reason}")
+
+    @property
+    def users_per_second(self) -> float:
+        return self.created / self.seconds if self.seconds else 0.0
+
+
+def iter_rows(path: Path) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """(line number, row) for each data row of a .csv or .xlsx file, keys lowercased"""
+    path = Path(path)
+    if path.suffix.lower() in (".xlsx", ".xlsm"):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(h or "").strip().lower() for h in next(rows, ())]
+            for line, values in enumerate(rows, start=2):
+                if any(v is not None for v in values):
+                    yield line, {h: "" if v is None else str(v).strip() for h, v in zip(header, values)}
+        finally:
+            workbook.close()
+        return
+
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        reader.fieldnames = [h.strip().lower() for h in reader.fieldnames or []]
+        for row in reader:
+            yield reader.line_num, {k: (v or "").strip() for k, v in row.items() if k}
+
+
+def clean_row(row: Dict[str, str], defaults: Dict[str, str]) -> Tuple[Optional[dict], str]:
+    """(cleaned fields, "") or (None, reason)"""
+    email = User.objects.normalize_email(row.get("email", ""))
+    try:
+        validate_email(email)
+    except ValidationError:
+        return None, "invalid email"
+    if not is_workspace_email(email):
+        return None, "not a workspace email"
+    company_size = row.get("company_size") or defaults.get("company_size", "")
+    if company_size and company_size not in COMPANY_SIZES:
+        return None, "invalid company_size"
+    try:
+        credits = int(row.get("credits") or defaults.get("credits", 10))
+    except ValueError:
+        return None, "invalid credits"
+    return {
+        "email": email,
+        "password": row.get("password") or None,
+        "first_name": row.get("first_name", "")[:150],
+        "last_name": row.get("last_name", "")[:150],
+        "company_name": (row.get("company_name") or defaults.get("company_name", ""))[:255],
+        "company_size": company_size,
+        "credits": credits,
+    }, ""
+
+
+def _chunks(rows, report: ProvisionReport, defaults: Dict[str, str], chunk_size: int) -> Iterator[List[dict]]:
+    seen, chunk = set(), []
+    for line, row in rows:
+        report.rows += 1
+        cleaned, reason = clean_row(row, defaults)
+        if cleaned is None:
+            report.skip(line, row.get("email", ""), reason)
+            continue
+        key = cleaned["email"].lower()
+        if key in seen:
+            report.skip(line, cleaned["email"], "duplicate in file")
+            continue
+        seen.add(key)
+        cleaned["line"] = line
+        chunk.append(cleaned)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _drop_existing(chunk: List[dict], report: ProvisionReport) -> List[dict]:
+    emails = [r["email"] for r in chunk]
+    existing = {e.lower() for pair in User.objects.filter(Q(email__in=emails) | Q(username__in=emails))
+                .values_list("email", "username") for e in pair}
+    fresh = []
+    for r in chunk:
+        if r["email"].lower() in existing:
+            report.skip(r["line"], r["email"], "already exists")
+        else:
+            fresh.append(r)
+    return fresh
+
+
+def _write(chunk: List[dict], hashes: List[str], verified: bool):
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(username=r["email"], email=r["email"], password=h, first_name=r["first_name"],
+                 last_name=r["last_name"])
+            for r, h in zip(chunk, hashes)
+        ])
+        if any(u.pk is None for u in users):  # backends that don't return ids from bulk INSERTs
+            ids = dict(User.objects.filter(username__in=[u.username for u in users]).values_list("username", "id"))
+            for u in users:
+                u.pk = ids[u.username]
+        UserProfile.objects.bulk_create([
+            UserProfile(user_id=u.pk, company_name=r["company_name"], company_size=r["company_size"])
+            for u, r in zip(users, chunk)
+        ])
+        UserCredits.objects.bulk_create([UserCredits(user_id=u.pk, total_credits=r["credits"])
+                                         for u, r in zip(users, chunk)])
+        UserOTP.objects.bulk_create([UserOTP(user_id=u.pk, is_verified=verified) for u in users])
+        if not verified:
+            enqueue_emails([otp_email(u, issue_otp(u.pk)) + (u.email,) for u in users])
+    _invalidate_cached(users)
+
+
+def _invalidate_cached(users: List[User]):
+    """What the post_save handlers in accounts.signals do for a new user and its rows"""
+    user_ids = [u.pk for u in users]
+    invalidate_account_rows(*user_ids)
+    invalidate_entitlements(user_ids)
+    for user_id in user_ids:
+        forget_provisioned(user_id)
+        invalidate_profile_completion(user_id)
+
+
+def provision(rows, chunk_size: int = 1000, workers: Optional[int] = None, verified: bool = True,
+              defaults: Optional[Dict[str, str]] = None, dry_run: bool = False,
+              progress: Optional[Callable[[ProvisionReport], None]] = None) -> ProvisionReport:
+    """
+    Create users from `rows` ((line, dict) pairs, see iter_rows). Chunk N+1
+    is hashed in the pool while chunk N is written. verified=False leaves
+    the accounts to confirm their email with an OTP first, and emails them
+    a code.
+    """
+    report, defaults = ProvisionReport(), defaults or {}
+    start = time.perf_counter()
+    slices = workers or os.cpu_count() or 1
+    # Spawned like the hashing pool's workers, not forked from a process that may run threads
+    with ProcessPoolExecutor(max_workers=slices, initializer=init_worker,
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = None
+        for chunk in _chunks(rows, report, defaults, chunk_size):
+            chunk = _drop_existing(chunk, report)
+            passwords = [r["password"] for r in chunk]
+            step = max(1, -(-len(passwords) // slices))
+            futures = [pool.submit(hash_batch, passwords[i:i + step]) for i in range(0, len(passwords), step)]
+            if pending is not None:
+                _finish(pending, report, verified, dry_run, progress)
+            pending = (chunk, futures)
+        if pending is not None:
+            _finish(pending, report, verified, dry_run, progress)
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def _finish(pending, report: ProvisionReport, verified: bool, dry_run: bool, progress):
+    chunk, futures = pending
+    hashes = [h for future in futures for h in future.result()]
+    if chunk and not dry_run:
+        by_email = dict(zip((r["email"] for r in chunk), hashes))
+        for _ in range(WRITE_ATTEMPTS):
+            try:
+                _write(chunk, [by_email[r["email"]] for r in chunk], verified)
+                break
+            except IntegrityError:
+                # Someone signed up with one of these emails since the chunk was checked
+                chunk = _drop_existing(chunk, report)
+        else:
+            logger.warning("Skipping %d users after %d conflicting writes of their chunk", len(chunk), WRITE_ATTEMPTS)
+            for r in chunk:
+                report.skip(r["line"], r["email"], "write conflict")
+            chunk = []
+    report.created += len(chunk)
+    logger.info("Provisioned %d users (%d rows read)", report.created, report.rows)
+    if progress is not None:
+        progress(report)
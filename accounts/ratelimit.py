@@ -0,0 +1,350 @@
+# accounts/ratelimit.py
+"""
+Sliding-window rate limiting for the OTP and login endpoints.
+
+Each (rule, key) pair keeps two counters: hits in the current fixed window
+and hits in the previous one. The sliding-window count is estimated as
+
+    previous * (time left in the current window / window) + current
+
+which needs O(1) memory per key and is exact when traffic is uniform.
+Only allowed requests are counted, so a client that backs off recovers
+within one window.
+
+Two backends:
+    LocalBackend - in-process dict under a lock (per worker, fastest)
+    CacheBackend - Django cache counters (add/incr), shared by all workers
+
+Views declare their rule with @ratelimit("rule"). RateLimitMiddleware sits
+before the session and auth middleware, resolves the path to its view and
+applies that view's rule with a 429 before any ORM work, so every URL
+routed to the view is covered (e.g. the login page is also served at /).
+Without the middleware the decorator enforces the rule itself. Rules are
+keyed by client IP and by the submitted email, and configured in
+RATELIMIT_RULES.
+
+Behind a reverse proxy REMOTE_ADDR is the proxy, so every client shares one
+IP counter unless RATELIMIT_IP_HEADER names the header the proxy sets. A
+warning is logged once per process when the first request comes from a
+private or loopback address and no header is configured.
+"""
+import hashlib
+import ipaddress
+import logging
+import math
+import threading
+import time
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+# rule -> key kind -> "count/period" (period: s, m, h or seconds), plus the HTTP methods it applies to
+DEFAULT_RULES = {
+    "login": {"methods": ["POST"], "ip": "60/m", "email": "10/m"},
+    "verify_otp": {"ip": "60/m", "email": "10/m"},
+    "resend_otp": {"ip": "20/m", "email": "3/m"},
+}
+
+PERIODS = {"s": 1, "m": 60, "h": 3600}
+
+
+def parse_rate(rate: str) -> Tuple[int, int]:
+    """'10/m' -> (10, 60); '5/30' -> (5, 30)"""
+    count, _, period = rate.partition("/")
+    seconds = PERIODS[period] if period in PERIODS else int(period)
+    return int(count), seconds
+
+
+def estimate(previous: int, current: int, elapsed: float, window: int) -> float:
+    return previous * (window - elapsed) / window + current
+
+
+def retry_after(previous: int, current: int, elapsed: float, window: int, limit: int) -> int:
+    """Seconds until the estimate drops below `limit` again"""
+    if current >= limit or not previous:
+        return max(1, math.ceil(window - elapsed))
+    wait = (window - elapsed) - (limit - current) * window / previous
+    return max(1, math.ceil(wait))
+
+
+class LocalBackend:
+    """Per-process counters: key -> [window index, previous count, current count, window]."""
+
+    SWEEP_EVERY = 10000
+
+    def __init__(self):
+        self._counters: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+        self._ops = 0
+
+    def hit(self, key: str, limit: int, window: int, now: float) -> Tuple[bool, int]:
+        index, elapsed = divmod(now, window)
+        index = int(index)
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = self._counters[key] = [index, 0, 0, window]
+            elif counter[0] != index:
+                counter[1] = counter[2] if counter[0] == index - 1 else 0
+                counter[0], counter[2] = index, 0
+            previous, current = counter[1], counter[2]
+            allowed = estimate(previous, current, elapsed, window) < limit
+            if allowed:
+                counter[2] += 1
+            self._ops += 1
+            if self._ops >= self.SWEEP_EVERY:
+                self._sweep(now)
+        return allowed, 0 if allowed else retry_after(previous, current, elapsed, window, limit)
+
+    async def ahit(self, key: str, limit: int, window: int, now: float) -> Tuple[bool, int]:
+        return self.hit(key, limit, window, now)
+
+    def _sweep(self, now: float):
+        # Keys idle for more than a window would read as zero anyway
+        self._ops = 0
+        stale = [key for key, (index, _, _, window) in self._counters.items() if index < now // window - 1]
+        for key in stale:
+            del self._counters[key]
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+class CacheBackend:
+    """Counters in a Django cache, shared across processes and hosts."""
+
+    def __init__(self, alias: str = "default"):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def hit(self, key: str, limit: int, window: int, now: float) -> Tuple[bool, int]:
+        index, elapsed = divmod(now, window)
+        index = int(index)
+        previous_key, current_key = f"{key}:{index - 1}", f"{key}:{index}"
+        counts = self.cache.get_many([previous_key, current_key])
+        previous, current = counts.get(previous_key, 0), counts.get(current_key, 0)
+        if estimate(previous, current, elapsed, window) >= limit:
+            return False, retry_after(previous, current, elapsed, window, limit)
+        # add() wins once per window; everyone else increments the existing counter
+        if not self.cache.add(current_key, 1, window * 2):
+            try:
+                self.cache.incr(current_key)
+            except ValueError:
+                self.cache.set(current_key, 1, window * 2)
+        return True, 0
+
+    async def ahit(self, key: str, limit: int, window: int, now: float) -> Tuple[bool, int]:
+        index, elapsed = divmod(now, window)
+        index = int(index)
+        previous_key, current_key = f"{key}:{index - 1}", f"{key}:{index}"
+        counts = await self.cache.aget_many([previous_key, current_key])
+        previous, current = counts.get(previous_key, 0), counts.get(current_key, 0)
+        if estimate(previous, current, elapsed, window) >= limit:
+            return False, retry_after(previous, current, elapsed, window, limit)
+        if not await self.cache.aadd(current_key, 1, window * 2):
+            try:
+                await self.cache.aincr(current_key)
+            except ValueError:
+                await self.cache.aset(current_key, 1, window * 2)
+        return True, 0
+
+
+class RateLimiter:
+    def __init__(self, backend, rules: Optional[dict] = None):
+        self.backend = backend
+        self.rules = rules if rules is not None else DEFAULT_RULES
+
+    @staticmethod
+    def _key(rule: str, kind: str, value: str, window: int) -> str:
+        digest = hashlib.sha1(value.encode()).hexdigest()
+        return f"ratelimit:{rule}:{kind}:{digest}:{window}"
+
+    def _limits(self, rule: str, request):
+        """(key, limit, window, description) for each limit of `rule` that applies to `request`"""
+        config = self.rules.get(rule)
+        if config is None:
+            return []
+        methods = config.get("methods")
+        if methods and request.method not in methods:
+            return []
+        limits = []
+        for kind, value in request_keys(request):
+            rate = config.get(kind)
+            if rate and value:
+                limit, window = parse_rate(rate)
+                limits.append((self._key(rule, kind, value, window), limit, window, f"{rule}/{kind}"))
+        return limits
+
+    def check(self, rule: str, request) -> Optional[HttpResponse]:
+        """None if the request may proceed, else a 429 response. Counts the request when allowed."""
+        now = time.time()
+        for key, limit, window, description in self._limits(rule, request):
+            allowed, wait = self.backend.hit(key, limit, window, now)
+            if not allowed:
+                logger.warning("Rate limit exceeded: %s", description)
+                return too_many_requests(wait)
+        return None
+
+    async def acheck(self, rule: str, request) -> Optional[HttpResponse]:
+        now = time.time()
+        for key, limit, window, description in self._limits(rule, request):
+            allowed, wait = await self.backend.ahit(key, limit, window, now)
+            if not allowed:
+                logger.warning("Rate limit exceeded: %s", description)
+                return too_many_requests(wait)
+        return None
+
+
+# Whether this process has looked at a REMOTE_ADDR for signs of a proxy in front of it
+_proxy_checked = False
+
+
+def client_ip(request) -> str:
+    header = getattr(settings, "RATELIMIT_IP_HEADER", None)
+    if header and request.META.get(header):
+        # The left-most address is the client as seen by the first trusted proxy
+        return request.META[header].split(",")[0].strip()
+    remote_addr = request.META.get("REMOTE_ADDR", "")
+    if not header and not _proxy_checked:
+        warn_if_proxied(remote_addr)
+    return remote_addr
+
+
+def warn_if_proxied(remote_addr: str):
+    """Log once if the first client address looks like a reverse proxy (private or loopback)"""
+    global _proxy_checked
+    _proxy_checked = True
+    try:
+        address = ipaddress.ip_address(remote_addr)
+    except ValueError:
+        return
+    if (address.is_private or address.is_loopback) and not settings.DEBUG:
+        logger.warning(
+            "Requests come from %s and RATELIMIT_IP_HEADER is not set. If this server is behind a reverse "
+            "proxy, every client shares the proxy's per-IP rate limit; set RATELIMIT_IP_HEADER to the "
+            "header it sets (e.g. 'HTTP_X_FORWARDED_FOR').", remote_addr)
+
+
+def request_keys(request):
+    yield "ip", client_ip(request)
+    email = request.GET.get("email") or (request.POST.get("email") if request.method == "POST" else None)
+    yield "email", email.strip().lower() if email else None
+
+
+def too_many_requests(wait: int) -> HttpResponse:
+    response = HttpResponse("Too many requests. Please try again later.\n", status=429,
+                            content_type="text/plain")
+    response["Retry-After"] = str(wait)
+    return response
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            if getattr(settings, "RATELIMIT_BACKEND", "local") == "cache":
+                backend = CacheBackend(getattr(settings, "RATELIMIT_CACHE", "default"))
+            else:
+                backend = LocalBackend()
+            _limiter = RateLimiter(backend, getattr(settings, "RATELIMIT_RULES", DEFAULT_RULES))
+        return _limiter
+
+
+def _enabled() -> bool:
+    return getattr(settings, "RATELIMIT_ENABLED", True)
+
+
+def _first_check(rule: str, request) -> bool:
+    """Mark `rule` as applied to `request`; False if the middleware already counted it"""
+    checked = getattr(request, "_ratelimit_checked", set())
+    if rule in checked:
+        return False
+    request._ratelimit_checked = checked | {rule}
+    return True
+
+
+def ratelimit(rule: str):
+    """Apply RATELIMIT_RULES[rule] to a (sync or async) view; the middleware finds it as view.ratelimit_rule"""
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if _enabled() and _first_check(rule, request):
+                    rejected = await get_limiter().acheck(rule, request)
+                    if rejected:
+                        return rejected
+                return await view(request, *args, **kwargs)
+            async_wrapper.ratelimit_rule = rule
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if _enabled() and _first_check(rule, request):
+                rejected = get_limiter().check(rule, request)
+                if rejected:
+                    return rejected
+            return view(request, *args, **kwargs)
+        wrapper.ratelimit_rule = rule
+        return wrapper
+    return decorator
+
+
+class RateLimitMiddleware:
+    """Applies the @ratelimit rule of the view the path resolves to, ahead of sessions and auth."""
+    sync_capable = True
+    async_capable = True
+
+    # Paths whose view has been resolved; capped so scans of random 404 paths can't grow it
+    MAX_CACHED_PATHS = 1024
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._view_rules = {}
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _view_rule(self, path: str) -> Optional[str]:
+        try:
+            return self._view_rules[path]
+        except KeyError:
+            pass
+        try:
+            rule = getattr(resolve(path).func, "ratelimit_rule", None)
+        except Resolver404:
+            rule = None
+        if len(self._view_rules) < self.MAX_CACHED_PATHS:
+            self._view_rules[path] = rule
+        return rule
+
+    def _rule(self, request) -> Optional[str]:
+        if not _enabled():
+            return None
+        rule = self._view_rule(request.path_info)
+        return rule if rule in get_limiter().rules and _first_check(rule, request) else None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        rule = self._rule(request)
+        rejected = get_limiter().check(rule, request) if rule else None
+        return rejected or self.get_response(request)
+
+    async def __acall__(self, request):
+        rule = self._rule(request)
+        rejected = await get_limiter().acheck(rule, request) if rule else None
+        return rejected or await self.get_response(request)
@@ -0,0 +1,160 @@
+# accounts/restore.py
+"""
+Verify and restore backups written by accounts.backup / accounts.incremental.
+
+Archives (db_backup_*.sqlite3.gz/.xz/.zst) and incremental manifests
+(manifests/db_backup_*.json) are both accepted. Verification decompresses
+each backup to a scratch file, compares it with the checksum in the backup
+index when there is one, and runs PRAGMA integrity_check (or quick_check);
+verify_backups() fans this out over a process pool since the work is CPU
+bound (decompression + page checks). Restores are
+stream-decompressed next to the target, checked, and swapped in with
+os.replace so the live path never holds a partial database.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from .backup import CHUNK_SIZE, open_decompressed
+from .incremental import iter_restore, list_manifests
+from .retention import find_entry, load_index
+
+logger = logging.getLogger(__name__)
+
+
+def find_backups(outdir: Path) -> List[Path]:
+    """All archives and incremental manifests under `outdir` (from their indexes), newest first."""
+    outdir = Path(outdir)
+    found = [outdir / entry["name"] for entry in load_index(outdir)] if outdir.is_dir() else []
+    found += list_manifests(outdir)
+    return sorted(found, key=lambda p: p.name, reverse=True)
+
+
+def expected_checksum(path: Path) -> Optional[str]:
+    """SHA-256 of the database image recorded for an archive, if known."""
+    path = Path(path)
+    if path.suffix == ".json":
+        return None
+    entry = find_entry(path.parent, path.name)
+    return entry.get("sha256") if entry else None
+
+
+def iter_backup(path: Path) -> Iterator[bytes]:
+    """Yield the decompressed database image of an archive or manifest."""
+    path = Path(path)
+    if path.suffix == ".json":
+        yield from iter_restore(path)
+        return
+    with open_decompressed(path) as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def decompress_to(path: Path, dest: Path, sha256: Optional[str] = None) -> int:
+    """
+    Write the database image of `path` to `dest` and fsync it. Returns bytes
+    written; raises ValueError if the image doesn't match `sha256`.
+    """
+    size, image_hash = 0, hashlib.sha256()
+    with open(dest, "wb") as f:
+        for chunk in iter_backup(path):
+            f.write(chunk)
+            image_hash.update(chunk)
+            size += len(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    if sha256 is not None and image_hash.hexdigest() != sha256:
+        raise ValueError(f"{Path(path).name} does not match its indexed checksum")
+    return size
+
+
+def check_database(db_path: Path, quick: bool = False) -> str:
+    """Run integrity_check / quick_check; returns "ok" or the first problems reported."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        pragma = "quick_check" if quick else "integrity_check"
+        rows = conn.execute(f"PRAGMA {pragma}(10)").fetchall()
+    finally:
+        conn.close()
+    return "; ".join(row[0] for row in rows)
+
+
+def verify_backup(path: Path, quick: bool = False, workdir: Optional[str] = None) -> dict:
+    """Decompress one backup to a scratch file and check it. Never raises."""
+    start = time.perf_counter()
+    result = {"path": str(path), "ok": False, "size": 0, "result": ""}
+    fd, scratch = tempfile.mkstemp(suffix=".sqlite3", dir=workdir)
+    os.close(fd)
+    try:
+        result["size"] = decompress_to(path, Path(scratch), sha256=expected_checksum(path))
+        result["result"] = check_database(Path(scratch), quick=quick)
+        result["ok"] = result["result"] == "ok"
+    except Exception as exc:
+        result["result"] = f"{type(exc).__name__}: {exc}"
+    finally:
+        os.unlink(scratch)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def verify_backups(paths: List[Path], workers: Optional[int] = None, quick: bool = False,
+                   workdir: Optional[str] = None) -> Iterator[dict]:
+    """Verify backups across a process pool, yielding results as they complete."""
+    if workers == 1:
+        for path in paths:
+            yield verify_backup(path, quick, workdir)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(verify_backup, path, quick, workdir) for path in paths]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def restore_backup(path: Path, db_path: Path, verify: bool = True, keep_old: bool = True) -> Optional[Path]:
+    """
+    Replace the database at `db_path` with the contents of backup `path`.
+
+    The image is decompressed to a temporary file in the same directory,
+    checked with quick_check (unless verify=False) and swapped in with
+    os.replace. Stale -wal/-shm files of the old database are removed so
+    they can't be replayed onto the restored one. With keep_old the
+    previous database stays available as <db>.pre-restore-<ts>.
+    Returns the path of the kept old database, if any. Stop the app first.
+    """
+    db_path = Path(db_path)
+    tmp = db_path.with_name(db_path.name + ".restore-part")
+    try:
+        decompress_to(path, tmp, sha256=expected_checksum(path))
+        if verify:
+            result = check_database(tmp, quick=True)
+            if result != "ok":
+                raise ValueError(f"{path} failed quick_check: {result}")
+
+        old = None
+        if keep_old and db_path.exists():
+            # Fold committed WAL content into the main file before keeping it
+            conn = sqlite3.connect(str(db_path))
+            try:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            finally:
+                conn.close()
+            ts = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+            old = db_path.with_name(f"{db_path.name}.pre-restore-{ts}")
+            os.link(db_path, old)
+        for suffix in ("-wal", "-shm"):
+            Path(str(db_path) + suffix).unlink(missing_ok=True)
+        os.replace(tmp, db_path)
+        logger.info("Restored %s from %s", db_path, path)
+        return old
+    finally:
+        tmp.unlink(missing_ok=True)
@@ -0,0 +1,164 @@
+# accounts/retention.py
+"""
+Backup index and tiered (grandfather-father-son) retention.
+
+Each backup directory keeps an index.json listing its archives with
+timestamp, codec, archive size, image size and the SHA-256 of the database
+image. Rotation and listing read the index instead of globbing and sorting
+the directory; if the index is missing it is rebuilt from one scan.
+
+A retention policy such as {"hourly": 24, "daily": 14, "weekly": 8} keeps
+the newest backup of each of the last 24 hours, 14 days and 8 ISO weeks
+that have backups (the tiers overlap). A plain integer keeps the newest N.
+
+Backup runs in one directory, scheduled or manual (manage.py backup_db),
+serialize on backup_lock(), so index updates and rotation never interleave.
+"""
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Union
+
+from filelock import FileLock
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "index.json"
+LOCK_NAME = ".backup.lock"
+TIMESTAMP_FORMAT = "%Y%m%d%H%M%S"
+
+# tier -> bucket key of a backup time
+TIERS = {
+    "hourly": lambda t: t.strftime("%Y%m%d%H"),
+    "daily": lambda t: t.strftime("%Y%m%d"),
+    "weekly": lambda t: "%d-W%02d" % t.isocalendar()[:2],
+    "monthly": lambda t: t.strftime("%Y%m"),
+}
+
+Retention = Union[int, Dict[str, int]]
+
+
+def backup_time(name: str) -> datetime:
+    """Timestamp embedded in a db_backup_<YYYYmmddHHMMSS>... name."""
+    return datetime.strptime(name[len("db_backup_"):][:14], TIMESTAMP_FORMAT)
+
+
+def select_retained(names: Iterable[str], retention: Retention) -> Set[str]:
+    """Names to keep under `retention` (newest N, or a tier -> count policy)."""
+    newest_first = sorted(names, key=backup_time, reverse=True)
+    if isinstance(retention, int):
+        return set(newest_first[:retention])
+
+    unknown = set(retention) - set(TIERS)
+    if unknown:
+        raise ValueError(f"Unknown retention tiers: {', '.join(sorted(unknown))}")
+    keep = set(newest_first[:1])
+    for tier, count in retention.items():
+        bucket_of, buckets = TIERS[tier], set()
+        for name in newest_first:
+            if len(buckets) >= count:
+                break
+            bucket = bucket_of(backup_time(name))
+            if bucket not in buckets:
+                buckets.add(bucket)
+                keep.add(name)
+    return keep
+
+
+def backup_lock(outdir: Path) -> FileLock:
+    """Host-wide lock held while a backup updates `outdir` (not reentrant: take it once per run)."""
+    Path(outdir).mkdir(parents=True, exist_ok=True)
+    return FileLock(str(Path(outdir) / LOCK_NAME))
+
+
+def _index_path(outdir: Path) -> Path:
+    return Path(outdir) / INDEX_NAME
+
+
+def rebuild_index(outdir: Path) -> List[dict]:
+    """Index the archives currently in `outdir` (checksums unknown for these)."""
+    from .backup import BACKUP_GLOB, CODECS
+
+    codec_of = {suffix: codec for codec, suffix in CODECS.items()}
+    entries = []
+    for p in Path(outdir).glob(BACKUP_GLOB):
+        if p.suffix not in codec_of:
+            continue
+        entries.append({
+            "name": p.name,
+            "created": p.name[len("db_backup_"):][:14],
+            "codec": codec_of[p.suffix],
+            "size": p.stat().st_size,
+            "image_size": None,
+            "sha256": None,
+        })
+    save_index(outdir, entries)
+    logger.info("Rebuilt backup index for %s (%d archives)", outdir, len(entries))
+    return entries
+
+
+def load_index(outdir: Path) -> List[dict]:
+    """Index entries, newest first."""
+    try:
+        with open(_index_path(outdir)) as f:
+            entries = json.load(f)["backups"]
+    except FileNotFoundError:
+        entries = rebuild_index(outdir)
+    return sorted(entries, key=lambda e: e["name"], reverse=True)
+
+
+def save_index(outdir: Path, entries: List[dict]):
+    path = _index_path(outdir)
+    tmp = path.with_name(path.name + ".part")
+    with open(tmp, "w") as f:
+        json.dump({"backups": entries}, f, indent=1)
+    os.replace(tmp, path)
+
+
+def record_backup(outdir: Path, archive: Path, codec: str, image_size: int, sha256: str) -> dict:
+    """Add (or replace) the index entry for a newly written archive."""
+    entry = {
+        "name": archive.name,
+        "created": archive.name[len("db_backup_"):][:14],
+        "codec": codec,
+        "size": archive.stat().st_size,
+        "image_size": image_size,
+        "sha256": sha256,
+    }
+    entries = [e for e in load_index(outdir) if e["name"] != archive.name]
+    entries.append(entry)
+    save_index(outdir, entries)
+    return entry
+
+
+def rotate_backups(outdir: Path, retention: Retention) -> List[str]:
+    """Delete archives not selected by `retention`; returns the removed names."""
+    entries = load_index(outdir)
+    keep = select_retained((e["name"] for e in entries), retention)
+    kept, removed = [], []
+    for entry in entries:
+        if entry["name"] in keep:
+            kept.append(entry)
+            continue
+        try:
+            (Path(outdir) / entry["name"]).unlink(missing_ok=True)
+            removed.append(entry["name"])
+            logger.info("Removed old backup: %s", entry["name"])
+        except Exception:
+            logger.exception("Failed to remove old backup %s", entry["name"])
+            kept.append(entry)
+    if removed:
+        save_index(outdir, kept)
+    return removed
+
+
+def find_entry(outdir: Path, name: str) -> Optional[dict]:
+    """Index entry for archive `name`; None if unknown or `outdir` has no index."""
+    if not _index_path(outdir).exists():
+        return None
+    for entry in load_index(outdir):
+        if entry["name"] == name:
+            return entry
+    return None
@@ -1,21 +1,41 @@
 from allauth.account.signals import user_logged_in
 from allauth.socialaccount.signals import pre_social_login
-from allauth.socialaccount.exceptions import ImmediateHttpResponse
+from allauth.core.exceptions import ImmediateHttpResponse
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth import logout
+from django.contrib.auth.models import User
 from django.contrib import messages
 from django.shortcuts import redirect
 from django.http import HttpResponseRedirect
-from .models import UserProfile, UserCredits
+from .models import AppEntitlement, UserProfile, UserCredits, UserOTP
+from .middleware import (forget_provisioned, invalidate_profile_completion, is_provisioned,
+                         remember_profile_completion, remember_provisioned)
+from .domains import is_workspace_email
+from .account_cache import invalidate_account_rows
+from .catalog import invalidate_company_entitlements, invalidate_entitlements
 
 
-BLOCKED_DOMAINS = ['gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com']
+def ensure_user_records(user):
+    """
+    Make sure the user has a profile and credits; returns the profile.
 
+    Uses the related objects already loaded on `user` (select_related), so a
+    user fetched by the login query costs no extra queries here. Marks the
+    user as provisioned, so later logins and views can skip the checks.
+    """
+    try:
+        profile = user.userprofile
+    except UserProfile.DoesNotExist:
+        profile, created = UserProfile.objects.get_or_create(user=user)
 
-def is_workspace_email(email):
-    """Check if email is a workspace email (not personal)"""
-    domain = email.lower().split('@')[-1]
-    return domain not in BLOCKED_DOMAINS
+    # 10 credits per user
+    try:
+        user.credits
+    except UserCredits.DoesNotExist:
+        UserCredits.objects.get_or_create(user=user)
+    remember_provisioned(user.pk)
+    return profile
 
 
 @receiver(pre_social_login)
@@ -41,13 +61,75 @@ def handle_user_login(sender, request, user, **kwargs):
         messages.error(request, "Only workspace emails are allowed. Personal Gmail accounts are not permitted.")
         return
     
-    # Get or create profile
-    profile, created = UserProfile.objects.get_or_create(user=user)
-    
-    # Get or create credits (10 credits per user)
-    credits, created = UserCredits.objects.get_or_create(user=user)
-    
-    # If profile is incomplete (new user from Gmail OAuth), redirect to complete it
-    if not profile.company_name or not profile.company_size:
-        # Store in session so we can check in middleware or view
-        request.session["needs_profile_completion"] = True
\ No newline at end of file
+    # Already provisioned: nothing to read or write. Incomplete profiles (new users from Gmail OAuth)
+    # are sent to complete them by ProfileCompletionMiddleware.
+    if is_provisioned(user.pk):
+        return
+
+    profile = ensure_user_records(user)
+    remember_profile_completion(user.pk, profile.is_complete)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def handle_profile_change(sender, instance, **kwargs):
+    """Invalidate the cached profile-completeness flag"""
+    invalidate_profile_completion(instance.user_id)
+
+
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_delete, sender=UserCredits)
+def handle_records_deleted(sender, instance, **kwargs):
+    """A deleted profile or credits row has to be recreated on the next login"""
+    forget_provisioned(instance.user_id)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_save, sender=UserCredits)
+@receiver(post_delete, sender=UserCredits)
+@receiver(post_save, sender=UserOTP)
+@receiver(post_delete, sender=UserOTP)
+def handle_account_row_change(sender, instance, **kwargs):
+    """Drop the user's cached account rows (accounts.account_cache)"""
+    invalidate_account_rows(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def handle_user_created(sender, instance, created, **kwargs):
+    """A new user id may have been cached as having no rows (e.g. a reused SQLite rowid)"""
+    if created:
+        invalidate_account_rows(instance.pk)
+        invalidate_entitlements([instance.pk])
+
+
+@receiver(post_save, sender=UserProfile)
+def handle_company_change(sender, instance, **kwargs):
+    """Company grants follow UserProfile.company_name"""
+    invalidate_entitlements([instance.user_id])
+
+
+def _invalidate_grantee(user_id, company_name):
+    if user_id:
+        invalidate_entitlements([user_id])
+    else:
+        invalidate_company_entitlements(company_name)
+
+
+@receiver(pre_save, sender=AppEntitlement)
+def remember_entitlement_grantee(sender, instance, **kwargs):
+    """Keep who an existing entitlement applied to, so moving it also revokes the old grantee"""
+    instance._previous_grantee = None
+    if instance.pk is not None:
+        instance._previous_grantee = (
+            AppEntitlement.objects.filter(pk=instance.pk).values_list("user_id", "company_name").first())
+
+
+@receiver(post_save, sender=AppEntitlement)
+@receiver(post_delete, sender=AppEntitlement)
+def handle_entitlement_change(sender, instance, **kwargs):
+    """Drop the cached grants of everyone the entitlement applies, or applied, to"""
+    previous = getattr(instance, "_previous_grantee", None)
+    if previous and previous != (instance.user_id, instance.company_name):
+        _invalidate_grantee(*previous)
+    _invalidate_grantee(instance.user_id, instance.company_name)
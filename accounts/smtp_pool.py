@@ -0,0 +1,124 @@
+# accounts/smtp_pool.py
+import logging
+import queue
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Sequence
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPConnectionPool:
+    """
+    Small pool of long-lived email backend connections.
+
+    Each checkout hands out an already-open backend so a batch of messages
+    goes over one SMTP session (one TCP + STARTTLS handshake). Connections
+    idle for longer than `max_idle` seconds are probed with NOOP and
+    reopened if the server dropped them.
+    """
+
+    def __init__(self, size: Optional[int] = None, max_idle: Optional[float] = None,
+                 backend_factory: Optional[Callable] = None):
+        self.size = size or getattr(settings, "EMAIL_SMTP_POOL_SIZE", 4)
+        self.max_idle = max_idle if max_idle is not None else getattr(settings, "EMAIL_SMTP_POOL_MAX_IDLE_SECONDS", 30)
+        self.backend_factory = backend_factory or get_connection
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle = queue.LifoQueue()
+        self._closed = False
+        self.opened = 0
+
+    def _open(self):
+        backend = self.backend_factory()
+        backend.open()
+        self.opened += 1
+        return backend
+
+    @staticmethod
+    def _reset(backend):
+        """Close a backend, ignoring errors from an already-dead session."""
+        try:
+            backend.close()
+        except Exception:
+            pass
+        if hasattr(backend, "connection"):
+            backend.connection = None
+
+    def _reopen(self, backend):
+        self._reset(backend)
+        backend.open()
+        self.opened += 1
+
+    def _is_alive(self, backend) -> bool:
+        conn = getattr(backend, "connection", None)
+        if conn is None:
+            # Non-SMTP backends (locmem, console) have nothing to go stale
+            return not hasattr(backend, "connection")
+        try:
+            return conn.noop()[0] == 250
+        except Exception:
+            return False
+
+    @contextmanager
+    def connection(self):
+        """Check out an open backend; blocks while all `size` connections are in use."""
+        self._slots.acquire()
+        backend = None
+        try:
+            try:
+                backend, last_used = self._idle.get_nowait()
+                if time.monotonic() - last_used > self.max_idle and not self._is_alive(backend):
+                    logger.info("Reconnecting stale SMTP connection.")
+                    self._reopen(backend)
+            except queue.Empty:
+                backend = self._open()
+            yield backend
+        except Exception:
+            if backend is not None:
+                self._reset(backend)
+                backend = None
+            raise
+        finally:
+            if backend is not None:
+                if self._closed:
+                    self._reset(backend)
+                else:
+                    self._idle.put((backend, time.monotonic()))
+            self._slots.release()
+
+    def send_batch(self, messages: Sequence) -> List[Optional[Exception]]:
+        """
+        Send `messages` over a single pooled connection.
+
+        Returns one entry per message: None on success, or the exception.
+        A dropped session is reopened once and the message retried.
+        """
+        results: List[Optional[Exception]] = []
+        with self.connection() as backend:
+            for message in messages:
+                message.connection = backend
+                try:
+                    try:
+                        backend.send_messages([message])
+                    except (smtplib.SMTPServerDisconnected, ConnectionError):
+                        self._reopen(backend)
+                        backend.send_messages([message])
+                    results.append(None)
+                except Exception as exc:
+                    results.append(exc)
+        return results
+
+    def close(self):
+        """Close all idle connections; checked-out ones close on return."""
+        self._closed = True
+        while True:
+            try:
+                backend, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._reset(backend)
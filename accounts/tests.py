@@ -1,3 +1,1727 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import gzip
+import importlib
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection, connections, IntegrityError, OperationalError
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches
+from django.utils import timezone
+
+from . import account_cache, async_views, backup, catalog, checks, domains, hashing, otp, provisioning, ratelimit, signals, credits, incremental, leader, loadtest, outbox, restore, retention, views, walship
+from .devsmtp import DebugSMTPServer
+from .endpoint_bench import SCENARIOS, compare_to_baseline, count_statements, run_all, seed_dataset
+from .metering import CreditMeter
+from .middleware import ProfileCompletionMiddleware
+from .models import AppEntitlement, CreditHold, CreditLedgerEntry, EmailOutbox, UserCredits, UserOTP, UserProfile
+from .smtp_pool import SMTPConnectionPool
+
+
+def setUpModule():
+    # Test clients connect from 127.0.0.1 without a proxy header; RateLimitTests covers that warning
+    ratelimit._proxy_checked = True
+
+
+def otp_from(item):
+    """The code in a queued OTP email"""
+    return loadtest.OTP_IN_EMAIL.search(item.body).group(1)
+
+
+def count_table_queries(queries, table):
+    """Count captured queries that touch the given table"""
+    return sum(1 for q in queries if table in q['sql'])
+
+
+class ProfileCompletionMiddlewareTests(TestCase):
+    """Per-request profile query count before and after the completeness cache is warm"""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.middleware = ProfileCompletionMiddleware(lambda request: HttpResponse("ok"))
+        self.user = User.objects.create_user(username="a@acme.io", email="a@acme.io", password="pw")
+
+    def _request(self, path="/profile/"):
+        request = self.factory.get(path)
+        request.user = User.objects.get(pk=self.user.pk)  # loaded without its profile
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.middleware(request)
+        return response, count_table_queries(ctx.captured_queries, UserProfile._meta.db_table)
+
+    def test_completed_profile_needs_no_queries_once_cached(self):
+        UserProfile.objects.create(user=self.user, company_name="Acme", company_size="<50")
+
+        response, cold = self._request()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(cold, 1)
+
+        for _ in range(10):
+            response, warm = self._request()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(warm, 0)
+
+    def test_profile_save_invalidates_cached_flag(self):
+        profile = UserProfile.objects.create(user=self.user)
+
+        response, _ = self._request()
+        self.assertEqual(response.status_code, 302)
+
+        profile.company_name = "Acme"
+        profile.company_size = "<50"
+        profile.save()
+
+        response, queries = self._request()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 1)
+
+    def test_missing_profile_redirects(self):
+        response, _ = self._request()
+        self.assertEqual(response.status_code, 302)
+
+
+class LoginQueryBudgetTests(TestCase):
+    """A successful password login stays within LOGIN_QUERY_BUDGET"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="a@acme.io", email="a@acme.io", password="pw-12345")
+        UserProfile.objects.create(user=self.user, company_name="Acme", company_size="<50")
+        UserCredits.objects.create(user=self.user, total_credits=10)
+        self.otp = UserOTP.objects.create(user=self.user, is_verified=True)
+
+    def _login(self, password="pw-12345"):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post("/login/", {"email": "a@acme.io", "password": password,
+                                                    "login_submit": "1"})
+        return response, ctx.captured_queries
+
+    def test_successful_login_query_budget(self):
+        response, queries = self._login()
+        self.assertRedirects(response, "/profile/", fetch_redirect_response=False)
+        self.assertEqual(count_statements(queries), views.LOGIN_QUERY_BUDGET)
+        self.assertEqual(count_table_queries(queries, UserProfile._meta.db_table), 1)
+        self.assertEqual(int(self.client.session["_auth_user_id"]), self.user.pk)
+
+        # The completeness flag was primed, so only the view itself reads the profile next
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get("/profile/")
+        self.assertEqual(count_table_queries(ctx.captured_queries, UserProfile._meta.db_table), 1)
+
+    def test_missing_records_are_created_and_rejections_kept(self):
+        UserCredits.objects.filter(user=self.user).delete()
+        UserProfile.objects.filter(user=self.user).update(company_name="")
+        response, _queries = self._login()
+        self.assertRedirects(response, "/complete-profile/", fetch_redirect_response=False)
+        self.assertTrue(UserCredits.objects.filter(user=self.user).exists())
+        self.client.logout()
+
+        response, _queries = self._login(password="wrong")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("_auth_user_id", self.client.session)
+
+        self.otp.is_verified = False
+        self.otp.save()
+        response, _queries = self._login()
+        self.assertRedirects(response, "/verify-otp/?email=a@acme.io", fetch_redirect_response=False)
+
+    def test_provisioned_users_log_in_without_provisioning_queries(self):
+        def provisioning_queries(queries):
+            return [q["sql"] for q in queries
+                    if UserProfile._meta.db_table in q["sql"] or UserCredits._meta.db_table in q["sql"]]
+
+        for _ in range(2):
+            response, queries = self._login()
+            self.assertRedirects(response, "/profile/", fetch_redirect_response=False)
+            self.assertEqual(count_statements(queries), views.LOGIN_QUERY_BUDGET)
+            # Session + one identity query (rows joined, or from the account cache); no get_or_create
+            for path in ("/complete-profile/", "/profile/"):
+                with CaptureQueriesContext(connection) as ctx:
+                    self.assertEqual(self.client.get(path).status_code, 200)
+                self.assertEqual(count_statements(ctx.captured_queries), 2)
+                self.assertLessEqual(len(provisioning_queries(ctx.captured_queries)), 1)
+            # The login page sends signed-in users on using the profile loaded with them
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertRedirects(self.client.get("/login/"), "/profile/", fetch_redirect_response=False)
+            self.assertEqual(count_statements(ctx.captured_queries), 2)
+            self.client.logout()
+
+        # Social logins (allauth's user_logged_in) only check records until the user is provisioned
+        cache.clear()
+        request = RequestFactory().get("/accounts/google/login/callback/")
+        request.session = SessionStore()
+        user = User.objects.get(pk=self.user.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            signals.handle_user_login(sender=User, request=request, user=user)
+        self.assertEqual(len(provisioning_queries(ctx.captured_queries)), 2)
+        with self.assertNumQueries(0):
+            signals.handle_user_login(sender=User, request=request, user=User(pk=self.user.pk, email=user.email))
+        self.assertFalse(request.session.modified)
+
+        # Deleting a row drops the marker, so the next login recreates it
+        UserCredits.objects.filter(user=self.user).delete()
+        signals.handle_user_login(sender=User, request=request, user=User.objects.get(pk=self.user.pk))
+        self.assertTrue(UserCredits.objects.filter(user=self.user).exists())
+
+
+class RequestIdentityTests(TestCase):
+    """One query loads user, profile and credits for the middleware and views; session checks still apply"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="a@acme.io", email="a@acme.io", password="pw-12345")
+        UserProfile.objects.create(user=self.user, company_name="Acme", company_size="<50")
+        UserCredits.objects.create(user=self.user, total_credits=42)
+        self.client.force_login(self.user)
+
+    def test_profile_page_uses_one_identity_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/profile/")
+        self.assertContains(response, "Acme")
+        self.assertContains(response, "42")
+        # The session row, then the user with profile, credits and OTP state joined
+        self.assertEqual(count_statements(ctx.captured_queries), 2)
+        self.assertEqual(count_table_queries(ctx.captured_queries, UserProfile._meta.db_table), 1)
+        self.assertEqual(count_table_queries(ctx.captured_queries, UserCredits._meta.db_table), 1)
+
+        # A missing row reads as None and is created where the views used get_or_create
+        UserCredits.objects.filter(user=self.user).delete()
+        self.assertContains(self.client.get("/profile/"), "Acme")
+        self.assertTrue(UserCredits.objects.filter(user=self.user).exists())
+
+    def test_session_verification_kept(self):
+        self.user.set_password("changed-pw-1")
+        self.user.save()
+        response = self.client.get("/profile/")
+        self.assertRedirects(response, "/login/?next=/profile/", fetch_redirect_response=False)
+
+        self.client.force_login(self.user)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.get("/profile/")
+        self.assertRedirects(response, "/login/?next=/profile/", fetch_redirect_response=False)
+
+
+class AccountCacheTests(TestCase):
+    """L1/L2 tiers, counters, single-flight loads and invalidation of cached account rows"""
+
+    def setUp(self):
+        account_cache.get_account_cache().clear_local()
+        caches["accounts"].clear()
+        cache.clear()
+
+    def test_tiers_counters_and_eviction(self):
+        tiered = account_cache.TieredCache(alias="default", prefix="t", l1_maxsize=2, l1_ttl=60)
+        loads = []
+
+        def loader(value):
+            return lambda: loads.append(value) or value
+
+        self.assertEqual(tiered.get_or_load("a", loader(1)), 1)
+        self.assertEqual(tiered.get_or_load("a", loader(99)), 1)  # L1
+        tiered.clear_local()
+        self.assertEqual(tiered.get_or_load("a", loader(99)), 1)  # L2, refills L1
+        self.assertIsNone(tiered.get_or_load("missing", loader(None)))
+        self.assertIsNone(tiered.get_or_load("missing", loader(99)))  # a missing value is cached too
+        tiered.get_or_load("b", loader(2))  # third key in a 2-entry L1
+        tiered.invalidate("a")
+        self.assertEqual(tiered.get_or_load("a", loader(3)), 3)
+        self.assertEqual(loads, [1, None, 2, 3])
+        stats = tiered.stats()
+        self.assertEqual((stats["l1_hits"], stats["l2_hits"], stats["misses"], stats["loads"]), (2, 1, 4, 4))
+        self.assertGreaterEqual(stats["evictions"], 1)
+        self.assertEqual(stats["invalidations"], 1)
+
+    def test_concurrent_misses_load_once(self):
+        tiered = account_cache.TieredCache(alias="default", prefix="t")
+        calls = []
+
+        def slow_loader():
+            calls.append(1)
+            time.sleep(0.1)
+            return "row"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(tiered.get_or_load("k", slow_loader)))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, ["row"] * 8)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(tiered.stats()["waits"], 7)
+
+        # Another process holds the lease: wait for its result in L2 instead of loading
+        other = account_cache.TieredCache(alias="default", prefix="t", wait_seconds=1)
+        cache.add("t:j:lease", 1, 5)
+        threading.Timer(0.05, cache.set, ("t:j", "theirs")).start()
+        self.assertEqual(other.get_or_load("j", lambda: "ours"), "theirs")
+
+    def test_profile_rows_cached_and_invalidated(self):
+        user = User.objects.create_user(username="a@acme.io", email="a@acme.io", password="pw")
+        profile = UserProfile.objects.create(user=user, company_name="Acme", company_size="<50")
+        UserCredits.objects.create(user=user, total_credits=10)
+        self.client.force_login(user)
+
+        self.assertContains(self.client.get("/profile/"), "Acme")
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertContains(self.client.get("/profile/"), "Acme")
+        # Rows from the cache: the user row is read without joins
+        self.assertEqual(count_table_queries(ctx.captured_queries, UserProfile._meta.db_table), 0)
+        self.assertEqual(count_statements(ctx.captured_queries), 2)
+
+        profile.company_name = "Acme Labs"
+        profile.save()  # post_save
+        self.assertContains(self.client.get("/profile/"), "Acme Labs")
+
+        credits.consume(user, 3)  # queryset UPDATE, invalidated explicitly
+        self.assertEqual(self.client.get("/profile/").context["credits"].used_credits, 3)
+
+        UserCredits.objects.filter(user=user).delete()  # post_delete
+        self.client.get("/profile/")
+        self.assertTrue(UserCredits.objects.filter(user=user).exists())
+
+
+class AsyncViewsTests(TestCase):
+    """The async flow (ACCOUNTS_ASYNC_VIEWS) behaves like the sync views end to end"""
+
+    def setUp(self):
+        cache.clear()
+        self.settings_override = override_settings(ACCOUNTS_ASYNC_VIEWS=True)
+        self.settings_override.enable()
+        self.addCleanup(self._reload_urls)
+        self.addCleanup(self.settings_override.disable)
+        self._reload_urls()
+        self.user = User.objects.create_user(username="a@acme.io", email="a@acme.io", password="pw-12345")
+        UserProfile.objects.create(user=self.user, company_name="Acme", company_size="<50")
+        UserCredits.objects.create(user=self.user, total_credits=10)
+        UserOTP.objects.create(user=self.user, is_verified=True)
+
+    def _reload_urls(self):
+        import myproject.urls
+        importlib.reload(myproject.urls)
+        clear_url_caches()
+
+    async def test_routes_are_async(self):
+        import myproject.urls
+        self.assertIs(myproject.urls.flow, async_views)
+        self.assertTrue(ProfileCompletionMiddleware.async_capable)
+        response = await self.async_client.get("/profile/")
+        self.assertRedirects(response, "/login/?next=/profile/", fetch_redirect_response=False)
+
+    async def test_login_and_profile(self):
+        response = await self.async_client.post("/login/", {"email": "a@acme.io", "password": "wrong",
+                                                            "login_submit": "1"})
+        self.assertContains(response, "Invalid email or password.")
+
+        response = await self.async_client.post("/login/", {"email": "a@acme.io", "password": "pw-12345",
+                                                            "login_submit": "1"})
+        self.assertRedirects(response, "/profile/", fetch_redirect_response=False)
+        response = await self.async_client.get("/profile/")
+        self.assertContains(response, "Acme")
+        self.assertContains(response, "Docmind")
+        response = await self.async_client.get("/login/")
+        self.assertRedirects(response, "/profile/", fetch_redirect_response=False)
+
+    async def test_signup_verify_and_complete_profile(self):
+        response = await self.async_client.post("/login/?mode=signup", {
+            "email": "b@acme.io", "password": "pw-12345", "password_confirm": "pw-12345",
+            "company_name": "", "company_size": "<50", "signup_submit": "1"})
+        self.assertEqual(response.status_code, 200)
+
+        response = await self.async_client.post("/login/?mode=signup", {
+            "email": "b@acme.io", "password": "pw-12345", "password_confirm": "pw-12345",
+            "company_name": "Beta", "company_size": "<50", "signup_submit": "1"})
+        self.assertRedirects(response, "/verify-otp/?email=b@acme.io", fetch_redirect_response=False)
+        user = await User.objects.aget(email="b@acme.io")
+        self.assertTrue(user.check_password("pw-12345"))
+        first = await EmailOutbox.objects.aget(to_email="b@acme.io")
+
+        response = await self.async_client.get("/resend-otp/?email=b@acme.io")
+        self.assertRedirects(response, "/verify-otp/?email=b@acme.io", fetch_redirect_response=False)
+        resent = await EmailOutbox.objects.filter(to_email="b@acme.io").order_by("-id").afirst()
+        self.assertNotEqual(resent.pk, first.pk)
+
+        response = await self.async_client.post("/verify-otp/?email=b@acme.io", {"otp": otp_from(first)})
+        self.assertContains(response, "Invalid OTP")
+        response = await self.async_client.post("/verify-otp/?email=b@acme.io", {"otp": otp_from(resent)})
+        self.assertRedirects(response, "/login/", fetch_redirect_response=False)
+        self.assertTrue((await UserOTP.objects.aget(user=user)).is_verified)
+
+        # An incomplete profile is sent to complete_profile by the async middleware path
+        await UserProfile.objects.filter(user__email="b@acme.io").aupdate(company_name="")
+        await cache.aclear()
+        await self.async_client.post("/login/", {"email": "b@acme.io", "password": "pw-12345", "login_submit": "1"})
+        response = await self.async_client.get("/profile/")
+        self.assertRedirects(response, "/complete-profile/", fetch_redirect_response=False)
+        response = await self.async_client.post("/complete-profile/", {"company_name": "Beta", "company_size": "<50"})
+        self.assertRedirects(response, "/profile/", fetch_redirect_response=False)
+        response = await self.async_client.get("/profile/")
+        self.assertContains(response, "Beta")
+
+
+class PasswordHashingPoolTests(TestCase):
+    """Hashing and verification in the process pool, hash upgrades and backpressure"""
+
+    def setUp(self):
+        self.pool = hashing.HashingPool(workers=1, max_pending=2, queue_timeout=0.05)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_hash_and_verify_in_pool(self):
+        encoded = self.pool.hash("pw-12345")
+        self.assertEqual(self.pool.verify("pw-12345", encoded), (True, None))
+        self.assertEqual(self.pool.verify("wrong", encoded), (False, None))
+        self.assertEqual(asyncio.run(self.pool.averify("pw-12345", encoded)), (True, None))
+        self.assertTrue(asyncio.run(self.pool.ahash("pw-12345")))
+        self.assertEqual(hashing.HashingPool(workers=0).verify("pw-12345", encoded), (True, None))
+
+    def test_pool_recovers_from_dead_worker(self):
+        encoded = self.pool.hash("pw-12345")
+        for process in list(self.pool._executor._processes.values()):
+            process.kill()
+            process.join()
+        with self.assertLogs("accounts.hashing", "WARNING"):
+            self.assertEqual(self.pool.verify("pw-12345", encoded), (True, None))
+        self.assertEqual(asyncio.run(self.pool.averify("pw-12345", encoded)), (True, None))
+
+    def test_cancelled_wait_gives_back_its_slot(self):
+        pool = hashing.HashingPool(workers=1, max_pending=1, queue_timeout=5)
+        self.addCleanup(pool.shutdown)
+        pool._slots.acquire()
+
+        async def cancel_while_waiting():
+            task = asyncio.create_task(pool.ahash("pw"))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            # The waiting thread gets the slot only now, after the request is gone
+            pool._slots.release()
+            await asyncio.sleep(0.05)
+
+        asyncio.run(cancel_while_waiting())
+        self.assertTrue(pool._slots.acquire(blocking=False))
+
+    def test_outdated_hash_is_upgraded_on_login(self):
+        # A salt this short fails must_update_salt, like a hash from an older Django
+        user = User.objects.create(username="a@acme.io", email="a@acme.io", password=make_password("pw-12345", "ab"))
+        old = user.password
+        self.assertTrue(hashing.check_user_password(user, "pw-12345"))
+        user.refresh_from_db()
+        self.assertNotEqual(user.password, old)
+        self.assertTrue(user.check_password("pw-12345"))
+
+    def test_saturated_pool_sheds_load(self):
+        for _ in range(self.pool.max_pending):
+            self.pool._slots.acquire()
+        with self.assertRaises(hashing.HashingBusy):
+            self.pool.hash("pw")
+        with self.assertRaises(hashing.HashingBusy):
+            asyncio.run(self.pool.ahash("pw"))
+
+        with mock.patch("accounts.views.hash_password", side_effect=hashing.HashingBusy):
+            response = self.client.post("/login/", {"email": "nobody@acme.io", "password": "pw",
+                                                    "login_submit": "1"})
+        self.assertEqual(response.status_code, 503)
+        self.assertContains(response, "Too many sign-in attempts", status_code=503)
+
+
+class OTPStoreTests(TestCase):
+    """Cache-backed OTPs: hashed codes, single use, attempt limits, expiry and DB writes per cycle"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="a@acme.io", email="a@acme.io", password="pw-12345")
+        UserOTP.objects.create(user=self.user, is_verified=False)
+
+    def test_code_is_hashed_and_single_use(self):
+        code = otp.issue_otp(self.user.pk)
+        self.assertEqual(cache.get(f"accounts:otp:{self.user.pk}"), otp.code_digest(self.user.pk, code))
+        self.assertNotIn(code, cache.get(f"accounts:otp:{self.user.pk}"))
+        self.assertEqual(otp.check_otp(self.user.pk, "000000" if code != "000000" else "111111"), otp.INVALID)
+        self.assertEqual(otp.check_otp(self.user.pk, code), otp.VERIFIED)
+        self.assertEqual(otp.check_otp(self.user.pk, code), otp.EXPIRED)
+
+        # A resend invalidates the previous code
+        first = otp.issue_otp(self.user.pk)
+        second = otp.issue_otp(self.user.pk)
+        if first != second:
+            self.assertEqual(otp.check_otp(self.user.pk, first), otp.INVALID)
+        self.assertEqual(asyncio.run(otp.acheck_otp(self.user.pk, second)), otp.VERIFIED)
+
+    @override_settings(OTP_MAX_ATTEMPTS=3)
+    def test_attempt_limit_and_expiry(self):
+        code = otp.issue_otp(self.user.pk)
+        wrong = "000000" if code != "000000" else "111111"
+        results = [otp.check_otp(self.user.pk, wrong) for _ in range(4)]
+        self.assertEqual(results, [otp.INVALID] * 3 + [otp.TOO_MANY_ATTEMPTS])
+        self.assertEqual(otp.check_otp(self.user.pk, code), otp.EXPIRED)
+
+        code = asyncio.run(otp.aissue_otp(self.user.pk))
+        later = time.time() + 11 * 60
+        with mock.patch("django.core.cache.backends.locmem.time.time", return_value=later):
+            self.assertEqual(otp.check_otp(self.user.pk, code), otp.EXPIRED)
+
+    def test_concurrent_verifications_consume_once(self):
+        code = otp.issue_otp(self.user.pk)
+        results, barrier = [], threading.Barrier(8)
+
+        def verify():
+            barrier.wait()
+            results.append(otp.check_otp(self.user.pk, code))
+
+        threads = [threading.Thread(target=verify) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results.count(otp.VERIFIED), 1)
+
+    def test_process_local_cache_fails_check_with_several_workers(self):
+        self.assertEqual(checks.check_otp_cache(), [])
+        with mock.patch.dict(os.environ, {"WEB_CONCURRENCY": "4"}):
+            self.assertEqual([e.id for e in checks.check_otp_cache()], ["accounts.E002"])
+            shared = {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "otp"}
+            with override_settings(CACHES={**settings.CACHES, "otp": shared}, OTP_CACHE="otp"):
+                self.assertEqual(checks.check_otp_cache(), [])
+        with override_settings(OTP_CACHE="missing"):
+            self.assertEqual([e.id for e in checks.check_otp_cache()], ["accounts.E001"])
+
+    def test_signup_resend_verify_writes(self):
+        def writes(queries):
+            return [q["sql"].split('"')[1] for q in queries if q["sql"].startswith(("INSERT", "UPDATE", "DELETE"))]
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post("/login/?mode=signup", {
+                "email": "b@acme.io", "password": "pw-12345", "password_confirm": "pw-12345",
+                "company_name": "Beta", "company_size": "<50", "signup_submit": "1"})
+        self.assertEqual(writes(ctx.captured_queries).count(UserOTP._meta.db_table), 1)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get("/resend-otp/?email=b@acme.io")
+        self.assertEqual(writes(ctx.captured_queries), [EmailOutbox._meta.db_table])
+
+        code = otp_from(EmailOutbox.objects.order_by("-id").first())
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post("/verify-otp/?email=b@acme.io", {"otp": code})
+        self.assertRedirects(response, "/login/", fetch_redirect_response=False)
+        self.assertEqual(writes(ctx.captured_queries), [UserOTP._meta.db_table])
+        self.assertTrue(UserOTP.objects.get(user__email="b@acme.io").is_verified)
+
+
+class RateLimitTests(TestCase):
+    """Sliding-window estimates, both backends, and rejection before any ORM work"""
+
+    RULES = {"resend_otp": {"ip": "5/m", "email": "2/m"}, "login": {"methods": ["POST"], "ip": "3/m"}}
+
+    def setUp(self):
+        previous = ratelimit._limiter
+        ratelimit._limiter = ratelimit.RateLimiter(ratelimit.LocalBackend(), self.RULES)
+        self.addCleanup(setattr, ratelimit, "_limiter", previous)
+        cache.clear()
+
+    def test_sliding_window_backends(self):
+        self.assertEqual(ratelimit.parse_rate("10/m"), (10, 60))
+        self.assertEqual(ratelimit.parse_rate("5/30"), (5, 30))
+        for backend in (ratelimit.LocalBackend(), ratelimit.CacheBackend()):
+            start = 600.0  # start of a window
+            self.assertEqual([backend.hit("k", 3, 60, start + i)[0] for i in range(4)], [True] * 3 + [False])
+            self.assertEqual(backend.hit("k", 3, 60, start + 10), (False, 50))
+            # Halfway through the next window the previous 3 hits weigh 1.5, leaving room for 2
+            self.assertEqual([backend.hit("k", 3, 60, start + 90)[0] for _ in range(2)], [True, True])
+            allowed, wait = backend.hit("k", 3, 60, start + 90)
+            self.assertFalse(allowed)
+            self.assertGreaterEqual(wait, 1)
+            # Two windows later the key is clean again
+            self.assertTrue(backend.hit("k", 3, 60, start + 200)[0])
+
+    def test_middleware_rejects_before_orm(self):
+        statuses = [self.client.get("/resend-otp/?email=nobody@acme.io").status_code for _ in range(2)]
+        self.assertEqual(statuses, [302, 302])
+        with self.assertNumQueries(0):
+            response = self.client.get("/resend-otp/?email=NOBODY@acme.io")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+        # Other emails from the same IP run into the per-IP limit (the rejected request above counted
+        # against the IP, which is checked first)
+        self.assertEqual([self.client.get(f"/resend-otp/?email=x{i}@acme.io").status_code for i in range(3)],
+                         [302, 302, 429])
+
+        # Only POSTs count for the login rule
+        for _ in range(5):
+            self.assertEqual(self.client.get("/login/").status_code, 200)
+        with override_settings(RATELIMIT_ENABLED=False):
+            for _ in range(5):
+                self.assertNotEqual(self.client.get("/resend-otp/?email=y@acme.io").status_code, 429)
+
+    def test_rule_follows_the_view_not_the_url(self):
+        # "/" serves the login page too, so it shares the login rule and the /login/ budget
+        data = {"email": "someone@acme.io", "password": "wrong"}
+        statuses = [self.client.post(path, data).status_code for path in ("/", "/login/", "/")]
+        self.assertNotIn(429, statuses)
+        with self.assertNumQueries(0):
+            response = self.client.post("/", data)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.client.post("/login/", data).status_code, 429)
+        self.assertEqual(self.client.get("/").status_code, 200)
+
+    def test_decorator_sync_and_async(self):
+        factory = RequestFactory()
+
+        @ratelimit.ratelimit("login")
+        def view(request):
+            return HttpResponse("ok")
+
+        @ratelimit.ratelimit("login")
+        async def async_view(request):
+            return HttpResponse("ok")
+
+        codes = [view(factory.post("/x/", REMOTE_ADDR="10.0.0.1")).status_code for _ in range(4)]
+        self.assertEqual(codes, [200, 200, 200, 429])
+        codes = [asyncio.run(async_view(factory.post("/x/", REMOTE_ADDR="10.0.0.2"))).status_code for _ in range(4)]
+        self.assertEqual(codes, [200, 200, 200, 429])
+
+        # A request the middleware already counted isn't counted twice
+        request = factory.post("/x/", REMOTE_ADDR="10.0.0.3")
+        request._ratelimit_checked = {"login"}
+        self.assertEqual([view(request).status_code for _ in range(5)], [200] * 5)
+
+    def test_warns_once_when_requests_look_proxied(self):
+        factory = RequestFactory()
+        self.addCleanup(setattr, ratelimit, "_proxy_checked", True)
+        for remote_addr in ("127.0.0.1", "10.0.0.9", "fd00::1"):
+            ratelimit._proxy_checked = False
+            with self.assertLogs("accounts.ratelimit", "WARNING") as logs:
+                self.assertEqual(ratelimit.client_ip(factory.get("/", REMOTE_ADDR=remote_addr)), remote_addr)
+            self.assertIn("RATELIMIT_IP_HEADER", logs.output[0])
+            # Only the first request is looked at
+            with self.assertNoLogs("accounts.ratelimit"):
+                ratelimit.client_ip(factory.get("/", REMOTE_ADDR=remote_addr))
+
+        ratelimit._proxy_checked = False
+        with self.assertNoLogs("accounts.ratelimit"):
+            ratelimit.client_ip(factory.get("/", REMOTE_ADDR="93.184.216.34"))
+        ratelimit._proxy_checked = False
+        with override_settings(RATELIMIT_IP_HEADER="HTTP_X_FORWARDED_FOR"), self.assertNoLogs("accounts.ratelimit"):
+            request = factory.get("/", REMOTE_ADDR="10.0.0.9", HTTP_X_FORWARDED_FOR="93.184.216.34, 10.0.0.9")
+            self.assertEqual(ratelimit.client_ip(request), "93.184.216.34")
+
+
+class ProvisioningTests(TestCase):
+    """Bulk provisioning from CSV/XLSX: chunked writes, hashed passwords, skipped rows reported"""
+
+    def write_csv(self, text):
+        path = Path(tempfile.mkdtemp()) / "users.csv"
+        self.addCleanup(shutil.rmtree, path.parent, True)
+        path.write_text(text)
+        return path
+
+    def test_csv_rows_created_and_skips_reported(self):
+        User.objects.create(username="taken@acme.io", email="taken@acme.io")
+        path = self.write_csv(
+            "Email,Password,First_Name,Company_Name,Company_Size,Credits\n"
+            "ann@acme.io,s3cret-pass,Ann,Acme,<50,25\n"
+            "bob@acme.io,,Bob,,,\n"
+            "not-an-email,x,,,,\n"
+            "joe@gmail.com,x,,,,\n"
+            "ANN@acme.io,x,,,,\n"
+            "taken@acme.io,x,,,,\n"
+            "cat@acme.io,x,,,huge,\n"
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            report = provisioning.provision(provisioning.iter_rows(path), chunk_size=1, workers=1,
+                                            defaults={"company_name": "Default Co", "credits": 5})
+
+        self.assertEqual((report.rows, report.created), (7, 2))
+        self.assertEqual(report.skipped, {"invalid email": 1, "not a workspace email": 1, "duplicate in file": 1,
+                                          "already exists": 1, "invalid company_size": 1})
+        self.assertIn("line 4: not-an-email: invalid email", report.examples)
+
+        ann = User.objects.select_related("userprofile", "credits", "otp").get(email="ann@acme.io")
+        self.assertTrue(ann.check_password("s3cret-pass"))
+        self.assertEqual((ann.first_name, ann.userprofile.company_name, ann.credits.total_credits), ("Ann", "Acme", 25))
+        self.assertTrue(ann.otp.is_verified)
+        bob = User.objects.select_related("userprofile", "credits").get(email="bob@acme.io")
+        self.assertFalse(bob.has_usable_password())
+        self.assertEqual((bob.userprofile.company_name, bob.credits.total_credits), ("Default Co", 5))
+        # One profile INSERT per chunk, not one per user
+        self.assertEqual(count_table_queries(ctx, "accounts_userprofile"), 2)
+
+    def test_xlsx_unverified_and_dry_run(self):
+        from openpyxl import Workbook
+
+        path = Path(tempfile.mkdtemp()) / "users.xlsx"
+        self.addCleanup(shutil.rmtree, path.parent, True)
+        workbook = Workbook()
+        workbook.active.append(["email", "company_size", "credits"])
+        workbook.active.append(["dee@acme.io", "50-100", 3])
+        workbook.active.append([None, None, None])
+        workbook.active.append(["eve@acme.io", None, "lots"])
+        workbook.save(path)
+
+        report = provisioning.provision(provisioning.iter_rows(path), workers=1, dry_run=True)
+        self.assertEqual((report.rows, report.created, dict(report.skipped)), (2, 1, {"invalid credits": 1}))
+        self.assertFalse(User.objects.filter(email="dee@acme.io").exists())
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            provisioning.provision(provisioning.iter_rows(path), workers=1, verified=False)
+        dee = User.objects.select_related("otp", "credits").get(email="dee@acme.io")
+        self.assertFalse(dee.otp.is_verified)
+        self.assertEqual(dee.credits.total_credits, 3)
+        # The code is queued with the accounts, and the dispatcher woken once they commit
+        item = EmailOutbox.objects.get()
+        self.assertEqual(item.to_email, "dee@acme.io")
+        self.assertEqual(otp.check_otp(dee.pk, otp_from(item)), otp.VERIFIED)
+        self.assertIn(outbox.wake_dispatcher, callbacks)
+        response = self.client.post("/login/", {"email": "dee@acme.io", "password": "x", "login_submit": "1"})
+        self.assertRedirects(response, "/verify-otp/?email=dee@acme.io", fetch_redirect_response=False)
+
+
+    def test_cached_state_of_created_users_invalidated(self):
+        path = self.write_csv("email\nann@acme.io\nbob@acme.io\n")
+        with mock.patch.object(provisioning, "invalidate_account_rows") as invalidate_rows, \
+                mock.patch.object(provisioning, "invalidate_entitlements") as invalidate_grants, \
+                mock.patch.object(provisioning, "forget_provisioned") as forget:
+            provisioning.provision(provisioning.iter_rows(path), workers=1)
+        user_ids = list(User.objects.order_by("pk").values_list("pk", flat=True))
+        invalidate_rows.assert_called_once_with(*user_ids)
+        invalidate_grants.assert_called_once_with(user_ids)
+        self.assertEqual([c.args[0] for c in forget.call_args_list], user_ids)
+
+    def test_chunk_that_keeps_conflicting_is_skipped(self):
+        path = self.write_csv("email\nann@acme.io\nbob@acme.io\n")
+        with mock.patch.object(provisioning, "_write", side_effect=IntegrityError("UNIQUE constraint failed")) as write, \
+                self.assertLogs(provisioning.logger, "WARNING"):
+            report = provisioning.provision(provisioning.iter_rows(path), workers=1)
+        self.assertEqual(write.call_count, provisioning.WRITE_ATTEMPTS)
+        self.assertEqual((report.created, dict(report.skipped)), (0, {"write conflict": 2}))
+
+
+class EmailDomainPolicyTests(TestCase):
+    """Exact and wildcard blocks, memoized lookups and hot reload of the domain file"""
+
+    def test_exact_and_wildcard_entries(self):
+        policy = domains.DomainPolicy(["gmail.com", "*.mailinator.com", "  Yahoo.COM. ", ""])
+        self.assertFalse(policy.is_workspace_email("a@gmail.com"))
+        self.assertTrue(policy.is_workspace_email("a@mx.gmail.com"))  # exact entries don't cover subdomains
+        self.assertFalse(policy.is_workspace_email("a@mailinator.com"))
+        self.assertFalse(policy.is_workspace_email("A@Deep.Sub.MAILINATOR.com."))
+        self.assertTrue(policy.is_workspace_email("a@notmailinator.com"))
+        self.assertFalse(policy.is_workspace_email("a@yahoo.com"))
+        self.assertTrue(policy.is_workspace_email("ann@acme.io"))
+        self.assertEqual(policy.size, 3)
+
+        # The shipped list keeps the original four providers blocked
+        self.assertFalse(domains.is_workspace_email("someone@gmail.com"))
+        self.assertFalse(views.is_workspace_email("someone@outlook.com"))
+
+    def test_file_reloaded_on_change_and_kept_when_missing(self):
+        path = Path(tempfile.mkdtemp()) / "blocked.txt"
+        self.addCleanup(shutil.rmtree, path.parent, True)
+        path.write_text("# comment\nfree.example  # inline comment\n")
+        policy = domains.ReloadingPolicy(path, check_interval=0)
+        self.assertFalse(policy.is_workspace_email("a@free.example"))
+        self.assertTrue(policy.is_workspace_email("a@temp.example"))
+
+        path.write_text("*.temp.example\n")
+        os.utime(path, (time.time() + 10, time.time() + 10))
+        self.assertFalse(policy.is_workspace_email("a@x.temp.example"))
+        self.assertTrue(policy.is_workspace_email("a@free.example"))
+
+        # A missing file keeps the last good list rather than letting everyone in
+        path.unlink()
+        self.assertFalse(policy.is_workspace_email("a@temp.example"))
+        self.assertFalse(domains.ReloadingPolicy(path).is_workspace_email("a@gmail.com"))
+
+
+class AppCatalogTests(TestCase):
+    """Public and restricted apps, user/company grants, cached lookups and invalidation"""
+
+    def setUp(self):
+        catalog.get_entitlement_cache().clear_local()
+        cache.clear()
+        config = list(catalog.DEFAULT_APPS) + [
+            {"slug": "labs", "name": "Labs", "description": "Early access", "icon": "🧪",
+             "url": "/labs/", "color": "#000000", "public": False},
+        ]
+        patcher = mock.patch.object(catalog, "_catalog", catalog.Catalog.from_config(config))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user("ann", "ann@acme.io", "pw")
+        self.profile = UserProfile.objects.create(user=self.user, company_name="Acme")
+
+    def slugs(self, user, profile=None):
+        return [entry.slug for entry in catalog.visible_apps(user, profile)]
+
+    def test_restricted_app_needs_user_or_company_grant(self):
+        self.assertEqual(self.slugs(self.user, self.profile), [a["slug"] for a in catalog.DEFAULT_APPS])
+        self.assertFalse(catalog.has_app(self.user, "labs", self.profile))
+        self.assertTrue(catalog.has_app(self.user, "docmind"))
+        self.assertFalse(catalog.has_app(self.user, "nope"))
+
+        grant = AppEntitlement.objects.create(app="labs", user=self.user)
+        self.assertIn("labs", self.slugs(self.user, self.profile))
+        grant.delete()
+        self.assertNotIn("labs", self.slugs(self.user, self.profile))
+
+        AppEntitlement.objects.create(app="labs", company_name="Acme")
+        self.assertTrue(catalog.has_app(self.user, "labs", self.profile))
+        # Leaving the company drops its grants
+        self.profile.company_name = "Other"
+        self.profile.save()
+        self.assertFalse(catalog.has_app(self.user, "labs", self.profile))
+
+    def test_moved_grant_revokes_previous_grantee(self):
+        other = User.objects.create_user("bob", "bob@other.io", "pw")
+        other_profile = UserProfile.objects.create(user=other, company_name="Other")
+        grant = AppEntitlement.objects.create(app="labs", company_name="Acme")
+        self.assertTrue(catalog.has_app(self.user, "labs", self.profile))
+        self.assertFalse(catalog.has_app(other, "labs", other_profile))
+
+        grant.company_name = "Other"
+        grant.save()
+        self.assertFalse(catalog.has_app(self.user, "labs", self.profile))
+        self.assertTrue(catalog.has_app(other, "labs", other_profile))
+
+        # From a company to a single user
+        grant.company_name, grant.user = "", self.user
+        grant.save()
+        self.assertFalse(catalog.has_app(other, "labs", other_profile))
+        self.assertTrue(catalog.has_app(self.user, "labs", self.profile))
+
+    def test_grants_cached_and_visible_tuples_shared(self):
+        other = User.objects.create_user("bob", "bob@acme.io", "pw")
+        with self.assertNumQueries(1):
+            first = catalog.visible_apps(self.user, self.profile)
+        with self.assertNumQueries(0):
+            self.assertIs(catalog.visible_apps(self.user, self.profile), first)
+        catalog.visible_apps(other)
+        self.assertIs(catalog.visible_apps(other), first)
+
+        # A catalog with nothing restricted never looks grants up
+        with mock.patch.object(catalog, "_catalog", catalog.Catalog.from_config(catalog.DEFAULT_APPS)):
+            with self.assertNumQueries(0):
+                self.assertEqual(len(catalog.visible_apps(other)), 6)
+
+    def test_large_catalog_lookup_and_duplicates(self):
+        apps = [{"slug": f"app{i}", "name": f"App {i}", "description": "", "icon": "", "url": f"/app{i}/",
+                 "color": "#FFFFFF", "public": i % 2 == 0} for i in range(5000)]
+        big = catalog.Catalog.from_config(apps)
+        self.assertEqual(len(big.public), 2500)
+        self.assertEqual(len(big.visible(frozenset({"app1", "app3"}))), 2502)
+        with mock.patch.object(catalog, "_catalog", big), self.assertNumQueries(0):
+            self.assertTrue(catalog.has_app(self.user, "app4998"))
+        with self.assertRaises(ValueError):
+            catalog.Catalog.from_config(apps[:2] + apps[:1])
+
+
+class EndpointBenchmarkTests(TestCase):
+    """Every hot endpoint stays under its query ceiling; slow runs are flagged against the baseline"""
+
+    def test_endpoints_within_query_ceilings(self):
+        cache.clear()
+        results = run_all(seed_dataset(users=120), iterations=3)
+        self.assertEqual(set(results), {s.name for s in SCENARIOS})
+        self.assertEqual(compare_to_baseline(results, {}), [])
+
+    def test_baseline_comparison(self):
+        baseline = {"profile GET": {"queries": 2, "p50_ms": 2.0, "p90_ms": 3.0}}
+        ok = {"profile GET": {"queries": 2, "p50_ms": 2.4, "p90_ms": 3.5}}
+        self.assertEqual(compare_to_baseline(ok, baseline, tolerance=0.25), [])
+
+        slow = {"profile GET": {"queries": 3, "p50_ms": 2.6, "p90_ms": 3.5}}
+        problems = compare_to_baseline(slow, baseline, tolerance=0.25)
+        self.assertEqual(len(problems), 3)  # ceiling, baseline query count, p50
+        self.assertTrue(any("p50_ms" in p for p in problems))
+
+
+class LoadTestHarnessTests(TestCase):
+    """Load-test results are keyed by URL name and bucketed into a latency histogram"""
+
+    def test_stats_report(self):
+        self.assertEqual(loadtest.url_name("/verify-otp/?email=a@acme.io"), "verify_otp")
+        self.assertEqual(loadtest.parse_mix("profile=3,login=1"), {"profile": 3, "login": 1})
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix("checkout=1")
+
+        stats = loadtest.LoadStats()
+        for seconds in (0.001, 0.007, 0.040, 3.0):
+            stats.record("profile GET", seconds, 200, True)
+        stats.record("profile GET", 0.002, None, False)
+        row = stats.report(elapsed=1.0)["profile GET"]
+        self.assertEqual(row["count"], 5)
+        self.assertEqual(row["errors"], 1)
+        self.assertEqual(row["statuses"], {200: 4, "conn-error": 1})
+        self.assertEqual(row["histogram"], [2, 1, 0, 1, 0, 0, 0, 0, 0, 1])
+
+    def test_otp_read_from_file_mailbox(self):
+        mail_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, mail_dir, True)
+        with override_settings(EMAIL_BACKEND="django.core.mail.backends.filebased.EmailBackend",
+                               EMAIL_FILE_PATH=str(mail_dir)):
+            connection = mail.get_connection()
+            connection.send_messages([
+                mail.EmailMessage("OTP", views.otp_email(user, code)[1], "noreply@dashboard.com", [user.email])
+                for user, code in ((User(email="a@acme.io"), "111111"), (User(email="b@acme.io"), "222222"),
+                                   (User(email="a@acme.io"), "333333"))
+            ])
+        self.assertEqual(loadtest.find_otp(mail_dir, "a@acme.io"), "333333")
+        self.assertEqual(loadtest.find_otp(mail_dir, "b@acme.io"), "222222")
+        self.assertIsNone(loadtest.find_otp(mail_dir, "c@acme.io"))
+
+
+class EmailOutboxTests(TestCase):
+    """Views only enqueue; the dispatcher delivers with retry and backoff"""
+
+    def test_signup_enqueues_otp_without_sending(self):
+        response = self.client.post("/login/", {
+            "signup_submit": "1",
+            "email": "new@acme.io",
+            "password": "s3cret-pass",
+            "password_confirm": "s3cret-pass",
+            "company_name": "Acme",
+            "company_size": "<50",
+        })
+        self.assertRedirects(response, "/verify-otp/?email=new@acme.io", fetch_redirect_response=False)
+        self.assertEqual(len(mail.outbox), 0)
+        item = EmailOutbox.objects.get()
+        self.assertEqual(item.to_email, "new@acme.io")
+        self.assertEqual(item.status, EmailOutbox.STATUS_PENDING)
+        self.assertTrue(otp_from(item))
+        self.assertFalse(User.objects.get(email="new@acme.io").otp.is_verified)
+
+    def test_dispatch_delivers_and_marks_sent(self):
+        outbox.enqueue_email("Subject", "Body", "a@acme.io")
+        self.assertEqual(outbox.dispatch_pending(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].body, "Body")
+        item = EmailOutbox.objects.get()
+        self.assertEqual(item.status, EmailOutbox.STATUS_SENT)
+        # The body (an OTP code, typically) isn't kept once delivered
+        self.assertEqual(item.body, "")
+        self.assertEqual(outbox.dispatch_pending(), 0)
+
+    def test_finished_rows_purged_after_retention(self):
+        sent, failed, pending = (outbox.enqueue_email("Subject", "Body", "a@acme.io") for _ in range(3))
+        EmailOutbox.objects.filter(pk=sent.pk).update(status=EmailOutbox.STATUS_SENT)
+        EmailOutbox.objects.filter(pk=failed.pk).update(status=EmailOutbox.STATUS_FAILED)
+        self.assertEqual(outbox.purge_finished(), 0)
+        EmailOutbox.objects.update(created_at=timezone.now() - timedelta(days=8))
+        self.assertEqual(outbox.purge_finished(), 2)
+        self.assertEqual(list(EmailOutbox.objects.values_list("pk", flat=True)), [pending.pk])
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_failed_send_is_retried_with_backoff_then_given_up(self):
+        item = outbox.enqueue_email("Subject", "Body", "a@acme.io")
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError("smtp down")):
+            outbox.dispatch_pending()
+            item.refresh_from_db()
+            self.assertEqual(item.status, EmailOutbox.STATUS_PENDING)
+            self.assertEqual(item.attempts, 1)
+            self.assertGreater(item.next_attempt_at, timezone.now())
+            # Not due yet
+            self.assertEqual(outbox.dispatch_pending(), 0)
+
+            EmailOutbox.objects.update(next_attempt_at=timezone.now())
+            outbox.dispatch_pending()
+            item.refresh_from_db()
+            self.assertEqual(item.status, EmailOutbox.STATUS_FAILED)
+            self.assertEqual(item.last_error, "smtp down")
+            self.assertEqual(item.body, "")
+
+    def test_claim_is_exclusive(self):
+        outbox.enqueue_email("Subject", "Body", "a@acme.io")
+        self.assertEqual(len(outbox.claim_due(10)), 1)
+        self.assertEqual(outbox.claim_due(10), [])
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_expired_lease_counts_as_an_attempt(self):
+        item = outbox.enqueue_email("Subject", "Body", "a@acme.io")
+        for attempts in (0, 1):
+            [claimed] = outbox.claim_due(10)
+            self.assertEqual(claimed.attempts, attempts)
+            # The sender died mid-send; the lease runs out
+            EmailOutbox.objects.update(next_attempt_at=timezone.now())
+
+        # The second expiry reaches max attempts: dead-lettered instead of claimed again
+        self.assertEqual(outbox.claim_due(10), [])
+        item.refresh_from_db()
+        self.assertEqual(item.status, EmailOutbox.STATUS_FAILED)
+        self.assertEqual(item.attempts, 2)
+        self.assertEqual(item.body, "")
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_dispatcher_started_on_commit_or_left_to_command(self):
+        self.addCleanup(setattr, outbox, "_dispatcher", None)
+        with mock.patch.object(outbox, "OutboxDispatcher") as dispatcher_class:
+            dispatcher_class.return_value.is_alive.return_value = True
+            for _ in range(2):
+                with self.captureOnCommitCallbacks(execute=True):
+                    outbox.enqueue_email("Subject", "Body", "a@acme.io")
+            dispatcher_class.return_value.start.assert_called_once_with()
+
+            outbox._dispatcher = None
+            with override_settings(EMAIL_OUTBOX_DISPATCH="command"), self.captureOnCommitCallbacks(execute=True):
+                outbox.enqueue_email("Subject", "Body", "a@acme.io")
+                outbox.start_dispatcher()
+            dispatcher_class.return_value.start.assert_called_once_with()
+
+            # Server processes start it at startup, with nothing queued
+            outbox.start_dispatcher()
+            self.assertEqual(dispatcher_class.return_value.start.call_count, 2)
+
+        call_command("run_outbox", "--once", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(EmailOutbox.objects.exclude(status=EmailOutbox.STATUS_SENT).exists())
+
+
+class SMTPConnectionPoolTests(TestCase):
+    """Batches share one SMTP session; stale sessions are reopened"""
+
+    def setUp(self):
+        self.smtp = DebugSMTPServer().start()
+        self.addCleanup(self.smtp.stop)
+
+    def _pool(self, **kwargs):
+        pool = SMTPConnectionPool(backend_factory=lambda: mail.get_connection(
+            "django.core.mail.backends.smtp.EmailBackend",
+            host=self.smtp.host, port=self.smtp.port, use_tls=False, username="", password="",
+        ), **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def _messages(self, n):
+        return [mail.EmailMessage("s", "b", "noreply@dashboard.com", [f"u{i}@acme.io"]) for i in range(n)]
+
+    def test_batch_uses_one_connection(self):
+        pool = self._pool(size=2)
+        self.assertEqual(pool.send_batch(self._messages(20)), [None] * 20)
+        self.assertEqual(pool.send_batch(self._messages(5)), [None] * 5)
+        self.assertEqual(self.smtp.messages, 25)
+        self.assertEqual(self.smtp.connections, 1)
+
+    def test_stale_connection_is_reopened(self):
+        pool = self._pool(size=1, max_idle=0)
+        pool.send_batch(self._messages(1))
+        with pool.connection() as backend:
+            backend.connection.sock.shutdown(socket.SHUT_RDWR)
+        self.assertEqual(pool.send_batch(self._messages(3)), [None] * 3)
+        self.assertEqual(self.smtp.messages, 4)
+        self.assertEqual(pool.opened, 2)
+
+
+class CreditsTests(TestCase):
+    """consume/reserve/commit/release move credits with conditional UPDATEs and a ledger"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="c@acme.io", email="c@acme.io", password="pw")
+        UserCredits.objects.create(user=self.user, total_credits=10)
+
+    def balance(self):
+        return UserCredits.objects.get(user=self.user)
+
+    def test_consume_never_overspends(self):
+        credits.consume(self.user, 7)
+        with self.assertRaises(credits.InsufficientCredits):
+            credits.consume(self.user, 4)
+        credits.consume(self.user, 3)
+        self.assertEqual(self.balance().available_credits, 0)
+        self.assertEqual(CreditLedgerEntry.objects.filter(kind=CreditLedgerEntry.KIND_CONSUME).count(), 2)
+
+    def test_consume_is_a_single_update(self):
+        with CaptureQueriesContext(connection) as ctx:
+            credits.consume(self.user, 1)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn(UserCredits._meta.db_table,
+                         " ".join(q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')))
+
+    def test_reserve_commit_returns_unused_part(self):
+        hold = credits.reserve(self.user, 6)
+        self.assertEqual(self.balance().available_credits, 4)
+        with self.assertRaises(credits.InsufficientCredits):
+            credits.consume(self.user, 5)
+        credits.commit(hold, 2)
+        balance = self.balance()
+        self.assertEqual((balance.used_credits, balance.reserved_credits), (2, 0))
+        with self.assertRaises(credits.HoldNotActive):
+            credits.release(hold)
+
+    def test_release_and_expiry_return_credits(self):
+        hold = credits.reserve(self.user, 5)
+        credits.release(hold)
+        self.assertEqual(self.balance().available_credits, 10)
+
+        hold = credits.reserve(self.user, 10, ttl=60)
+        CreditHold.objects.filter(pk=hold.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        with self.assertRaises(credits.HoldNotActive):
+            credits.commit(hold)
+        # The expired hold is swept on the slow path so this debit succeeds
+        credits.consume(self.user, 10)
+        self.assertEqual(CreditHold.objects.get(pk=hold.pk).status, CreditHold.STATUS_EXPIRED)
+        self.assertEqual(self.balance().available_credits, 0)
+
+    def test_ledger_is_append_only(self):
+        credits.consume(self.user, 1)
+        entry = CreditLedgerEntry.objects.get()
+        with self.assertRaises(ValueError):
+            entry.save()
+
+
+class CreditsConcurrencyTests(TransactionTestCase):
+    """Multi-threaded stress: concurrent debits never exceed the balance"""
+
+    THREADS = 8
+    ATTEMPTS_PER_THREAD = 50
+    TOTAL = 150
+
+    def test_concurrent_consume_never_overspends(self):
+        user = User.objects.create_user(username="s@acme.io", email="s@acme.io", password="pw")
+        UserCredits.objects.create(user=user, total_credits=self.TOTAL)
+        succeeded, rejected = [], []
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker():
+            barrier.wait()
+            try:
+                for _ in range(self.ATTEMPTS_PER_THREAD):
+                    while True:
+                        try:
+                            credits.consume(user, 1)
+                            succeeded.append(1)
+                        except credits.InsufficientCredits:
+                            rejected.append(1)
+                        except OperationalError:
+                            # SQLite lock contention; the debit was rolled back, retry it
+                            time.sleep(0.001)
+                            continue
+                        break
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        balance = UserCredits.objects.get(user=user)
+        self.assertEqual(len(succeeded), self.TOTAL)
+        self.assertEqual(len(rejected), self.THREADS * self.ATTEMPTS_PER_THREAD - self.TOTAL)
+        self.assertEqual(balance.used_credits, self.TOTAL)
+        self.assertEqual(CreditLedgerEntry.objects.filter(user=user).count(), self.TOTAL)
+
+
+class CreditMeterTests(TestCase):
+    """Usage is aggregated in memory and flushed in batched UPDATEs"""
+
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f"m{i}@acme.io", email=f"m{i}@acme.io", password="pw")
+                      for i in range(5)]
+        for user in self.users:
+            UserCredits.objects.create(user=user, total_credits=1000)
+        self.meter = CreditMeter(flush_interval=60, chunk_size=3)
+
+    def test_flush_applies_deltas_in_chunked_updates(self):
+        for _ in range(20):
+            for user in self.users:
+                self.meter.record(user)
+        self.meter.record(self.users[0].pk, 5)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.meter.flush(), 5)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)  # 5 users in chunks of 3
+
+        used = dict(UserCredits.objects.values_list("user_id", "used_credits"))
+        self.assertEqual(used[self.users[0].pk], 25)
+        self.assertEqual(used[self.users[4].pk], 20)
+        self.assertEqual(self.meter.pending(), {})
+        self.assertEqual(self.meter.flush(), 0)
+
+    def test_failed_flush_keeps_deltas(self):
+        self.meter.record(self.users[0], 3)
+        with mock.patch.object(CreditMeter, "_apply", side_effect=OperationalError("locked")):
+            with self.assertRaises(OperationalError):
+                self.meter.flush()
+        self.meter.record(self.users[0], 1)
+        self.assertEqual(self.meter.pending(), {self.users[0].pk: 4})
+
+    def test_usage_of_deleted_or_unprovisioned_users_dropped(self):
+        bare = User.objects.create_user(username="bare@acme.io", email="bare@acme.io", password="pw")
+        for user in self.users[:4] + [bare]:
+            self.meter.record(user, 2)
+        gone = self.users[1].pk
+        self.users[1].delete()
+
+        with self.assertLogs("accounts.metering", "WARNING") as logs:
+            self.assertEqual(self.meter.flush(), 3)
+        self.assertIn(str(sorted([gone, bare.pk])), logs.output[0])
+        self.assertEqual(self.meter.pending(), {})
+        used = dict(UserCredits.objects.values_list("user_id", "used_credits"))
+        self.assertEqual([used[u.pk] for u in (self.users[0], self.users[2], self.users[3])], [2, 2, 2])
+        self.assertEqual(sorted(CreditLedgerEntry.objects.filter(reference="metered").values_list("user_id", flat=True)),
+                         sorted(u.pk for u in (self.users[0], self.users[2], self.users[3])))
+        self.assertEqual(self.meter.flush(), 0)
+
+    def test_stop_flushes_pending(self):
+        self.meter.record(self.users[1], 7)
+        self.meter.stop()
+        self.assertEqual(UserCredits.objects.get(user=self.users[1]).used_credits, 7)
+
+
+def make_sqlite_db(path, rows=2000, journal_mode="delete"):
+    """Create a small SQLite database with some filler rows"""
+    conn = sqlite3.connect(str(path))
+    conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, payload TEXT)")
+    conn.executemany("INSERT INTO t (payload) VALUES (?)", ((f"row-{i}-" * 20,) for i in range(rows)))
+    conn.commit()
+    return conn
+
+
+class StreamingBackupTests(TestCase):
+    """perform_backup compresses a consistent image as it reads it; in WAL mode writers carry on meanwhile"""
+
+    def setUp(self):
+        self.base_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.base_dir, True)
+
+    def restore(self, archive):
+        out = self.base_dir / "restored.sqlite3"
+        with backup.open_decompressed(archive) as f_in, open(out, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        conn = sqlite3.connect(str(out))
+        self.addCleanup(conn.close)
+        return conn
+
+    def test_each_codec_round_trips(self):
+        make_sqlite_db(self.base_dir / "db.sqlite3").close()
+        for codec in backup.available_codecs():
+            with self.subTest(codec=codec):
+                archive = backup.perform_backup(self.base_dir, codec=codec, level=1)
+                self.assertEqual(archive.suffix, backup.CODECS[codec])
+                conn = self.restore(archive)
+                self.assertEqual(conn.execute("PRAGMA integrity_check").fetchone()[0], "ok")
+                self.assertEqual(conn.execute("SELECT count(*) FROM t").fetchone()[0], 2000)
+                conn.close()
+                (self.base_dir / "restored.sqlite3").unlink()
+        self.assertEqual(list(self.base_dir.glob("db_backups/*.part")), [])
+
+    def test_wal_mode_includes_uncheckpointed_pages(self):
+        conn = make_sqlite_db(self.base_dir / "db.sqlite3", journal_mode="wal")
+        conn.execute("PRAGMA wal_autocheckpoint=0")
+        conn.execute("INSERT INTO t (payload) VALUES ('in-wal')")
+        conn.commit()
+        self.addCleanup(conn.close)
+
+        restored = self.restore(backup.perform_backup(self.base_dir))
+        self.assertEqual(restored.execute("SELECT count(*) FROM t WHERE payload = 'in-wal'").fetchone()[0], 1)
+
+    def backup_while_writing(self, write):
+        """perform_backup, calling write() before every compressed chunk; fails if the backup blocks writers"""
+        open_compressed = backup.open_compressed
+        files = []
+
+        class WritingArchive:
+            def __init__(self, *args, **kwargs):
+                self.f = open_compressed(*args, **kwargs)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                self.f.close()
+
+            def write(self, data):
+                write()
+                files.extend(p.name for p in self.base_dir.glob("db_backups/*") if not p.name.endswith(".part"))
+                self.f.write(data)
+
+        WritingArchive.base_dir = self.base_dir
+        with mock.patch.object(backup, "open_compressed", WritingArchive), \
+                mock.patch.object(backup, "CHUNK_SIZE", 64 * 1024):
+            archive = backup.perform_backup(self.base_dir)
+        # Nothing but the archive being written is staged next to it
+        self.assertEqual(files, [])
+        return self.restore(archive)
+
+    def test_wal_writers_not_blocked_while_compressing(self):
+        conn = make_sqlite_db(self.base_dir / "db.sqlite3", rows=3000, journal_mode="wal")
+        conn.execute("PRAGMA wal_autocheckpoint=0")
+        conn.execute("UPDATE t SET payload = 'in-wal' WHERE id <= 1000")
+        conn.commit()
+        # Kept open: closing the last connection would checkpoint and delete the WAL
+        self.addCleanup(conn.close)
+        writer = sqlite3.connect(str(self.base_dir / "db.sqlite3"), timeout=0)
+        self.addCleanup(writer.close)
+
+        def write():
+            writer.execute("UPDATE t SET payload = 'during' WHERE id % 7 = 0")
+            writer.execute("INSERT INTO t (payload) VALUES ('during')")
+            writer.commit()
+            # Checkpoints during the backup only copy what the backup's snapshot already sees
+            writer.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+        restored = self.backup_while_writing(write)
+        self.assertEqual(restored.execute("PRAGMA integrity_check").fetchone()[0], "ok")
+        self.assertEqual(restored.execute("SELECT count(*), sum(payload = 'in-wal') FROM t").fetchone(), (3000, 1000))
+
+    def test_wal_restarted_during_backup(self):
+        conn = make_sqlite_db(self.base_dir / "db.sqlite3", rows=3000, journal_mode="wal")
+        # Fully checkpointed, so the first write during the backup restarts the WAL over the indexed frames
+        self.assertEqual(conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()[0], 0)
+        self.addCleanup(conn.close)
+        writer = sqlite3.connect(str(self.base_dir / "db.sqlite3"), timeout=0)
+        self.addCleanup(writer.close)
+
+        def write():
+            writer.execute("UPDATE t SET payload = 'during'")
+            writer.commit()
+
+        restored = self.backup_while_writing(write)
+        self.assertEqual(restored.execute("PRAGMA integrity_check").fetchone()[0], "ok")
+        self.assertEqual(restored.execute("SELECT count(*), sum(payload = 'during') FROM t").fetchone(), (3000, 0))
+
+    def test_rollback_mode_streams_under_shared_lock(self):
+        make_sqlite_db(self.base_dir / "db.sqlite3").close()
+        writer = sqlite3.connect(str(self.base_dir / "db.sqlite3"), timeout=0)
+        self.addCleanup(writer.close)
+        blocked = []
+
+        def write():
+            try:
+                writer.execute("INSERT INTO t (payload) VALUES ('during')")
+                writer.commit()
+            except sqlite3.OperationalError:
+                writer.rollback()
+                blocked.append(True)
+
+        restored = self.backup_while_writing(write)
+        self.assertTrue(blocked)
+        self.assertEqual(restored.execute("SELECT count(*) FROM t").fetchone()[0], 2000)
+
+    def test_rotation_keeps_newest(self):
+        make_sqlite_db(self.base_dir / "db.sqlite3", rows=10).close()
+        outdir = self.base_dir / "db_backups"
+        outdir.mkdir()
+        for ts in ("20240101000000", "20240101010000", "20240101020000"):
+            (outdir / f"db_backup_{ts}.sqlite3.gz").write_bytes(b"")
+        newest = backup.perform_backup(self.base_dir, retention=2)
+        # Archives from before the index existed are picked up when it is first built
+        self.assertEqual(sorted(p.name for p in outdir.glob(backup.BACKUP_GLOB)),
+                         ["db_backup_20240101020000.sqlite3.gz", newest.name])
+
+
+class ThrottledBackupTests(TestCase):
+    """Step-wise backup reports progress, honours the rate cap and survives restarts"""
+
+    def setUp(self):
+        self.base_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.base_dir, True)
+        self.conn = make_sqlite_db(self.base_dir / "db.sqlite3", rows=3000)
+        self.addCleanup(self.conn.close)
+
+    def test_progress_and_rate_cap(self):
+        calls = []
+        start = time.monotonic()
+        archive = backup.perform_backup(self.base_dir, pages_per_step=50, max_bytes_per_sec=4 * 1024 * 1024,
+                                        progress=lambda *args: calls.append(args))
+        elapsed = time.monotonic() - start
+        self.assertIsNotNone(archive)
+        total = calls[-1][2]
+        self.assertEqual(calls[-1][1], 0)
+        self.assertGreaterEqual(len(calls), total // 50)
+        self.assertGreaterEqual(elapsed, total * 4096 / (4 * 1024 * 1024) * 0.9)
+
+    def test_copy_is_staged_on_disk(self):
+        images = []
+        outdir = self.base_dir / "db_backups"
+        archive = backup.perform_backup(self.base_dir, pages_per_step=100,
+                                        progress=lambda *args: images.extend(outdir.glob("*.image")))
+        self.assertIsNotNone(archive)
+        self.assertEqual({p.name for p in images}, {archive.name + ".image"})
+        self.assertEqual(list(outdir.glob("*.image*")), [])
+
+    def test_falls_back_when_writes_keep_restarting(self):
+        def write(status, remaining, total):
+            self.conn.execute("INSERT INTO t (payload) VALUES ('x')")
+            self.conn.commit()
+
+        with self.assertLogs("accounts.backup", "WARNING"):
+            archive = backup.perform_backup(self.base_dir, pages_per_step=10, progress=write)
+        self.assertIsNotNone(archive)
+        self.assertEqual(list((self.base_dir / "db_backups").glob("*.image*")), [])
+
+
+class IncrementalBackupTests(TestCase):
+    """Manifests of content-addressed chunks: only new chunks are stored, any point restores"""
+
+    def setUp(self):
+        self.base_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.base_dir, True)
+        self.conn = make_sqlite_db(self.base_dir / "db.sqlite3", rows=3000)
+        self.addCleanup(self.conn.close)
+        self.store = self.base_dir / "db_backups" / "chunks"
+
+    def backup(self, at=None, **kwargs):
+        with mock.patch.object(incremental, "datetime", wraps=datetime) as clock:
+            if at is not None:
+                clock.utcnow.return_value = datetime.strptime(at, "%Y%m%d%H%M%S")
+            manifest = incremental.perform_incremental_backup(self.base_dir, **kwargs)
+        self.assertIsNotNone(manifest)
+        return manifest
+
+    def chunk_count(self):
+        return len(list(self.store.glob("*/*")))
+
+    def restored_count(self, manifest):
+        dest = incremental.restore_incremental(manifest, self.base_dir / f"restore-{manifest.stem}.sqlite3")
+        conn = sqlite3.connect(str(dest))
+        self.addCleanup(conn.close)
+        self.assertEqual(conn.execute("PRAGMA integrity_check").fetchone()[0], "ok")
+        return conn.execute("SELECT count(*) FROM t").fetchone()[0]
+
+    def test_second_backup_stores_only_changed_chunks(self):
+        first = self.backup()
+        total = len(incremental.load_manifest(first)["chunks"])
+        self.assertEqual(self.chunk_count(), total)
+
+        self.conn.execute("UPDATE t SET payload = 'changed' WHERE id = 1")
+        self.conn.commit()
+        second = self.backup()
+        # Same second: numbered instead of replacing the first
+        self.assertEqual(second.name, first.stem + "-1.json")
+        self.assertLess(self.chunk_count(), total + 5)
+
+        self.assertEqual(self.restored_count(second), 3000)
+        restored = sqlite3.connect(str(self.base_dir / f"restore-{second.stem}.sqlite3"))
+        self.addCleanup(restored.close)
+        self.assertEqual(restored.execute("SELECT payload FROM t WHERE id = 1").fetchone()[0], "changed")
+
+    def test_rotation_collects_unreferenced_chunks(self):
+        old = self.backup(at="20000101000000")
+        self.conn.execute("DELETE FROM t")
+        self.conn.commit()
+        self.conn.execute("VACUUM")
+        new = self.backup(retention=1)
+        self.assertFalse(old.exists())
+        self.assertEqual(self.chunk_count(), len(set(incremental.load_manifest(new)["chunks"])))
+        self.assertEqual(self.restored_count(new), 0)
+
+    def test_backup_and_rotation_work_from_the_index(self):
+        first = self.backup(at="20000101000000")
+        self.conn.execute("UPDATE t SET payload = 'changed' WHERE id = 1")
+        self.conn.commit()
+        second = self.backup(at="20000101010000")
+        shared = set(incremental.load_manifest(first)["chunks"]) & set(incremental.load_manifest(second)["chunks"])
+        self.assertTrue(shared)
+
+        retention.load_index(self.base_dir / "db_backups")  # the (empty) archive index, built once
+        with mock.patch.object(Path, "glob", side_effect=AssertionError("directory scanned")):
+            third = self.backup(retention=2)
+            self.assertEqual(restore.find_backups(self.base_dir / "db_backups"), [third, second])
+        self.assertFalse(first.exists())
+        index = incremental.load_incremental_index(self.base_dir / "db_backups")
+        live = set(incremental.load_manifest(second)["chunks"]) | set(incremental.load_manifest(third)["chunks"])
+        self.assertEqual(set(index["chunks"]), live)
+        self.assertEqual({p.name for p in self.store.glob("*/*")}, live)
+        self.assertEqual(self.restored_count(second), 3000)
+
+        # A lost index is rebuilt from the manifests
+        (self.base_dir / "db_backups" / "manifests" / "index.json").unlink()
+        rebuilt = incremental.load_incremental_index(self.base_dir / "db_backups")
+        self.assertEqual(rebuilt["chunks"], index["chunks"])
+        self.assertCountEqual(rebuilt["backups"], index["backups"])
+
+    def test_manual_backup_waits_for_a_running_one(self):
+        outdir = self.base_dir / "db_backups"
+        results = []
+        with retention.backup_lock(outdir):
+            t = threading.Thread(target=lambda: results.append(incremental.perform_incremental_backup(self.base_dir)))
+            t.start()
+            t.join(0.5)
+            self.assertTrue(t.is_alive())
+            self.assertEqual(results, [])
+        t.join(10)
+        self.assertIsNotNone(results[0])
+
+    def test_corrupt_chunk_is_detected(self):
+        manifest = self.backup()
+        digest = incremental.load_manifest(manifest)["chunks"][0]
+        path = self.store / digest[:2] / digest
+        path.write_bytes(zlib.compress(b"garbage"))
+        with self.assertRaises(ValueError):
+            incremental.restore_incremental(manifest, self.base_dir / "bad.sqlite3")
+        self.assertFalse((self.base_dir / "bad.sqlite3").exists())
+
+
+class WALShippingTests(TestCase):
+    """Committed WAL frames are shipped continuously and can be replayed to a point in time"""
+
+    def setUp(self):
+        self.base_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.base_dir, True)
+        self.db_path = self.base_dir / "db.sqlite3"
+        self.conn = make_sqlite_db(self.db_path, rows=500, journal_mode="wal")
+        self.conn.execute("PRAGMA wal_autocheckpoint=0")
+        self.addCleanup(self.conn.close)
+        self.replica = self.base_dir / "replica"
+
+    def shipper(self, **kwargs):
+        shipper = walship.WALShipper(self.db_path, self.replica, **kwargs)
+        self.addCleanup(shipper.stop)
+        shipper.sync()
+        return shipper
+
+    def insert(self, n):
+        self.conn.executemany("INSERT INTO t (payload) VALUES (?)", [("x" * 200,)] * n)
+        self.conn.commit()
+
+    def restored_count(self, timestamp=None):
+        dest = walship.restore(self.replica, self.base_dir / f"restore-{time.monotonic_ns()}.sqlite3", timestamp)
+        conn = sqlite3.connect(str(dest))
+        self.addCleanup(conn.close)
+        self.assertEqual(conn.execute("PRAGMA integrity_check").fetchone()[0], "ok")
+        return conn.execute("SELECT count(*) FROM t").fetchone()[0]
+
+    def test_restore_latest_and_point_in_time(self):
+        shipper = self.shipper()
+        self.insert(100)
+        shipper.sync()
+        time.sleep(0.01)
+        midpoint = time.time()
+        time.sleep(0.01)
+        self.insert(100)
+        shipper.sync()
+
+        self.assertEqual(self.restored_count(), 700)
+        self.assertEqual(self.restored_count(midpoint), 600)
+
+    def test_checkpoints_keep_one_generation(self):
+        shipper = self.shipper(checkpoint_bytes=32 * 1024)
+        for _ in range(10):
+            self.insert(50)
+            shipper.sync()
+        self.assertGreater(shipper.state["index"], 1)
+        self.assertEqual(len(list((self.replica / "generations").iterdir())), 1)
+        self.assertEqual(self.restored_count(), 1000)
+
+    def test_external_checkpoint_starts_new_generation(self):
+        shipper = self.shipper()
+        self.insert(50)
+        shipper.sync()
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.insert(50)
+        shipper.sync()
+        self.assertEqual(len(list((self.replica / "generations").iterdir())), 2)
+        self.assertEqual(self.restored_count(), 600)
+
+    def test_snapshot_streamed_without_blocking_writers(self):
+        shipper = self.shipper()
+        writer = sqlite3.connect(str(self.db_path), timeout=0)
+        self.addCleanup(writer.close)
+        iter_pinned_pages = walship.iter_pinned_pages
+
+        def writing_pages(conn, db_path, salt, frames):
+            for chunk in iter_pinned_pages(conn, db_path, salt, frames, chunk_size=16 * 1024):
+                writer.execute("INSERT INTO t (payload) VALUES ('during')")
+                writer.commit()
+                yield chunk
+
+        self.insert(100)
+        shipper.snapshot_interval = 0
+        with mock.patch.object(walship, "iter_pinned_pages", writing_pages):
+            shipper.sync()
+        during = writer.execute("SELECT count(*) FROM t WHERE payload = 'during'").fetchone()[0]
+        self.assertGreater(during, 1)
+        self.assertEqual(len(list(self.replica.glob("generations/*/snapshots/*.sqlite3.gz"))), 2)
+        shipper.snapshot_interval = 3600
+        shipper.sync()
+        self.assertEqual(self.restored_count(), 600 + during)
+
+    @override_settings(BACKUP_WAL_AUTOCHECKPOINT_BYTES=256 * 1024)
+    def test_wal_stays_bounded_without_a_shipper(self):
+        class Connection:
+            vendor = "sqlite"
+
+            def cursor(inner):
+                return contextlib.closing(self.conn.cursor())
+
+        walship.configure_wal_connection(None, Connection())
+        self.assertEqual(self.conn.execute("PRAGMA wal_autocheckpoint").fetchone()[0], 64)
+        for _ in range(40):
+            self.insert(100)
+        self.assertLess(Path(str(self.db_path) + "-wal").stat().st_size, 1024 * 1024)
+
+
+class RestoreBackupTests(TestCase):
+    """Backups are verified in parallel and restored with an atomic swap"""
+
+    def setUp(self):
+        self.base_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.base_dir, True)
+        self.db_path = self.base_dir / "db.sqlite3"
+        conn = make_sqlite_db(self.db_path, rows=1000)
+        conn.close()
+        self.outdir = self.base_dir / "db_backups"
+
+    def test_verify_flags_truncated_and_corrupt_archives(self):
+        good = backup.perform_backup(self.base_dir, codec="gzip")
+        manifest = incremental.perform_incremental_backup(self.base_dir, outdir=self.base_dir / "inc")
+        truncated = self.outdir / "db_backup_20000101000000.sqlite3.gz"
+        truncated.write_bytes(good.read_bytes()[:2000])
+        image = bytearray(gzip.decompress(good.read_bytes()))
+        image[4096 * 2:4096 * 2 + 512] = b"\xff" * 512
+        corrupt = self.outdir / "db_backup_20000101000001.sqlite3.gz"
+        corrupt.write_bytes(gzip.compress(bytes(image)))
+
+        # Listing comes from the backup index, not a directory scan
+        self.assertEqual(restore.find_backups(self.outdir), [good])
+        results = {Path(r["path"]): r for r in restore.verify_backups(
+            [good, manifest, truncated, corrupt], workers=2)}
+        self.assertTrue(results[good]["ok"])
+        self.assertTrue(results[manifest]["ok"])
+        self.assertFalse(results[truncated]["ok"])
+        self.assertFalse(results[corrupt]["ok"])
+
+    def test_restore_swaps_in_backup_and_keeps_old(self):
+        archive = backup.perform_backup(self.base_dir, codec="gzip")
+        conn = sqlite3.connect(str(self.db_path))
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("DELETE FROM t")
+        conn.commit()
+        conn.close()
+
+        old = restore.restore_backup(archive, self.db_path)
+        self.assertFalse(Path(str(self.db_path) + "-wal").exists())
+        for path, expected in ((self.db_path, 1000), (old, 0)):
+            conn = sqlite3.connect(str(path))
+            self.addCleanup(conn.close)
+            self.assertEqual(conn.execute("SELECT count(*) FROM t").fetchone()[0], expected)
+
+    def test_failed_check_leaves_database_untouched(self):
+        bad = self.outdir / "db_backup_20000101000000.sqlite3.gz"
+        self.outdir.mkdir()
+        bad.write_bytes(gzip.compress(b"not a database" * 1000))
+        before = self.db_path.read_bytes()
+        with self.assertRaises(Exception):
+            restore.restore_backup(bad, self.db_path)
+        self.assertEqual(self.db_path.read_bytes(), before)
+        self.assertEqual(list(self.base_dir.glob("*.restore-part")), [])
+
+
+def _scheduler_worker(lock_path, state_path, log_path, interval):
+    """One 'gunicorn worker': runs the leader-gated scheduler, logging each run"""
+    def job():
+        with open(log_path, "a") as f:
+            f.write(f"{os.getpid()} {time.time()}\n")
+
+    leader.run_as_leader(threading.Event(), leader.LeaderElection(lock_path), interval, poll_interval=interval / 8,
+                         state_path=state_path, job=job)
+
+
+class LeaderElectionTests(TestCase):
+    """Exactly one process per host runs the backup schedule, with failover"""
+
+    def test_one_run_per_interval_across_processes_and_failover(self):
+        work = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, work, True)
+        log_path, interval = work / "runs.log", 0.4
+        ctx = multiprocessing.get_context("fork")
+        procs = [ctx.Process(target=_scheduler_worker, args=(work / "lock", work / "last_run", log_path, interval))
+                 for _ in range(4)]
+        for p in procs:
+            p.start()
+        try:
+            time.sleep(1.3)
+            first_leader = int(log_path.read_text().split()[0])
+            os.kill(first_leader, signal.SIGKILL)
+            time.sleep(1.8)
+        finally:
+            for p in procs:
+                p.terminate()
+                p.join(timeout=5)
+
+        runs = [line.split() for line in log_path.read_text().splitlines()]
+        times = [float(ts) for _pid, ts in runs]
+        gaps = [b - a for a, b in zip(times, times[1:])]
+        self.assertGreaterEqual(len(runs), 6)
+        self.assertGreater(min(gaps), interval * 0.9)
+        # The new leader continues the schedule within one interval of the old one dying
+        self.assertLess(max(gaps), interval * 2)
+        self.assertGreaterEqual(len({pid for pid, _ts in runs}), 2)
+        self.assertNotIn(str(first_leader), {pid for pid, _ts in runs[len(runs) // 2 + 1:]})
+
+
+class BackupRetentionTests(TestCase):
+    """Backups are indexed with checksums and rotated by a tiered policy"""
+
+    policy = {"hourly": 24, "daily": 14, "weekly": 8}
+
+    def test_tiered_policy_over_two_months_of_hourly_backups(self):
+        start = timezone.datetime(2024, 1, 1)
+        names = [f"db_backup_{(start + timedelta(hours=h)):%Y%m%d%H%M%S}.sqlite3.gz" for h in range(24 * 60)]
+        keep = retention.select_retained(names, self.policy)
+
+        newest = sorted(names)[-1]
+        self.assertIn(newest, keep)
+        # 24 hourly + 13 more days + weeks beyond those, instead of 1440 (or 168 for only 7 days)
+        self.assertLess(len(keep), 24 + 14 + 8)
+        oldest_kept = min(retention.backup_time(n) for n in keep)
+        self.assertLessEqual(oldest_kept, retention.backup_time(newest) - timedelta(weeks=6))
+        self.assertEqual(retention.select_retained(names, 168), set(sorted(names)[-168:]))
+        with self.assertRaises(ValueError):
+            retention.select_retained(names, {"yearly": 2})
+
+    def test_rotation_reads_index_and_verify_uses_checksum(self):
+        base_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, base_dir, True)
+        make_sqlite_db(base_dir / "db.sqlite3", rows=200).close()
+        outdir = base_dir / "db_backups"
+        archive = backup.perform_backup(base_dir)
+        entry = retention.find_entry(outdir, archive.name)
+        self.assertEqual(entry["size"], archive.stat().st_size)
+        self.assertEqual(len(entry["sha256"]), 64)
+
+        # Old archives are only known through the index; rotation never globs the directory
+        old_names = [f"db_backup_2000010{d}000000.sqlite3.gz" for d in range(1, 4)]
+        for name in old_names:
+            shutil.copy(archive, outdir / name)
+        retention.save_index(outdir, retention.load_index(outdir) + [
+            dict(entry, name=name, created=name[10:24]) for name in old_names])
+        with mock.patch.object(Path, "glob", side_effect=AssertionError("directory scanned")):
+            removed = retention.rotate_backups(outdir, {"daily": 2})
+        self.assertEqual(removed, old_names[:2][::-1])
+        self.assertEqual([e["name"] for e in retention.load_index(outdir)], [archive.name, old_names[2]])
+
+        # A valid archive that doesn't match its indexed checksum fails verification
+        other = make_sqlite_db(base_dir / "other.sqlite3", rows=5)
+        other.close()
+        (outdir / old_names[2]).write_bytes(gzip.compress((base_dir / "other.sqlite3").read_bytes()))
+        results = {Path(r["path"]).name: r for r in restore.verify_backups(restore.find_backups(outdir), workers=1)}
+        self.assertTrue(results[archive.name]["ok"])
+        self.assertIn("checksum", results[old_names[2]]["result"])
@@ -1,26 +1,36 @@
+from functools import wraps
+
 from django.shortcuts import render, redirect
-from django.contrib.auth import login, logout, authenticate
+from django.contrib.auth import login, logout
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.signals import user_login_failed
 from django.contrib.auth.models import User
-from django.core.mail import send_mail
-from .forms import SignupForm, LoginForm, OTPVerificationForm, generate_otp
+from .forms import SignupForm, LoginForm, OTPVerificationForm
 from .models import UserProfile, UserCredits, UserOTP
+from .middleware import remember_profile_completion
+from .outbox import enqueue_email
+from .ratelimit import ratelimit
+from .signals import ensure_user_records
+from .hashing import HashingBusy, check_user_password, hash_password
+from .otp import ERRORS as OTP_ERRORS, VERIFIED, check_otp, issue_otp
+from .domains import is_workspace_email
+from .catalog import visible_apps
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.urls import reverse
 
 
 
-BLOCKED_DOMAINS = ['gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com']
-
-
-def is_workspace_email(email):
-    """Check if email is a workspace email (not personal)"""
-    domain = email.lower().split('@')[-1]
-    return domain not in BLOCKED_DOMAINS
+# Backend recorded in the session for password logins (see authenticate_loaded_user)
+LOGIN_BACKEND = 'django.contrib.auth.backends.ModelBackend'
 
+# Queries for a successful password login (excluding BEGIN/COMMIT), enforced in tests:
+# 1 joined user/OTP/profile/credits SELECT, 1 last_login UPDATE, and 3 for the
+# session (key existence check, INSERT on cycle_key, UPDATE when the response is saved)
+LOGIN_QUERY_BUDGET = 5
 
-def send_otp_email(user, otp_code):
-    """Send OTP email to user"""
+def otp_email(user, otp_code):
+    """Subject and body of the OTP verification email"""
     subject = "Email Verification - Your OTP"
     message = f"""
     Hello {user.email},
@@ -32,26 +42,63 @@ def send_otp_email(user, otp_code):
     Best regards,
     Dashboard Team
     """
-    try:
-        send_mail(
-            subject,
-            message,
-            'noreply@dashboard.com',
-            [user.email],
-            fail_silently=False,
-        )
-        return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
+    return subject, message
+
+
+def send_otp_email(user, otp_code):
+    """Queue OTP email to user (delivered by the background outbox dispatcher)"""
+    subject, message = otp_email(user, otp_code)
+    enqueue_email(subject, message, user.email)
+
+
+def authenticate_loaded_user(request, user, password, password_ok=None):
+    """
+    authenticate() for a user that is already loaded.
+
+    ModelBackend would fetch the user again by username; this does the same
+    checks (password, is_active) on the object we have and marks it with the
+    backend so login() accepts it. The password is checked in the hashing
+    pool unless the caller already did (`password_ok`).
+    """
+    backend = ModelBackend()
+    if password_ok is None:
+        password_ok = check_user_password(user, password)
+    if password_ok and backend.user_can_authenticate(user):
+        user.backend = LOGIN_BACKEND
+        return user
+    user_login_failed.send(sender=__name__, credentials={'username': user.get_username()}, request=request)
+    return None
+
+
+def busy_response(request):
+    """503 login page for when the password hashing pool is saturated"""
+    return render(request, "login.html", {
+        'mode': 'login',
+        'login_form': LoginForm(),
+        'signup_form': SignupForm(),
+        'error': "Too many sign-in attempts right now. Please try again in a moment."
+    }, status=503)
+
+
+def shed_when_hashing_busy(view):
+    """Answer 503 instead of queueing more work when HashingBusy is raised"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except HashingBusy:
+            return busy_response(request)
+    return wrapper
 
 
+@ratelimit("login")
+@shed_when_hashing_busy
 def login_page(request):
     """Handle both login and signup on the same page"""
     
     # If user is already logged in, redirect to profile
     if request.user.is_authenticated:
-        profile = UserProfile.objects.filter(user=request.user).first()
+        profile = request.identity.profile
         if profile and profile.company_name and profile.company_size:
             return redirect("profile")
         else:
@@ -70,23 +117,25 @@ def login_page(request):
                 email = login_form.cleaned_data['email']
                 password = login_form.cleaned_data['password']
                 
-                # Check if email exists
-                try:
-                    user_obj = User.objects.get(email=email)
-                    
-                    # Check if email is verified
-                    try:
-                        otp_obj = UserOTP.objects.get(user=user_obj)
-                        if not otp_obj.is_verified:
-                            messages.error(request, "Please verify your email first.")
-                            error = "Please verify your email first."
-                            return redirect(reverse('verify_otp') + f'?email={email}')
-                    except UserOTP.DoesNotExist:
-                        # No OTP record means email is verified (old users)
-                        pass
-                    
-                    user = authenticate(request, username=user_obj.username, password=password)
-                    
+                # One joined query for user, OTP state, profile and credits;
+                # the same object is used for the password check, login and the profile redirect
+                user = (User.objects.select_related('otp', 'userprofile', 'credits')
+                        .filter(email=email).first())
+
+                if user is None:
+                    # Run the hasher anyway so unknown emails take as long as wrong passwords
+                    hash_password(password)
+                    error = "Invalid email or password."
+                else:
+                    # Check if email is verified (no OTP record means verified: old users)
+                    otp_obj = getattr(user, 'otp', None)
+                    if otp_obj is not None and not otp_obj.is_verified:
+                        messages.error(request, "Please verify your email first.")
+                        error = "Please verify your email first."
+                        return redirect(reverse('verify_otp') + f'?email={email}')
+
+                    user = authenticate_loaded_user(request, user, password)
+
                     if user is not None:
                         # Verify workspace email
                         if not is_workspace_email(email):
@@ -95,14 +144,13 @@ def login_page(request):
                         else:
                             login(request, user)
                             # Check if profile is complete
-                            profile = UserProfile.objects.filter(user=user).first()
-                            if not profile or not profile.company_name or not profile.company_size:
+                            profile = ensure_user_records(user)
+                            remember_profile_completion(user.pk, profile.is_complete)
+                            if not profile.is_complete:
                                 return redirect("complete_profile")
                             return redirect("profile")
                     else:
                         error = "Invalid email or password."
-                except User.DoesNotExist:
-                    error = "Invalid email or password."
             else:
                 error = "Please enter valid credentials."
                 
@@ -120,11 +168,11 @@ def login_page(request):
                     error = "This email is already registered."
                     mode = 'signup'
                 else:
-                    # Create user
-                    user = User.objects.create_user(
-                        username=email,
-                        email=email,
-                        password=signup_form.cleaned_data['password']
+                    # Create user (what create_user() does, with the password hashed in the pool)
+                    user = User.objects.create(
+                        username=User.normalize_username(email),
+                        email=User.objects.normalize_email(email),
+                        password=hash_password(signup_form.cleaned_data['password'])
                     )
 
                     # Create profile
@@ -137,17 +185,12 @@ def login_page(request):
                     # Create credits
                     UserCredits.objects.create(user=user, total_credits=10)
                     
-                    # Generate and send OTP
-                    otp_code = generate_otp()
-                    UserOTP.objects.create(user=user, otp_code=otp_code, is_verified=False)
-                    
-                    if send_otp_email(user, otp_code):
-                        messages.success(request, "OTP sent to your email. Please verify to continue.")
-                        return redirect(f"/verify-otp/?email={email}")
-                    else:
-                        messages.error(request, "Error sending OTP. Please try again.")
-                        user.delete()
-                        error = "Error sending OTP. Please try again."
+                    # Generate and queue OTP (the cache keeps a hash; the outbox clears the body once sent)
+                    UserOTP.objects.create(user=user, is_verified=False)
+                    send_otp_email(user, issue_otp(user.pk))
+
+                    messages.success(request, "OTP sent to your email. Please verify to continue.")
+                    return redirect(f"/verify-otp/?email={email}")
             else:
                 error = "Please fix the errors below."
                 mode = 'signup'
@@ -160,6 +203,7 @@ def login_page(request):
     })
 
 
+@ratelimit("verify_otp")
 def verify_otp(request):
     """Verify OTP and activate account"""
     email = request.GET.get('email')
@@ -186,15 +230,16 @@ def verify_otp(request):
         if form.is_valid():
             entered_otp = form.cleaned_data['otp']
             
-            if entered_otp == otp_obj.otp_code:
-                # OTP is correct, mark as verified
+            result = check_otp(user.pk, entered_otp)
+            if result == VERIFIED:
+                # OTP is correct (and now consumed), mark as verified
                 otp_obj.is_verified = True
-                otp_obj.save()
+                otp_obj.save(update_fields=['is_verified'])
                 
                 messages.success(request, "Email verified successfully! You can now login.")
                 return redirect("login")
             else:
-                error = "Invalid OTP. Please try again."
+                error = OTP_ERRORS[result]
         else:
             error = "Please enter a valid OTP."
     else:
@@ -207,6 +252,7 @@ def verify_otp(request):
     })
 
 
+@ratelimit("resend_otp")
 def resend_otp(request):
     """Resend OTP to user email"""
     email = request.GET.get('email')
@@ -221,17 +267,15 @@ def resend_otp(request):
         messages.error(request, "Invalid email.")
         return redirect("login")
     
-    # Generate new OTP
-    otp_code = generate_otp()
-    otp_obj.otp_code = otp_code
-    otp_obj.save()
+    if otp_obj.is_verified:
+        messages.info(request, "Email already verified. Please login.")
+        return redirect("login")
     
-    if send_otp_email(user, otp_code):
-        messages.success(request, "OTP resent to your email.")
-        return redirect(f"/verify-otp/?email={email}")
-    else:
-        messages.error(request, "Error resending OTP. Please try again.")
-        return redirect(f"/verify-otp/?email={email}")
+    # Generate new OTP; replaces the previous code in the cache, no DB write
+    send_otp_email(user, issue_otp(user.pk))
+
+    messages.success(request, "OTP resent to your email.")
+    return redirect(f"/verify-otp/?email={email}")
 
 
 @login_required(login_url="login")
@@ -245,11 +289,11 @@ def complete_profile(request):
         messages.error(request, "Only workspace emails are allowed.")
         return redirect("login")
     
-    # Get or create profile
-    profile, created = UserProfile.objects.get_or_create(user=user)
-    
-    # Create credits if doesn't exist
-    UserCredits.objects.get_or_create(user=user, defaults={'total_credits': 10})
+    # Profile and credits were loaded with the user; create them if they don't exist yet
+    identity = request.identity
+    profile = identity.profile
+    if profile is None or identity.credits is None:
+        profile = ensure_user_records(user)
 
     if request.method == "POST":
         company_name = request.POST.get("company_name", "").strip()
@@ -282,66 +326,22 @@ def profile(request):
         messages.error(request, "Only workspace emails are allowed.")
         return redirect("login")
     
-    try:
-        profile = UserProfile.objects.get(user=request.user)
-    except UserProfile.DoesNotExist:
+    # Profile and credits come with the user (request.identity), no further queries
+    identity = request.identity
+    profile = identity.profile
+    if profile is None:
         # If profile doesn't exist, redirect to complete it
         return redirect("complete_profile")
-    
-    # Get or create credits
-    credits, created = UserCredits.objects.get_or_create(user=request.user, defaults={'total_credits': 10})
-    
-    # Define available apps/solutions
-    apps = [
-        {
-            'name': 'Qlx',
-            'description': 'Quick learning experience platform for seamless knowledge acquisition',
-            'icon': '⚡',
-            'url': '/qlx/',
-            'color': '#FF6B6B'
-        },
-        {
-            'name': 'Vta',
-            'description': 'Virtual teaching assistant to help with learning and training',
-            'icon': '🎓',
-            'url': '/vta/',
-            'color': '#4ECDC4'
-        },
-        {
-            'name': 'Pulseiq',
-            'description': 'Real-time intelligence and analytics for data-driven decisions',
-            'icon': '📊',
-            'url': '/pulseiq/',
-            'color': '#45B7D1'
-        },
-        {
-            'name': 'Docmind',
-            'description': 'Intelligent document analysis and processing tool',
-            'icon': '📄',
-            'url': '/docmind/',
-            'color': '#96CEB4'
-        },
-        {
-            'name': 'Askx',
-            'description': 'Advanced AI-powered question answering system',
-            'icon': '💡',
-            'url': '/askx/',
-            'color': '#FFEAA7'
-        },
-        {
-            'name': 'ARL',
-            'description': 'Adaptive Resource Learning system for personalized education',
-            'icon': '🎯',
-            'url': '/arl/',
-            'color': '#DDA15E'
-        },
-    ]
+
+    credits = identity.credits
+    if credits is None:
+        credits, created = UserCredits.objects.get_or_create(user=request.user, defaults={'total_credits': 10})
     
     return render(request, "profile.html", {
         "user": request.user,
         "profile": profile,
         "credits": credits,
-        "apps": apps
+        "apps": visible_apps(request.user, profile)
     })
 
 
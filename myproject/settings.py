@@ -63,10 +63,15 @@ ACCOUNT_EMAIL_VERIFICATION = "none"
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+
+    # Sheds abusive login/OTP traffic before sessions or auth touch the DB
+    'accounts.ratelimit.RateLimitMiddleware',
+
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # AuthenticationMiddleware that loads user, profile and credits in one query (request.identity)
+    'accounts.identity.IdentityMiddleware',
 
     # REQUIRED BY ALLAUTH
     'allauth.account.middleware.AccountMiddleware',
@@ -80,6 +85,9 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'myproject.urls'
 
+# Serve the login/OTP/profile flow from accounts.async_views (native async; use under ASGI/uvicorn)
+ACCOUNTS_ASYNC_VIEWS = False
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -109,6 +117,73 @@ EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = os.environ.get("EMAIL_HOST_USER")
 
+# Email outbox: views only enqueue, a background dispatcher delivers (accounts/outbox.py)
+EMAIL_OUTBOX_FROM_EMAIL = 'noreply@dashboard.com'
+EMAIL_OUTBOX_DISPATCH = 'thread'      # 'thread' = each server process runs a dispatcher (others start one on their first queued email);
+                                      # 'command' = only `manage.py run_outbox` delivers (polls every POLL_SECONDS)
+EMAIL_OUTBOX_WORKERS = 4              # max concurrent SMTP sends per process (= pooled connections)
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_POLL_SECONDS = 5
+EMAIL_OUTBOX_MAX_ATTEMPTS = 8         # an expired send lease (sender crashed mid-send) counts as an attempt
+EMAIL_OUTBOX_RETRY_BASE_SECONDS = 5   # backoff: base * 2**(attempt-1), capped
+EMAIL_OUTBOX_RETRY_MAX_SECONDS = 15 * 60
+EMAIL_OUTBOX_RETENTION_SECONDS = 7 * 24 * 60 * 60  # sent/failed rows (bodies already cleared) are then deleted
+EMAIL_OUTBOX_PURGE_INTERVAL_SECONDS = 60 * 60
+EMAIL_SMTP_POOL_MAX_IDLE_SECONDS = 30  # probe idle pooled connections with NOOP after this
+
+# Email OTPs live hashed in the cache (accounts/otp.py); use a shared cache (Redis/Memcached) with >1 worker.
+# A system check (accounts/checks.py) fails if this is process-local and WEB_CONCURRENCY is above 1
+OTP_CACHE = 'default'
+OTP_TTL_SECONDS = 10 * 60
+OTP_MAX_ATTEMPTS = 5                  # wrong codes before the OTP is dropped and must be resent
+
+# Sliding-window rate limits per client IP and per email (accounts/ratelimit.py); keys are the rule names
+# views declare with @ratelimit(...), so every URL routed to a view shares its limit
+RATELIMIT_ENABLED = True
+RATELIMIT_BACKEND = 'local'           # 'local' = per worker process, 'cache' = shared via RATELIMIT_CACHE
+RATELIMIT_CACHE = 'default'
+RATELIMIT_IP_HEADER = None            # e.g. 'HTTP_X_FORWARDED_FOR', only behind a trusted proxy. Unset behind a proxy,
+                                      # all clients share its IP limits (warned about on the first proxied request)
+RATELIMIT_RULES = {
+    'login': {'methods': ['POST'], 'ip': '60/m', 'email': '10/m'},
+    'verify_otp': {'ip': '60/m', 'email': '10/m'},
+    'resend_otp': {'ip': '20/m', 'email': '3/m'},
+}
+
+# Personal/disposable email domains refused at signup and login (accounts/domains.py); edits are picked up live
+BLOCKED_EMAIL_DOMAINS_FILE = BASE_DIR / 'accounts' / 'data' / 'blocked_email_domains.txt'
+EMAIL_DOMAIN_POLICY_CHECK_SECONDS = 5      # how often the file is stat()ed for changes
+
+# Default lifetime of a credit reservation (accounts/credits.py)
+CREDIT_HOLD_TTL_SECONDS = 15 * 60
+
+# Write-behind usage metering (accounts/metering.py)
+CREDIT_METER_FLUSH_INTERVAL_SECONDS = 5
+CREDIT_METER_MAX_STALENESS_SECONDS = 30    # flush early once a delta is this old
+CREDIT_METER_MAX_PENDING_USERS = 1000      # ...or this many users have pending deltas
+CREDIT_METER_FLUSH_CHUNK_SIZE = 500        # users per UPDATE statement
+
+# In-app hourly DB backups (accounts/backup.py, accounts/incremental.py)
+BACKUP_RETENTION = {'hourly': 24, 'daily': 14, 'weekly': 8}  # GFS tiers; an int keeps the newest N backups
+BACKUP_MODE = 'full'                # 'full' compressed archives or 'incremental' chunk store + manifests
+BACKUP_CHUNK_PAGES = 16             # incremental: DB pages per content-addressed chunk
+BACKUP_CODEC = 'gzip'               # 'gzip', 'lzma' or 'zstd' (needs the zstandard package)
+BACKUP_COMPRESSION_LEVEL = None     # codec default
+BACKUP_COMPRESSION_THREADS = 0      # zstd only; -1 = all cores
+BACKUP_PAGES_PER_STEP = 256         # 0 = copy in one step holding the read lock throughout
+BACKUP_STEP_SLEEP_SECONDS = 0.05    # pause between steps, lock released
+BACKUP_MAX_BYTES_PER_SEC = 20 * 1024 * 1024
+BACKUP_LEADER_POLL_SECONDS = 60     # how often non-leader workers retry the scheduler lock (failover time)
+
+# Continuous WAL shipping (SQLite only): committed WAL frames are copied to the replica every few seconds
+BACKUP_WAL_SHIPPING = False
+BACKUP_WAL_REPLICA_DIR = BASE_DIR / 'db_replica'
+BACKUP_WAL_SYNC_SECONDS = 2
+BACKUP_WAL_SNAPSHOT_SECONDS = 60 * 60            # full snapshot cadence; older segments get compacted
+BACKUP_WAL_CHECKPOINT_BYTES = 4 * 1024 * 1024    # checkpoint once the WAL grows past this
+BACKUP_WAL_AUTOCHECKPOINT_BYTES = 64 * 1024 * 1024  # backstop for connections when no shipper checkpoints; keep well above
+BACKUP_WAL_RETENTION_SECONDS = 7 * 24 * 60 * 60  # restorable window
+
 DATABASES = {
     "default": dj_database_url.config(
         default=os.environ.get("DATABASE_URL"),
@@ -116,6 +191,30 @@ DATABASES = {
         ssl_require=True
     )
 }
+# Local stand-ins; point 'accounts' at a shared Redis/Memcached when running more than one worker
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'accounts': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'accounts',
+                 'OPTIONS': {'MAX_ENTRIES': 100000}},
+}
+
+# Two-tier cache of profile/credits/OTP rows (accounts/account_cache.py): per-process L1 in front of CACHES[alias]
+ACCOUNT_CACHE_ENABLED = True
+ACCOUNT_CACHE_ALIAS = 'accounts'
+ACCOUNT_CACHE_L1_SIZE = 10000             # users per process; 0 = L2 only
+ACCOUNT_CACHE_L1_TTL_SECONDS = 5          # bounds how stale another worker's L1 copy can be
+ACCOUNT_CACHE_TTL_SECONDS = 5 * 60
+
+# Apps on the profile page (accounts/catalog.py); None = the built-in six. Entries are dicts with slug, name,
+# description, icon, url, color and optionally public=False (then only users/companies with an AppEntitlement)
+ACCOUNTS_APP_CATALOG = None
+
+# Password hashing runs in a process pool (accounts/hashing.py); None = min(CPUs, 2), 0 = hash inline.
+# The pool is per web worker: the host runs web workers x this many hashing processes
+PASSWORD_HASHING_WORKERS = None
+PASSWORD_HASHING_MAX_PENDING = None     # queued + running hashes per process before shedding (default 4 x workers)
+PASSWORD_HASHING_QUEUE_TIMEOUT = 5      # seconds a login waits for a slot before a 503
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
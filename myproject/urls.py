@@ -1,19 +1,23 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
-from accounts import views
+from accounts import async_views, views
+
+# Native async views for ASGI deployments (see accounts/async_views.py)
+flow = async_views if getattr(settings, "ACCOUNTS_ASYNC_VIEWS", False) else views
 
 urlpatterns = [
     # Include allauth URLs for Google OAuth
     path("accounts/", include("allauth.urls")),
     
-    path("login/", views.login_page, name="login"),
+    path("login/", flow.login_page, name="login"),
     path("signup/", views.signup, name="signup"),
-    path("verify-otp/", views.verify_otp, name="verify_otp"),
-    path("resend-otp/", views.resend_otp, name="resend_otp"),
-    path("complete-profile/", views.complete_profile, name="complete_profile"),
-    path("profile/", views.profile, name="profile"),
+    path("verify-otp/", flow.verify_otp, name="verify_otp"),
+    path("resend-otp/", flow.resend_otp, name="resend_otp"),
+    path("complete-profile/", flow.complete_profile, name="complete_profile"),
+    path("profile/", flow.profile, name="profile"),
     path("logout/", views.logout_user, name="logout"),
 
     path("admin/", admin.site.urls),
-    path("", views.login_page, name="home"),
+    path("", flow.login_page, name="home"),
 ]
\ No newline at end of file